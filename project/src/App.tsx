@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
-import { processImage, getScreenshots } from './services/api';
-import { ExtractedInfo, Screenshot } from './types';
+import { processImage, getScreenshots, getFullImageUrl } from './services/api';
+import { ExtractedInfo, JobEvent, Screenshot, StoredDocumentEvent } from './types';
 import ImageUploader from './components/ImageUploader';
 import ProcessButton from './components/ProcessButton';
 import LoadingSpinner from './components/LoadingSpinner';
@@ -18,7 +18,21 @@ function App() {
   const [screenshots, setScreenshots] = useState<Screenshot[]>([]);
   const [recordId, setRecordId] = useState<number | null>(null);
   const [error, setError] = useState<string | null>(null);
-  const [pollingInterval, setPollingInterval] = useState<number | null>(null);
+
+  // Render results as the job reports them instead of waiting for it to finish
+  const handleJobEvent = (event: JobEvent) => {
+    if (event.event === 'extracted') {
+      setExtractedInfo(event.data.extracted_info as ExtractedInfo);
+    } else if (event.event === 'document_stored') {
+      const document = event.data as unknown as StoredDocumentEvent;
+      const url = getFullImageUrl(document.url);
+      setScreenshots((current) =>
+        current.some((screenshot) => screenshot.url === url)
+          ? current
+          : [...current, { name: document.name, url }]
+      );
+    }
+  };
 
   // Handle image processing
   const handleProcessImage = async () => {
@@ -26,9 +40,11 @@ function App() {
     
     setIsProcessing(true);
     setError(null);
+    setExtractedInfo(null);
+    setScreenshots([]);
     
     try {
-      const response = await processImage(selectedImage);
+      const response = await processImage(selectedImage, handleJobEvent);
       
       if (response.success) {
         setExtractedInfo(response.extracted_info);
@@ -45,34 +61,14 @@ function App() {
     }
   };
 
-  // Set up screenshot polling
+  // Screenshots arrive through the job's event stream; fetch the full list once it has finished
   useEffect(() => {
     if (recordId) {
-      // Initial fetch
       fetchScreenshots();
-      
-      // Set up polling every 5 seconds
-      const interval = window.setInterval(fetchScreenshots, 5000);
-      setPollingInterval(interval);
-      
-      return () => {
-        if (pollingInterval) {
-          clearInterval(pollingInterval);
-        }
-      };
     }
   // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [recordId]);
 
-  // Clean up polling when component unmounts
-  useEffect(() => {
-    return () => {
-      if (pollingInterval) {
-        clearInterval(pollingInterval);
-      }
-    };
-  }, [pollingInterval]);
-
   // Fetch screenshots from API
   const fetchScreenshots = async () => {
     if (!recordId) return;
@@ -128,12 +124,12 @@ function App() {
             </>
           )}
           
-          {extractedInfo && !isProcessing && (
+          {extractedInfo && (
             <ExtractedInfoCard data={extractedInfo} />
           )}
         </motion.div>
         
-        {screenshots.length > 0 && !isProcessing && (
+        {screenshots.length > 0 && (
           <ScreenshotGallery screenshots={screenshots} />
         )}
       </div>
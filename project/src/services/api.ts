@@ -1,29 +1,110 @@
 import axios from "axios";
-import { ProcessImageResponse, GetScreenshotsResponse } from "../types";
+import {
+  ProcessImageResponse,
+  GetScreenshotsResponse,
+  EnqueueJobResponse,
+  JobEvent,
+  JobStatusResponse,
+} from "../types";
+
+const API_BASE_URL = "http://localhost:8000/api"; // Django backend URL
 
 const api = axios.create({
-  baseURL: "http://localhost:8000/api", // Django backend URL
+  baseURL: API_BASE_URL,
 });
 
 // Helper function to get full image URL
-const getFullImageUrl = (url: string) => {
+export const getFullImageUrl = (url: string) => {
   if (url.startsWith("http")) return url;
   return `http://localhost:8000${url.startsWith("/") ? url : `/${url}`}`;
 };
 
+const JOB_POLL_INTERVAL_MS = 2000;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+export type JobEventHandler = (event: JobEvent) => void;
+
+// Poll a queued job until a worker has finished it
+const pollJob = async (
+  jobId: number,
+  onEvent?: JobEventHandler,
+  afterEventId = 0
+): Promise<JobStatusResponse> => {
+  let lastEventId = afterEventId;
+  for (;;) {
+    const response = await api.get<JobStatusResponse>(`/jobs/${jobId}/`, {
+      params: lastEventId ? { after: lastEventId } : {},
+    });
+    const { events } = response.data;
+    events.forEach((event) => onEvent?.(event));
+    if (events.length > 0) {
+      lastEventId = events[events.length - 1].id;
+    }
+    if (response.data.status === "succeeded" || response.data.status === "failed") {
+      return response.data;
+    }
+    await sleep(JOB_POLL_INTERVAL_MS);
+  }
+};
+
+// Follow a job's progress stream until it ends, falling back to polling
+// if the browser or a proxy can't hold the event stream open
+const waitForJob = (
+  jobId: number,
+  onEvent?: JobEventHandler
+): Promise<JobStatusResponse> => {
+  if (typeof EventSource === "undefined") {
+    return pollJob(jobId, onEvent);
+  }
+  return new Promise((resolve, reject) => {
+    let lastEventId = 0;
+    const source = new EventSource(`${API_BASE_URL}/jobs/${jobId}/events/`);
+    const finish = () => {
+      source.close();
+      api
+        .get<JobStatusResponse>(`/jobs/${jobId}/`, { params: { after: lastEventId || undefined } })
+        .then((response) => resolve(response.data), reject);
+    };
+    source.onmessage = (message) => {
+      const event: JobEvent = JSON.parse(message.data);
+      lastEventId = event.id;
+      onEvent?.(event);
+    };
+    source.addEventListener("end", finish);
+    source.onerror = () => {
+      // EventSource reconnects on its own while the server allows it
+      if (source.readyState === EventSource.CLOSED) {
+        pollJob(jobId, onEvent, lastEventId).then(resolve, reject);
+      }
+    };
+  });
+};
+
 export const processImage = async (
-  file: File
+  file: File,
+  onEvent?: JobEventHandler
 ): Promise<ProcessImageResponse> => {
   const formData = new FormData();
   formData.append("image", file);
 
   try {
-    const response = await api.post("/process-image/", formData, {
+    const queued = await api.post<EnqueueJobResponse>("/process-image/", formData, {
       headers: {
         "Content-Type": "multipart/form-data",
       },
     });
 
+    const job = await waitForJob(queued.data.job_id, onEvent);
+    if (job.status === "failed") {
+      return {
+        success: false,
+        message: job.error || "Failed to process image",
+      } as ProcessImageResponse;
+    }
+
+    const response = await api.get(`/jobs/${job.job_id}/result/`);
+
     // Ensure all image URLs are absolute
     if (response.data.screenshots) {
       response.data.screenshots = response.data.screenshots.map(
@@ -45,19 +126,28 @@ export const getScreenshots = async (
   recordId: number
 ): Promise<GetScreenshotsResponse> => {
   try {
-    const response = await api.get(`/screenshots/${recordId}/`);
+    // Follow the cursor through every page; unchanged pages come back as cheap 304s
+    const screenshots: any[] = [];
+    let cursor: string | null | undefined = undefined;
+    let data: GetScreenshotsResponse;
+    do {
+      const response = await api.get(`/screenshots/${recordId}/`, {
+        params: cursor ? { cursor } : undefined,
+      });
+      data = response.data;
+      screenshots.push(...(data.screenshots || []));
+      cursor = data.next_cursor;
+    } while (cursor);
 
     // Ensure all image URLs are absolute
-    if (response.data.screenshots) {
-      response.data.screenshots = response.data.screenshots.map(
-        (screenshot: any) => ({
-          ...screenshot,
-          url: getFullImageUrl(screenshot.url),
-        })
-      );
-    }
-
-    return response.data;
+    return {
+      ...data,
+      screenshots: screenshots.map((screenshot: any) => ({
+        ...screenshot,
+        url: getFullImageUrl(screenshot.url),
+      })),
+      next_cursor: null,
+    };
   } catch (error) {
     console.error("Error fetching screenshots:", error);
     throw error;
@@ -25,4 +25,46 @@ export interface ProcessImageResponse {
 export interface GetScreenshotsResponse {
   success: boolean;
   screenshots: Screenshot[];
-}
\ No newline at end of file
+  next_cursor?: string | null;
+}
+
+export interface EnqueueJobResponse {
+  success: boolean;
+  message: string;
+  job_id: number;
+  status: JobStatus;
+  status_url: string;
+  result_url: string;
+}
+
+export type JobStatus = 'queued' | 'running' | 'succeeded' | 'failed';
+
+export interface JobEvent {
+  id: number;
+  event: string;
+  data: Record<string, unknown>;
+  created_at: string;
+}
+
+// data of a `document_stored` job event
+export interface StoredDocumentEvent {
+  document_id: number;
+  period_text: string;
+  year_text: string;
+  name: string;
+  url: string;
+  download_url: string;
+  cached: boolean;
+}
+
+export interface JobStatusResponse {
+  success: boolean;
+  job_id: number;
+  status: JobStatus;
+  attempts: number;
+  error: string | null;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+  events: JobEvent[];
+}
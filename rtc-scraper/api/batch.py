@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import traceback
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from itertools import islice
+from django.conf import settings
+from image_processor import ImageProcessor
+from scraper import RTCScraper
+from async_runtime import get_loop
+from .jobs import build_property_data
+from .models import make_property_key
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.tif', '.tiff', '.bmp')
+
+
+def is_image_name(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def extract_zip(zip_source, target_dir):
+    """Extract the image members of a zip archive into target_dir and return their paths."""
+    paths = []
+    with zipfile.ZipFile(zip_source) as archive:
+        for index, member in enumerate(archive.infolist()):
+            if member.is_dir() or not is_image_name(member.filename):
+                continue
+            # Flatten the archive layout; never trust member paths (zip slip)
+            name = f"{index:05d}_{os.path.basename(member.filename)}"
+            path = os.path.join(target_dir, name)
+            with archive.open(member) as source, open(path, 'wb') as destination:
+                shutil.copyfileobj(source, destination)
+            paths.append(path)
+    return paths
+
+
+def iter_batch_results(paths, concurrency=None, force_refresh=False):
+    """
+    Process many images and yield one result dict per event as soon as it happens.
+
+    Vision extractions and scrapes run on the shared background loop with at
+    most `concurrency` of them in flight together, so a large batch queues
+    here instead of on the browser pool. Each distinct property is scraped
+    once, as soon as the first image resolving to it has been extracted;
+    later images for the same property are reported as duplicates and share
+    its scrape result.
+    """
+    concurrency = concurrency or settings.BATCH_EXTRACTION_CONCURRENCY
+    processor = ImageProcessor()
+    scraper = RTCScraper()
+    loop = get_loop()
+
+    pending = {}
+    scrapes = {}
+    summary = {'images': len(paths), 'extracted': 0, 'failed': 0, 'duplicates': 0, 'properties': 0, 'scraped': 0}
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def extract(path):
+        async with in_flight:
+            return await processor.extract_info_from_image_async(path)
+
+    async def run_scrape(property_data):
+        async with in_flight:
+            return await scraper.scrape_documents(property_data, force_refresh=force_refresh)
+
+    queued = iter(paths)
+
+    def submit_extractions():
+        # Only keep a window of extractions submitted, so scrapes don't queue behind the whole batch
+        extracting = sum(1 for kind, _ in pending.values() if kind == 'extract')
+        for path in islice(queued, max(0, concurrency - extracting)):
+            pending[asyncio.run_coroutine_threadsafe(extract(path), loop)] = ('extract', path)
+
+    try:
+        submit_extractions()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, item = pending.pop(future)
+                submit_extractions()
+                if kind == 'extract':
+                    name = os.path.basename(item)
+                    try:
+                        extracted_info = future.result()
+                    except Exception as e:
+                        logger.error(f"Extraction failed for {name}: {str(e)}")
+                        extracted_info = None
+                    if not extracted_info:
+                        summary['failed'] += 1
+                        yield {'type': 'extraction_failed', 'file': name}
+                        continue
+
+                    summary['extracted'] += 1
+                    property_data = build_property_data(extracted_info)
+                    identity = make_property_key(property_data)
+                    yield {'type': 'extracted', 'file': name, 'extracted_info': extracted_info}
+
+                    if 'na' in (property_data['survey_number'].lower(), property_data['hissa'].lower()):
+                        yield {'type': 'skipped', 'file': name, 'reason': 'Survey number or hissa could not be read'}
+                        continue
+                    if identity in scrapes:
+                        summary['duplicates'] += 1
+                        scrapes[identity].append(name)
+                        yield {'type': 'duplicate', 'file': name, 'duplicate_of': scrapes[identity][0]}
+                        continue
+
+                    summary['properties'] += 1
+                    scrapes[identity] = [name]
+                    pending[asyncio.run_coroutine_threadsafe(run_scrape(property_data), loop)] = ('scrape', identity)
+                else:
+                    files = scrapes[item]
+                    try:
+                        scrape = future.result()
+                    except Exception as e:
+                        logger.error(f"Scrape failed for {files[0]}: {str(e)}")
+                        logger.error(f"Traceback: {traceback.format_exc()}")
+                        scrape = None
+                    if scrape is None:
+                        yield {'type': 'scrape_failed', 'files': files}
+                        continue
+                    summary['scraped'] += 1
+                    documents = scrape['documents']
+                    yield {
+                        'type': 'scraped',
+                        'files': files,
+                        'record_id': scrape['record_id'],
+                        'documents_count': len(documents),
+                        'documents': documents,
+                        'screenshots': [
+                            {
+                                'name': os.path.basename(doc['screenshot_path']),
+                                'url': doc['screenshot_url']
+                            }
+                            for doc in documents if doc.get('screenshot_path')
+                        ],
+                    }
+
+    finally:
+        # The client went away; don't leave extractions and scrapes running for nobody
+        for future in pending:
+            future.cancel()
+
+    yield {'type': 'done', **summary}
+
+
+def make_batch_dir():
+    """Private scratch directory for one batch's images; the caller removes it."""
+    return tempfile.mkdtemp(prefix='rtc-batch-')
@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import traceback
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from image_processor import ImageProcessor
+from scraper import RTCScraper
+from async_runtime import run_coroutine
+from metrics import get_metrics, span
+from .models import RTCData, ScrapeJob, ScrapeJobEvent, make_property_key
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_image(file_path, force_refresh=False):
+    """Queue an uploaded image for extraction and scraping. Returns the ScrapeJob."""
+    job = ScrapeJob.objects.create(image_path=file_path, force_refresh=force_refresh)
+    record_event(job, 'queued')
+    logger.info(f"Queued job {job.id} for {file_path}")
+    return job
+
+
+def record_event(job, event, **data):
+    """Append a progress event to a job's timeline."""
+    return ScrapeJobEvent.objects.create(job=job, event=event, data=data)
+
+
+def claim_next_job(worker_name):
+    """
+    Atomically move the oldest queued job to running and return it, or None.
+
+    The claim is a conditional UPDATE on the status column, so it is safe with
+    any number of worker processes on both PostgreSQL and SQLite.
+    """
+    while True:
+        job_id = ScrapeJob.objects.filter(
+            status=ScrapeJob.STATUS_QUEUED
+        ).order_by('created_at').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        claimed = ScrapeJob.objects.filter(id=job_id, status=ScrapeJob.STATUS_QUEUED).update(
+            status=ScrapeJob.STATUS_RUNNING,
+            worker=worker_name,
+            attempts=F('attempts') + 1,
+            started_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            return ScrapeJob.objects.get(id=job_id)
+        # Another worker won the race for this job; try the next one
+
+
+def requeue_stale_jobs(max_age=None):
+    """
+    Put running jobs whose worker stopped updating them back on the queue,
+    or fail them once they have used up SCRAPE_JOB_MAX_ATTEMPTS.
+    """
+    max_age = max_age or settings.SCRAPE_JOB_STALE_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    stale = ScrapeJob.objects.filter(status=ScrapeJob.STATUS_RUNNING, updated_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=settings.SCRAPE_JOB_MAX_ATTEMPTS).update(
+        status=ScrapeJob.STATUS_FAILED,
+        error='Worker stopped responding',
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    count = stale.update(status=ScrapeJob.STATUS_QUEUED, worker='', updated_at=timezone.now())
+    if count or failed:
+        logger.warning(f"Requeued {count} stale jobs, failed {failed}")
+    return count
+
+
+def build_property_data(extracted_info):
+    """Format the extracted information as the property_data RTCScraper expects."""
+    return {
+        'survey_number': str(extracted_info.get('Survey Number', '')),
+        'surnoc': str(extracted_info.get('Surnoc', '')),
+        'hissa': str(extracted_info.get('Hissa', '')),
+        'village': str(extracted_info.get('Village', '')),
+        'hobli': str(extracted_info.get('Hobli', '')),
+        'taluk': str(extracted_info.get('Taluk', '')),
+        'district': str(extracted_info.get('District', ''))
+    }
+
+
+def process_image_file(file_path, progress=None, force_refresh=False):
+    """
+    Extract property details from an image and scrape its RTC documents.
+    Returns the response payload that used to be built inline by the view.
+    `force_refresh` bypasses the scrape cache.
+    """
+    progress = progress or (lambda event, **data: None)
+
+    processor = ImageProcessor()
+    extracted_info = processor.extract_info_from_image(file_path)
+    if not extracted_info:
+        raise ValueError('Failed to extract information from image')
+    progress('extracted', extracted_info=extracted_info)
+
+    property_data = build_property_data(extracted_info)
+
+    # Run the scraper on the shared loop that owns the browser pool
+    progress('scraping')
+    scraper = RTCScraper()
+    scrape = run_coroutine(scraper.scrape_documents(property_data, force_refresh=force_refresh, progress=progress))
+    scraping_result = scrape['documents'] if scrape else None
+    progress('scraped', documents_count=len(scraping_result) if scraping_result else 0)
+
+    # The scrape reports its record; after a failed scrape, fall back to what is stored
+    if scrape:
+        rtc_data = RTCData.objects.filter(id=scrape['record_id']).first()
+    else:
+        rtc_data = RTCData.objects.filter(property_key=make_property_key(property_data)).first()
+
+    screenshots = []
+    if rtc_data:
+        for doc in rtc_data.documents.all():
+            if doc.screenshot_path:
+                screenshots.append({
+                    'name': os.path.basename(doc.screenshot_path),
+                    'url': doc.screenshot_url
+                })
+
+    return {
+        'success': True,
+        'message': 'Image processed and documents scraped successfully',
+        'extracted_info': extracted_info,
+        'scraping_result': scraping_result,
+        'screenshots': screenshots,
+        'record_id': rtc_data.id if rtc_data else None
+    }
+
+
+def run_job(job):
+    """Run a claimed job to completion and record its result or error."""
+    def progress(event, **data):
+        record_event(job, event, **data)
+        # Touch the job so requeue_stale_jobs knows the worker is alive
+        ScrapeJob.objects.filter(id=job.id).update(updated_at=timezone.now())
+
+    progress('started', worker=job.worker, attempt=job.attempts)
+    try:
+        with span('job', job_id=job.id, attempt=job.attempts):
+            result = process_image_file(job.image_path, progress=progress, force_refresh=job.force_refresh)
+        job.status = ScrapeJob.STATUS_SUCCEEDED
+        job.result = result
+        progress('succeeded', record_id=result['record_id'])
+    except Exception as e:
+        logger.error(f"Job {job.id} failed: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        job.status = ScrapeJob.STATUS_FAILED
+        job.error = str(e)
+        progress('failed', error=str(e))
+    finally:
+        get_metrics().counter('rtc_jobs_total', 'Finished jobs by status', ['status']).inc(status=job.status)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'result', 'error', 'finished_at', 'updated_at'])
+        # Clean up the uploaded file
+        try:
+            if os.path.exists(job.image_path):
+                os.remove(job.image_path)
+        except Exception as e:
+            logger.error(f"Error cleaning up temporary file: {str(e)}")
+    return job
+
+
+def serialize_event(event):
+    return {
+        'id': event.id,
+        'event': event.event,
+        'data': event.data,
+        'created_at': event.created_at.isoformat(),
+    }
+
+
+def serialize_job(job, after_event=None):
+    """Status payload for a job, including progress events newer than `after_event`."""
+    events = job.events.all()
+    if after_event:
+        events = events.filter(id__gt=after_event)
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'attempts': job.attempts,
+        'error': job.error or None,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'events': [serialize_event(event) for event in events],
+    }
+
+
+def format_sse(data, event=None, event_id=None):
+    """One Server-Sent Events message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def poll_job_events(job_id, last_id):
+    """
+    The job's status and its events newer than `last_id`, as SSE frames.
+    Returns (frames, finished); once the job has finished the last frame is
+    an `end` event holding its status.
+    """
+    # Status first: a job's events are all recorded before it is marked finished
+    status = ScrapeJob.objects.filter(id=job_id).values_list('status', flat=True).first()
+    events = list(ScrapeJobEvent.objects.filter(job_id=job_id, id__gt=last_id).order_by('id'))
+    frames = [(event.id, format_sse(serialize_event(event), event_id=event.id)) for event in events]
+    finished = status is None or status in (ScrapeJob.STATUS_SUCCEEDED, ScrapeJob.STATUS_FAILED)
+    if finished:
+        frames.append((None, format_sse({'status': status}, event='end')))
+    return frames, finished
+
+
+class JobEventStream:
+    """
+    The state of one job's event stream: the cursor into its events, the idle
+    time towards the next heartbeat, and whether the job has finished. The
+    generators below only add how they wait and reach the database.
+    """
+
+    def __init__(self, job_id, after_event=None, poll_interval=None, heartbeat=None):
+        self.job_id = job_id
+        self.poll_interval = poll_interval or settings.SCRAPE_EVENTS_POLL_INTERVAL
+        self.heartbeat = heartbeat or settings.SCRAPE_EVENTS_HEARTBEAT
+        self.last_id = after_event or 0
+        self.finished = False
+        self._idle = 0.0
+
+    def retry(self):
+        """The opening frame, telling clients how long to wait before reconnecting."""
+        return f"retry: {int(self.poll_interval * 4000)}\n\n"
+
+    def poll(self):
+        """
+        SSE frames for the events recorded since the last poll, a keep-alive
+        comment when the stream has been idle for `heartbeat` seconds, or the
+        `end` event once the job has finished. Queries the database.
+        """
+        frames, self.finished = poll_job_events(self.job_id, self.last_id)
+        chunks = []
+        for event_id, frame in frames:
+            self.last_id = event_id or self.last_id
+            chunks.append(frame)
+        if not self.finished:
+            self._idle = 0.0 if frames else self._idle + self.poll_interval
+            if self._idle >= self.heartbeat:
+                chunks.append(": keep-alive\n\n")
+                self._idle = 0.0
+        return chunks
+
+
+async def iter_job_events(job_id, after_event=None, poll_interval=None, heartbeat=None):
+    """
+    Stream a job's progress events as Server-Sent Events: each event newer than
+    `after_event` as soon as a worker records it, then an `end` event once the
+    job has finished. Events are tailed from the database, so workers in other
+    processes are seen too. Comment lines keep idle connections open.
+    """
+    stream = JobEventStream(job_id, after_event, poll_interval, heartbeat)
+    yield stream.retry()
+    while True:
+        for chunk in await sync_to_async(stream.poll)():
+            yield chunk
+        if stream.finished:
+            return
+        await asyncio.sleep(stream.poll_interval)
+
+
+def iter_job_events_sync(job_id, after_event=None, poll_interval=None, heartbeat=None):
+    """
+    `iter_job_events` for WSGI servers, which buffer an async stream until it
+    ends. Holds one server thread for as long as the client is connected.
+    """
+    stream = JobEventStream(job_id, after_event, poll_interval, heartbeat)
+    yield stream.retry()
+    while True:
+        yield from stream.poll()
+        if stream.finished:
+            return
+        time.sleep(stream.poll_interval)
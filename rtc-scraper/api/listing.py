@@ -0,0 +1,91 @@
+import base64
+import hashlib
+import json
+import os
+from django.core.cache import cache
+from django.urls import reverse
+from .models import RTCDocument
+
+DEFAULT_FIELDS = ('name', 'url', 'download_url')
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 500
+# Entries for superseded versions are never read again; let them expire
+LISTING_CACHE_TIMEOUT = 3600
+
+# Selectable fields: the RTCDocument columns each one needs, and how to render it
+SCREENSHOT_FIELDS = {
+    'id': (('id',), lambda doc: doc.id),
+    'name': (('screenshot_path',), lambda doc: os.path.basename(doc.screenshot_path)),
+    'url': (('screenshot_path',), lambda doc: doc.screenshot_url),
+    'download_url': ((), lambda doc: reverse('document_screenshot', args=[doc.id])),
+    'period': (('period',), lambda doc: doc.period),
+    'period_text': (('period_text',), lambda doc: doc.period_text),
+    'year': (('year',), lambda doc: doc.year),
+    'year_text': (('year_text',), lambda doc: doc.year_text),
+    'capture_mode': (('capture_mode',), lambda doc: doc.capture_mode),
+    'capture_ms': (('capture_ms',), lambda doc: doc.capture_ms),
+    'screenshot_bytes': (('screenshot_bytes',), lambda doc: doc.screenshot_bytes),
+    'created_at': (('created_at',), lambda doc: doc.created_at.isoformat()),
+}
+
+
+def encode_cursor(document_id):
+    return base64.urlsafe_b64encode(json.dumps({'after': document_id}).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """The document id a cursor continues after; raises ValueError for a malformed cursor."""
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))['after'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def parse_fields(value):
+    """Requested field names in order; raises ValueError for unknown ones."""
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in SCREENSHOT_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(SCREENSHOT_FIELDS)}")
+    return fields
+
+
+def listing_etag(record_id, version, cursor, limit, fields):
+    """Changes whenever the record's documents do or the request asks for a different view."""
+    view = hashlib.sha1(f'{cursor}|{limit}|{",".join(fields)}'.encode()).hexdigest()[:12]
+    return f'"{record_id}-{version}-{view}"'
+
+
+def screenshot_page(record_id, version, cursor, limit, fields):
+    """
+    One page of a record's screenshots as rendered JSON bytes. Pages are cached
+    under the record's documents_version, so any write makes old entries unreachable.
+    """
+    key = f'screenshots:{record_id}:{version}:{cursor}:{limit}:{",".join(fields)}'
+    body = cache.get(key)
+    if body is not None:
+        return body
+
+    columns = {'id', 'screenshot_path'}
+    for field in fields:
+        columns.update(SCREENSHOT_FIELDS[field][0])
+    documents = list(
+        RTCDocument.objects.filter(rtc_data_id=record_id, id__gt=decode_cursor(cursor))
+        .exclude(screenshot_path='')
+        .only(*columns)
+        .order_by('id')[:limit + 1]
+    )
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    body = json.dumps({
+        'success': True,
+        'screenshots': [{field: SCREENSHOT_FIELDS[field][1](doc) for field in fields} for doc in documents],
+        'next_cursor': encode_cursor(documents[-1].id) if has_more else None,
+    }).encode()
+    cache.set(key, body, timeout=LISTING_CACHE_TIMEOUT)
+    return body
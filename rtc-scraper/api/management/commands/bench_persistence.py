@@ -0,0 +1,66 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.models import RTCData, RTCDocument
+from persistence import persist_scrape
+
+
+class Command(BaseCommand):
+    help = 'Compare per-row and bulk document persistence throughput (benchmark rows are deleted afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--properties', type=int, default=50, help='Properties to persist per mode')
+        parser.add_argument('--documents', type=int, default=9, help='Documents per property')
+
+    def handle(self, *args, **options):
+        properties, documents = options['properties'], options['documents']
+        results = {}
+        for mode in ('per_row', 'bulk', 'bulk_retry'):
+            elapsed = self.run(mode, properties, documents)
+            results[mode] = elapsed
+            rate = properties * documents / elapsed if elapsed else 0.0
+            self.stdout.write(f"{mode:>10}: {elapsed:.3f}s, {rate:,.0f} docs/s")
+        self.stdout.write(self.style.SUCCESS(f"Bulk speedup: {results['per_row'] / results['bulk']:.1f}x"))
+
+    def property_data(self, index):
+        return {
+            'survey_number': str(index), 'surnoc': '*', 'hissa': '1', 'village': 'Benchmark',
+            'hobli': 'Benchmark', 'taluk': 'Benchmark', 'district': 'Benchmark',
+        }
+
+    def documents(self, count):
+        return [
+            {
+                'period': str(period), 'period_text': f'Period {period}', 'year': str(period),
+                'year_text': f'{2012 + period}-{2013 + period}', 'screenshot_path': f'screenshots/bench/{period}.webp',
+            }
+            for period in range(count)
+        ]
+
+    def run(self, mode, properties, documents):
+        # No enclosing transaction: per-row commits must really commit to be measured
+        elapsed = 0.0
+        created = []
+        try:
+            for index in range(properties):
+                docs = self.documents(documents)
+                started = time.perf_counter()
+                if mode == 'per_row':
+                    # The previous behaviour: one row, one round trip and one commit per document
+                    rtc_data = RTCData.objects.create(**self.property_data(index))
+                    created.append(rtc_data.id)
+                    for doc in docs:
+                        with transaction.atomic():
+                            RTCDocument.objects.create(rtc_data=rtc_data, **doc)
+                else:
+                    rtc_data, _ = persist_scrape(self.property_data(index), None, docs)
+                    created.append(rtc_data.id)
+                    if mode == 'bulk_retry':
+                        # A retried scrape must update in place, not duplicate
+                        persist_scrape(self.property_data(index), rtc_data, docs)
+                        if rtc_data.documents.count() != documents:
+                            raise CommandError(f"A retried scrape left {rtc_data.documents.count()} documents, expected {documents}")
+                elapsed += time.perf_counter() - started
+        finally:
+            RTCData.objects.filter(id__in=created).delete()
+        return elapsed
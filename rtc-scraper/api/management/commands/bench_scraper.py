@@ -0,0 +1,358 @@
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from api.models import RTCData, ScrapeJob, make_property_key
+from async_runtime import run_coroutine
+from browser_pool import BrowserPool
+from mock_portal import PortalData, serve_mock_portal
+from route_filter import get_route_filter
+from scraper import RTCScraper
+
+# Compared across runs; lower is better for all but documents per minute
+COMPARED = ('p50_seconds', 'p95_seconds', 'documents_per_minute', 'mb_per_worker')
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of `values`, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def tree_rss(pid):
+    """Resident memory in bytes of a process and all its descendants (Linux /proc), or None."""
+    try:
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as stat:
+                    ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        total, pending = 0, [pid]
+        while pending:
+            current = pending.pop()
+            try:
+                with open(f'/proc/{current}/statm') as statm:
+                    total += int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            except (OSError, IndexError, ValueError):
+                pass
+            pending.extend(children.get(current, []))
+        return total
+    except OSError:
+        return None
+
+
+class RSSSampler(threading.Thread):
+    """Tracks the peak resident memory of a process tree while running."""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            rss = tree_rss(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.peak
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark RTCScraper and the process-image endpoint against a local mock of the portal '
+        '(creates and then deletes benchmark records; run it against a development database)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['scraper', 'endpoint', 'both'], default='scraper')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4],
+                            help='Concurrent scrapes (scraper) or worker processes (endpoint) to measure')
+        parser.add_argument('--properties', type=int, default=8, help='Properties scraped per concurrency level')
+        parser.add_argument('--engine', choices=['browser', 'http'], default=os.getenv('SCRAPER_ENGINE', 'browser'),
+                            help='Scraping engine to measure (default: SCRAPER_ENGINE)')
+        parser.add_argument('--portal-url', help='Use an already running mock_portal instead of starting one')
+        parser.add_argument('--latency-ms', type=float, default=50, help='Mock postback latency')
+        parser.add_argument('--jitter-ms', type=float, default=25, help='Mock latency jitter')
+        parser.add_argument('--sketch-latency-ms', type=float, default=200, help='Mock sketch image latency')
+        parser.add_argument('--vision-latency-ms', type=float, default=500, help='Mock vision API latency')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of mock postbacks that fail')
+        parser.add_argument('--popup-failure-rate', type=float, default=0.0, help='Fraction of mock sketches that fail')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Print changes against a previous --output file')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark records instead of deleting them')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.data = PortalData()
+        mock = None
+        if options['portal_url']:
+            portal_url = options['portal_url']
+        else:
+            mock = serve_mock_portal(
+                data=self.data, latency_ms=options['latency_ms'], jitter_ms=options['jitter_ms'],
+                sketch_latency_ms=options['sketch_latency_ms'], vision_latency_ms=options['vision_latency_ms'],
+                failure_rate=options['failure_rate'], popup_failure_rate=options['popup_failure_rate'],
+            )
+            portal_url = mock.url
+        parts = urlsplit(portal_url)
+        self.mock_root = f"{parts.scheme}://{parts.netloc}"
+        # Everything this process and its workers create talks to the mock
+        os.environ['RTC_PORTAL_URL'] = portal_url
+        os.environ['OPENAI_BASE_URL'] = f"{self.mock_root}/v1"
+        os.environ.setdefault('OPENAI_API_KEY', 'mock')
+        os.environ['EXTRACTION_CACHE_ENABLED'] = 'false'
+        os.environ['LOCAL_OCR_ENABLED'] = 'false'
+        os.environ['SCRAPER_ENGINE'] = options['engine']
+
+        properties = self.data.properties(options['properties'])
+        self.started_at = datetime.now(timezone.utc)
+        targets = ['scraper', 'endpoint'] if options['target'] == 'both' else [options['target']]
+        results = []
+        try:
+            for target in targets:
+                for concurrency in options['concurrency']:
+                    if target == 'scraper':
+                        result = self.bench_scraper(max(1, concurrency), properties)
+                    else:
+                        result = self.bench_endpoint(max(1, concurrency), properties)
+                    results.append(result)
+                    self.report(result)
+        finally:
+            if not options['keep']:
+                self.cleanup()
+            if mock:
+                mock.shutdown()
+
+        report = {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'options': {key: options[key] for key in (
+                'engine', 'properties', 'latency_ms', 'jitter_ms', 'sketch_latency_ms', 'vision_latency_ms',
+                'failure_rate', 'popup_failure_rate',
+            )},
+            'route_filter': get_route_filter().enabled,
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+    # -- measurements --
+
+    def mock_stats(self):
+        try:
+            with urllib.request.urlopen(f"{self.mock_root}/__mock__/stats", timeout=5) as response:
+                return json.load(response)
+        except (OSError, ValueError):
+            return {}
+
+    def traffic(self, before, after, scrapes):
+        """Portal requests and bytes per scrape between two mock stats snapshots."""
+        requests = sum(stats['requests'] for stats in after.values()) - sum(stats['requests'] for stats in before.values())
+        sent = sum(stats['bytes'] for stats in after.values()) - sum(stats['bytes'] for stats in before.values())
+        return {
+            'portal_requests_per_scrape': round(requests / scrapes, 1) if scrapes else None,
+            'portal_kb_per_scrape': round(sent / 1024 / scrapes, 1) if scrapes else None,
+        }
+
+    def summarize(self, target, concurrency, latencies, failures, documents, wall, baseline_rss, peak_rss, extra):
+        scrapes = len(latencies) + failures
+        return {
+            'target': target,
+            'engine': self.options['engine'],
+            'concurrency': concurrency,
+            'scrapes': scrapes,
+            'failures': failures,
+            'documents': documents,
+            'wall_seconds': round(wall, 2),
+            'p50_seconds': round(percentile(latencies, 0.5), 2) if latencies else None,
+            'p95_seconds': round(percentile(latencies, 0.95), 2) if latencies else None,
+            'documents_per_minute': round(documents / wall * 60, 1) if wall else None,
+            'mb_per_worker': (
+                round((peak_rss - (baseline_rss or 0)) / concurrency / 2 ** 20, 1) if peak_rss is not None else None
+            ),
+            **extra,
+        }
+
+    def bench_scraper(self, concurrency, properties):
+        """Scrape every property with `concurrency` scrapes in flight over a pool of as many contexts."""
+        route_filter = get_route_filter()
+        pool = BrowserPool(size=concurrency)
+        scraper = RTCScraper(browser_pool=pool, engine=self.options['engine'])
+        baseline_rss = tree_rss(os.getpid())
+        # The pool is pre-warmed in production, so warm it outside the timing;
+        # the HTTP engine only launches it if a popup has to be rendered
+        if scraper.engine == 'browser':
+            run_coroutine(pool.start())
+        latencies, failures, documents = [], 0, 0
+        blocked_before = route_filter.stats()['blocked_requests_total']
+        traffic_before = self.mock_stats()
+
+        async def run():
+            nonlocal failures, documents
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(property_data):
+                nonlocal failures, documents
+                async with semaphore:
+                    started = time.monotonic()
+                    result = await scraper.scrape_documents(property_data, force_refresh=True)
+                    if result is None:
+                        failures += 1
+                    else:
+                        latencies.append(time.monotonic() - started)
+                        documents += len(result['documents'])
+
+            await asyncio.gather(*(one(property_data) for property_data in properties))
+
+        sampler = RSSSampler(os.getpid())
+        sampler.start()
+        started = time.monotonic()
+        try:
+            run_coroutine(run())
+        finally:
+            wall = time.monotonic() - started
+            peak_rss = sampler.stop()
+            run_coroutine(pool.close())
+        blocked = route_filter.stats()['blocked_requests_total'] - blocked_before
+        return self.summarize('scraper', concurrency, latencies, failures, documents, wall, baseline_rss, peak_rss, {
+            **self.traffic(traffic_before, self.mock_stats(), len(properties)),
+            'blocked_requests_per_scrape': round(blocked / len(properties), 1) if properties else None,
+        })
+
+    def bench_endpoint(self, concurrency, properties):
+        """
+        Upload one image per property to /api/process-image/ and let `concurrency`
+        run_workers processes drain the queue. Each image resolves to a mock
+        property through the mock vision API.
+        """
+        env = {**os.environ, 'BROWSER_POOL_SIZE': '1'}
+        workers = subprocess.Popen(
+            [sys.executable, 'manage.py', 'run_workers', '--concurrency', str(concurrency), '--poll-interval', '0.2'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        sampler = RSSSampler(workers.pid)
+        sampler.start()
+        client = Client()
+        traffic_before = self.mock_stats()
+        job_ids = []
+        started = time.monotonic()
+        try:
+            for index in range(len(properties)):
+                image = self.data.sketch_png(f"upload-{time.time_ns()}-{index}", width=640, height=480)
+                response = client.post('/api/process-image/', {
+                    'image': SimpleUploadedFile(f"bench_{index}.png", image, content_type='image/png'),
+                    'force_refresh': 'true',
+                })
+                if response.status_code != 202:
+                    raise CommandError(f"process-image answered {response.status_code}: {response.content[:200]}")
+                job_ids.append(response.json()['job_id'])
+            while ScrapeJob.objects.filter(id__in=job_ids).exclude(
+                status__in=[ScrapeJob.STATUS_SUCCEEDED, ScrapeJob.STATUS_FAILED]
+            ).exists():
+                if workers.poll() is not None:
+                    raise CommandError('run_workers exited before the benchmark jobs finished')
+                time.sleep(0.5)
+            wall = time.monotonic() - started
+        finally:
+            peak_rss = sampler.stop()
+            workers.send_signal(signal.SIGTERM)
+            try:
+                workers.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                workers.kill()
+
+        latencies, failures, documents = [], 0, 0
+        for job in ScrapeJob.objects.filter(id__in=job_ids):
+            if job.status != ScrapeJob.STATUS_SUCCEEDED:
+                failures += 1
+                continue
+            latencies.append((job.finished_at - job.created_at).total_seconds())
+            documents += len((job.result or {}).get('scraping_result') or [])
+        if not self.options['keep']:
+            ScrapeJob.objects.filter(id__in=job_ids).delete()
+        # The workers' memory is the whole figure; there is no baseline to subtract
+        return self.summarize('endpoint', concurrency, latencies, failures, documents, wall, 0, peak_rss, {
+            **self.traffic(traffic_before, self.mock_stats(), len(properties)),
+        })
+
+    # -- output --
+
+    def report(self, result):
+        def show(value, suffix=''):
+            return '-' if value is None else f"{value}{suffix}"
+
+        self.stdout.write(
+            f"{result['target']:>8} {result['engine']:>7} x{result['concurrency']:<3} "
+            f"{result['scrapes'] - result['failures']}/{result['scrapes']} ok, "
+            f"p50 {show(result['p50_seconds'], 's')}, p95 {show(result['p95_seconds'], 's')}, "
+            f"{show(result['documents_per_minute'])} docs/min, {show(result['mb_per_worker'], ' MB')}/worker, "
+            f"{show(result['portal_requests_per_scrape'])} requests and "
+            f"{show(result['portal_kb_per_scrape'], ' KB')} from the portal per scrape"
+        )
+
+    def compare(self, report, path):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)
+
+        def result_key(result):
+            return result['target'], result.get('engine', 'browser'), result['concurrency']
+
+        before = {result_key(result): result for result in previous['results']}
+        self.stdout.write(f"Changes since {previous.get('commit') or path}:")
+        for result in report['results']:
+            old = before.get(result_key(result))
+            if old is None:
+                continue
+            changes = []
+            for metric in COMPARED:
+                if result.get(metric) is None or not old.get(metric):
+                    continue
+                changes.append(
+                    f"{metric} {old[metric]} -> {result[metric]} ({(result[metric] - old[metric]) / old[metric]:+.0%})"
+                )
+            self.stdout.write(f"{result['target']:>8} {result['engine']:>7} x{result['concurrency']:<3} " + ', '.join(changes))
+
+    def cleanup(self):
+        """Delete the records of mock properties created by this run; uploads may resolve to any of them."""
+        keys = [make_property_key(property_data) for property_data in self.data.properties(1000)]
+        deleted, _ = RTCData.objects.filter(property_key__in=keys, created_at__gte=self.started_at).delete()
+        if deleted:
+            self.stdout.write(f"Deleted {deleted} benchmark records")
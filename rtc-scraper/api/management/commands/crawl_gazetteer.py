@@ -0,0 +1,72 @@
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from async_runtime import run_coroutine
+from browser_pool import get_browser_pool
+from location_resolver import LEVELS, get_location_resolver, match_option
+from scraper import LOCATION_DROPDOWNS, OPTIONS_JS, PORTAL_URL
+from wait_strategies import PortalWaits
+from route_filter import get_route_filter
+
+
+class Command(BaseCommand):
+    help = 'Crawl the portal district/taluk/hobli/village dropdowns into the local location gazetteer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--district', action='append', default=[],
+                            help='Only crawl this district (repeatable; fuzzy matched)')
+        parser.add_argument('--max-age-days', type=float, default=30,
+                            help='Skip locations whose children were crawled more recently than this (0 = recrawl all)')
+
+    def handle(self, *args, **options):
+        self.resolver = get_location_resolver()
+        self.cutoff = timezone.now() - timedelta(days=options['max_age_days'])
+        self.stats = {'locations': 0, 'skipped': 0}
+        run_coroutine(self.crawl(options['district']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Recorded {self.stats['locations']} locations, skipped {self.stats['skipped']} fresh subtrees"
+        ))
+
+    async def crawl(self, districts):
+        async with get_browser_pool().lease() as context:
+            route_filter = get_route_filter()
+            tally = route_filter.new_tally()
+            page = await context.new_page()
+            await route_filter.install(page, tally)
+            try:
+                waits = PortalWaits(page)
+                async with waits.governor.request(PORTAL_URL):
+                    await page.goto(PORTAL_URL, wait_until='networkidle')
+                old_year_button = page.get_by_role("button", name="Old Year")
+                await waits.click(old_year_button, dependent=LOCATION_DROPDOWNS['district'][0], step='old_year')
+                await self.walk(page, waits, 0, [], districts)
+            finally:
+                route_filter.merge(tally)
+                await page.close()
+
+    async def walk(self, page, waits, depth, parent_codes, districts=None):
+        """Record the options at this level, then descend into each one that is due."""
+        key = LEVELS[depth][1]
+        selector, dependent = LOCATION_DROPDOWNS[key]
+        dropdown = page.locator(selector)
+        await dropdown.wait_for(state="visible")
+        options = await dropdown.evaluate(OPTIONS_JS)
+        await sync_to_async(self.resolver.record)(parent_codes, options)
+        self.stats['locations'] += len(options)
+        if dependent is None:
+            return
+
+        if districts:
+            options = [option for option in options if any(match_option([option], name) for name in districts)]
+        for option in options:
+            codes = parent_codes + [option['value']]
+            crawled_at = await sync_to_async(self.resolver.crawled_at)(codes)
+            if crawled_at and crawled_at > self.cutoff:
+                self.stats['skipped'] += 1
+                continue
+            self.stderr.write(f"{'  ' * depth}{key} {option['value']}: {option['text']}")
+            await waits.select(selector, option['value'], dependent=dependent, step=key)
+            await self.walk(page, waits, depth + 1, codes)
+            # Only a fully walked subtree counts as crawled, so an interrupted run resumes here
+            await sync_to_async(self.resolver.mark_crawled)(codes)
@@ -0,0 +1,43 @@
+import json
+import os
+import shutil
+from django.core.management.base import BaseCommand, CommandError
+from api.batch import extract_zip, is_image_name, iter_batch_results, make_batch_dir
+
+
+class Command(BaseCommand):
+    help = 'Process a batch of RTC images (files, directories or zip archives), printing one JSON result per line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Image files, directories of images, or zip archives')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Vision extractions and scrapes in flight at once (default: BATCH_EXTRACTION_CONCURRENCY)')
+        parser.add_argument('--force-refresh', action='store_true', help='Bypass the scrape cache')
+
+    def handle(self, *args, **options):
+        batch_dir = make_batch_dir()
+        try:
+            images = []
+            for path in options['paths']:
+                if os.path.isdir(path):
+                    images.extend(
+                        os.path.join(path, name) for name in sorted(os.listdir(path)) if is_image_name(name)
+                    )
+                elif path.lower().endswith('.zip'):
+                    images.extend(extract_zip(path, batch_dir))
+                elif os.path.isfile(path) and is_image_name(path):
+                    images.append(path)
+                else:
+                    raise CommandError(f"Not an image, directory or zip archive: {path}")
+            if not images:
+                raise CommandError("No images found")
+
+            self.stderr.write(f"Processing {len(images)} images")
+            for result in iter_batch_results(
+                images,
+                concurrency=options['concurrency'],
+                force_refresh=options['force_refresh'],
+            ):
+                self.stdout.write(json.dumps(result))
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
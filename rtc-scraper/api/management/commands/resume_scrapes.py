@@ -0,0 +1,59 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from api.models import make_property_key
+from async_runtime import run_coroutine
+from checkpoints import get_scrape_checkpoints
+from scraper import RTCScraper
+
+
+class Command(BaseCommand):
+    help = 'Scrape again every property with failed or interrupted periods that are due for a retry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Resume at most this many properties')
+        parser.add_argument('--concurrency', type=int, default=1, help='Properties scraped at once')
+        parser.add_argument('--include-exhausted', action='store_true',
+                            help='Also retry periods that have used up SCRAPE_PERIOD_MAX_ATTEMPTS')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the properties that are due')
+
+    def handle(self, *args, **options):
+        checkpoints = get_scrape_checkpoints()
+        due = checkpoints.due(limit=options['limit'], include_exhausted=options['include_exhausted'])
+        for entry in due:
+            self.stderr.write(
+                f"{make_property_key(entry['property_data'])}: {len(entry['periods'])} periods, "
+                f"{entry['attempts']} attempts so far"
+            )
+        if options['dry_run'] or not due:
+            self.stdout.write(f"{len(due)} properties due; checkpoints by status: {checkpoints.summary()}")
+            return
+
+        resumed, complete = run_coroutine(self.resume(due, max(1, options['concurrency'])))
+        self.stdout.write(self.style.SUCCESS(
+            f"Resumed {resumed} of {len(due)} properties, {complete} now complete; "
+            f"checkpoints by status: {checkpoints.summary()}"
+        ))
+
+    async def resume(self, due, concurrency):
+        scraper = RTCScraper()
+        checkpoints = get_scrape_checkpoints()
+        semaphore = asyncio.Semaphore(concurrency)
+        outcomes = {'resumed': 0, 'complete': 0}
+
+        async def run(entry):
+            property_data = entry['property_data']
+            async with semaphore:
+                result = await scraper.scrape_documents(property_data)
+            if result is None:
+                self.stderr.write(f"{make_property_key(property_data)}: scrape failed")
+                return
+            outcomes['resumed'] += 1
+            if await sync_to_async(checkpoints.outstanding)(property_data):
+                self.stderr.write(f"{make_property_key(property_data)}: {len(result['documents'])} documents, periods still due")
+            else:
+                outcomes['complete'] += 1
+                self.stderr.write(f"{make_property_key(property_data)}: {len(result['documents'])} documents, complete")
+
+        await asyncio.gather(*(run(entry) for entry in due))
+        return outcomes['resumed'], outcomes['complete']
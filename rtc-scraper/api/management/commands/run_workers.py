@@ -0,0 +1,99 @@
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from api.jobs import claim_next_job, requeue_stale_jobs, run_job
+from browser_pool import prewarm_browser_pool
+from metrics import serve_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def worker_loop(worker_name, poll_interval, metrics_port=None):
+    """Claim and run queued jobs until the process is asked to stop."""
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Never share the parent's database connection across a fork
+    connections.close_all()
+    logger.info(f"Worker {worker_name} started (pid {os.getpid()})")
+    if metrics_port:
+        try:
+            serve_metrics(metrics_port)
+        except OSError as e:
+            logger.error(f"Worker {worker_name} could not serve metrics on port {metrics_port}: {str(e)}")
+    # Launch Chromium before claiming a job, so the first scrape doesn't pay for it
+    prewarm_browser_pool(wait=True)
+
+    while not stopping:
+        try:
+            job = claim_next_job(worker_name)
+        except Exception as e:
+            logger.error(f"Worker {worker_name} could not claim a job: {str(e)}")
+            connections.close_all()
+            time.sleep(poll_interval)
+            continue
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        logger.info(f"Worker {worker_name} running job {job.id}")
+        run_job(job)
+
+    logger.info(f"Worker {worker_name} stopped")
+
+
+class Command(BaseCommand):
+    help = 'Run local worker processes that execute queued image processing jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.SCRAPE_WORKER_CONCURRENCY,
+            help='Number of worker processes (default: SCRAPE_WORKER_CONCURRENCY)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.SCRAPE_JOB_POLL_INTERVAL,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+        parser.add_argument(
+            '--metrics-port', type=int, default=settings.SCRAPE_WORKER_METRICS_PORT,
+            help='Serve worker N\'s Prometheus metrics on this port + N (default: SCRAPE_WORKER_METRICS_PORT, 0 disables)',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        metrics_port = options['metrics_port']
+
+        requeue_stale_jobs()
+        connections.close_all()
+
+        processes = []
+        for index in range(concurrency):
+            name = f"{os.uname().nodename}-{os.getpid()}-{index}"
+            port = metrics_port + index if metrics_port else None
+            process = multiprocessing.Process(target=worker_loop, args=(name, poll_interval, port), name=name)
+            process.start()
+            processes.append(process)
+        self.stdout.write(f"Started {concurrency} workers")
+
+        def forward(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, forward)
+        signal.signal(signal.SIGINT, forward)
+
+        for process in processes:
+            process.join()
+        self.stdout.write("All workers stopped")
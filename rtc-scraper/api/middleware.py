@@ -0,0 +1,47 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from metrics import get_metrics
+
+
+class MetricsMiddleware:
+    """
+    Count requests and time them per URL name, method and status code.
+    Streaming responses are timed up to the start of the stream.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _observe(self, request, response, started):
+        match = getattr(request, 'resolver_match', None)
+        labels = {
+            'view': match.url_name if match and match.url_name else 'unmatched',
+            'method': request.method,
+        }
+        metrics = get_metrics()
+        metrics.histogram(
+            'rtc_http_request_duration_seconds', 'Time to produce a response', ['view', 'method']
+        ).observe(time.monotonic() - started, **labels)
+        metrics.counter(
+            'rtc_http_requests_total', 'Responses by view, method and status', ['view', 'method', 'status']
+        ).inc(status=response.status_code, **labels)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.monotonic()
+        response = self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.monotonic()
+        response = await self.get_response(request)
+        self._observe(request, response, started)
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_scrapejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapejob',
+            name='force_refresh',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_scrapejob_force_refresh'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('district', 'District'), ('taluk', 'Taluk'), ('hobli', 'Hobli'), ('village', 'Village')], max_length=20)),
+                ('code', models.CharField(max_length=20)),
+                ('name', models.CharField(max_length=255)),
+                ('normalized_name', models.CharField(max_length=255)),
+                ('children_crawled_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='api.location')),
+            ],
+            options={
+                'verbose_name': 'Location',
+                'verbose_name_plural': 'Locations',
+                'indexes': [models.Index(fields=['level', 'parent', 'normalized_name'], name='location_lookup_idx')],
+                'constraints': [models.UniqueConstraint(fields=('level', 'parent', 'code'), name='location_level_parent_code_uniq'), models.UniqueConstraint(condition=models.Q(('parent__isnull', True)), fields=('level', 'code'), name='location_root_code_uniq')],
+            },
+        ),
+    ]
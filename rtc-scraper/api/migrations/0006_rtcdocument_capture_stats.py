@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rtcdocument',
+            name='capture_mode',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='rtcdocument',
+            name='capture_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rtcdocument',
+            name='screenshot_bytes',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
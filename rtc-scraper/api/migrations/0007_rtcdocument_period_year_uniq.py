@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:05
+
+from django.db import migrations, models
+
+
+def remove_duplicate_documents(apps, schema_editor):
+    """Keep only the newest document per (rtc_data, period, year) so the constraint can be added."""
+    RTCDocument = apps.get_model('api', 'RTCDocument')
+    seen = set()
+    duplicates = []
+    for doc_id, rtc_data_id, period, year in RTCDocument.objects.order_by('-created_at', '-id').values_list(
+        'id', 'rtc_data_id', 'period', 'year'
+    ):
+        key = (rtc_data_id, period, year)
+        if key in seen:
+            duplicates.append(doc_id)
+        else:
+            seen.add(key)
+    for start in range(0, len(duplicates), 500):
+        RTCDocument.objects.filter(id__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_rtcdocument_capture_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_documents, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rtcdocument',
+            constraint=models.UniqueConstraint(fields=('rtc_data', 'period', 'year'), name='rtcdocument_period_year_uniq'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_rtcdocument_period_year_uniq'),
+    ]
+
+    operations = [
+        # Filled in by 0009 and made unique by 0010
+        migrations.AddField(
+            model_name='rtcdata',
+            name='property_key',
+            field=models.CharField(max_length=720, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+PROPERTY_FIELDS = ('district', 'taluk', 'hobli', 'village', 'survey_number', 'surnoc', 'hissa')
+
+
+def make_property_key(row):
+    # Frozen copy of api.models.make_property_key
+    return '|'.join(' '.join(str(getattr(row, field)).split()).lower() for field in PROPERTY_FIELDS)
+
+
+def merge_duplicate_properties(apps, schema_editor):
+    """
+    Give every RTCData row its property key and merge rows sharing a key into
+    the newest one. Documents move to the survivor, except where the survivor
+    (or a newer duplicate) already has that (period, year).
+    """
+    RTCData = apps.get_model('api', 'RTCData')
+    RTCDocument = apps.get_model('api', 'RTCDocument')
+
+    groups = {}
+    for row in RTCData.objects.order_by('-created_at', '-id'):
+        groups.setdefault(make_property_key(row), []).append(row)
+
+    for key, rows in groups.items():
+        survivor, duplicates = rows[0], rows[1:]
+        if duplicates:
+            taken = set(RTCDocument.objects.filter(rtc_data=survivor).values_list('period', 'year'))
+            for duplicate in duplicates:
+                for doc in RTCDocument.objects.filter(rtc_data=duplicate).order_by('-created_at', '-id'):
+                    if (doc.period, doc.year) in taken:
+                        doc.delete()
+                    else:
+                        taken.add((doc.period, doc.year))
+                        doc.rtc_data = survivor
+                        doc.save(update_fields=['rtc_data'])
+                duplicate.delete()
+        survivor.property_key = key
+        survivor.save(update_fields=['property_key'])
+
+
+class Migration(migrations.Migration):
+    """
+    Runs on its own: on PostgreSQL, deleting rows that deferred foreign keys
+    point at leaves trigger events pending until commit, and the table can't
+    be altered in the same transaction.
+    """
+
+    dependencies = [
+        ('api', '0008_rtcdata_property_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_properties, migrations.RunPython.noop),
+    ]
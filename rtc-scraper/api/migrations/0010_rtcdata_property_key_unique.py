@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_rtcdata_merge_duplicate_properties'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rtcdata',
+            name='property_key',
+            field=models.CharField(max_length=720, unique=True),
+        ),
+    ]
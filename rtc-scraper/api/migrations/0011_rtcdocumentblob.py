@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_image_data(apps, schema_editor):
+    """Copy any populated image_data into blob rows before the column is dropped."""
+    RTCDocument = apps.get_model('api', 'RTCDocument')
+    RTCDocumentBlob = apps.get_model('api', 'RTCDocumentBlob')
+    ids = RTCDocument.objects.filter(image_data__isnull=False).values_list('id', flat=True)
+    for document_id in ids.iterator():
+        # One row at a time, so only a single image is ever in memory
+        data = RTCDocument.objects.filter(id=document_id).values_list('image_data', flat=True).get()
+        data = bytes(data)
+        if data:
+            RTCDocumentBlob.objects.create(document_id=document_id, data=data, size=len(data))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_rtcdata_property_key_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RTCDocumentBlob',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='blob', serialize=False, to='api.rtcdocument')),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('content_type', models.CharField(default='image/png', max_length=100)),
+            ],
+            options={
+                'verbose_name': 'RTC Document Blob',
+                'verbose_name_plural': 'RTC Document Blobs',
+            },
+        ),
+        migrations.RunPython(move_image_data, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='rtcdocument',
+            name='image_data',
+        ),
+    ]
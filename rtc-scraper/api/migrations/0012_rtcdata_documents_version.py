@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_rtcdocumentblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rtcdata',
+            name='documents_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
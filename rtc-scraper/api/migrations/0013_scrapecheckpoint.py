@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_rtcdata_documents_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('property_key', models.CharField(max_length=720)),
+                ('property_data', models.JSONField(default=dict)),
+                ('period', models.CharField(max_length=100)),
+                ('period_text', models.CharField(max_length=255)),
+                ('year', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('captured', 'Captured'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('document', models.JSONField(blank=True, null=True)),
+                ('next_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Scrape Checkpoint',
+                'verbose_name_plural': 'Scrape Checkpoints',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='scrapecheckpoint_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('property_key', 'period', 'year'), name='scrapecheckpoint_period_year_uniq')],
+            },
+        ),
+    ]
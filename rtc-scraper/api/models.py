@@ -1,6 +1,15 @@
 from django.db import models
 import json
 
+# Fields that identify a property, in portal cascade order
+PROPERTY_FIELDS = ('district', 'taluk', 'hobli', 'village', 'survey_number', 'surnoc', 'hissa')
+
+
+def make_property_key(property_data):
+    """Case and whitespace insensitive identity of a property, e.g. 'bangalore rural|...|22|*|53'."""
+    return '|'.join(' '.join(str(property_data[field]).split()).lower() for field in PROPERTY_FIELDS)
+
+
 class RTCData(models.Model):
     survey_number = models.CharField(max_length=100)
     surnoc = models.CharField(max_length=100)
@@ -9,6 +18,10 @@ class RTCData(models.Model):
     hobli = models.CharField(max_length=100)
     taluk = models.CharField(max_length=100)
     district = models.CharField(max_length=100)
+    # make_property_key() of the fields above; one row per property
+    property_key = models.CharField(max_length=720, unique=True)
+    # Bumped whenever the property's documents are written; versions cached listings
+    documents_version = models.PositiveIntegerField(default=0)
     screenshot_path = models.CharField(max_length=255, blank=True, null=True)
     data = models.JSONField(default=dict)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -16,6 +29,10 @@ class RTCData(models.Model):
     def __str__(self):
         return f"{self.survey_number} - {self.village}"
 
+    def save(self, *args, **kwargs):
+        self.property_key = make_property_key({field: getattr(self, field) for field in PROPERTY_FIELDS})
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "RTC Data"
         verbose_name_plural = "RTC Data"
@@ -26,13 +43,177 @@ class RTCDocument(models.Model):
     period_text = models.CharField(max_length=255)
     year = models.CharField(max_length=100)
     year_text = models.CharField(max_length=100)
-    image_data = models.BinaryField(blank=True, null=True)
     screenshot_path = models.CharField(max_length=255)
+    # How the screenshot was captured ('resource', 'element' or 'page'), how long it took and its stored size
+    capture_mode = models.CharField(max_length=20, blank=True, default='')
+    capture_ms = models.PositiveIntegerField(blank=True, null=True)
+    screenshot_bytes = models.PositiveIntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.period_text} - {self.year_text}"
 
+    @property
+    def screenshot_url(self):
+        """Where the client can fetch the screenshot, resolved through the screenshot storage."""
+        if not self.screenshot_path:
+            return None
+        from screenshot_storage import get_screenshot_storage
+        return get_screenshot_storage().url(self.screenshot_path)
+
     class Meta:
         verbose_name = "RTC Document"
         verbose_name_plural = "RTC Documents"
+        constraints = [
+            models.UniqueConstraint(fields=['rtc_data', 'period', 'year'], name='rtcdocument_period_year_uniq'),
+        ]
+
+class RTCDocumentBlob(models.Model):
+    """
+    Screenshot bytes kept in the database, on their own row so listing documents
+    never reads them. New screenshots go to the screenshot storage instead.
+    """
+    document = models.OneToOneField(RTCDocument, on_delete=models.CASCADE, primary_key=True, related_name='blob')
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()
+    content_type = models.CharField(max_length=100, default='image/png')
+
+    def __str__(self):
+        return f"Blob for document {self.document_id} ({self.size} bytes)"
+
+    class Meta:
+        verbose_name = "RTC Document Blob"
+        verbose_name_plural = "RTC Document Blobs"
+
+class ScrapeJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    image_path = models.CharField(max_length=255)
+    force_refresh = models.BooleanField(default=False)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    class Meta:
+        verbose_name = "Scrape Job"
+        verbose_name_plural = "Scrape Jobs"
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='scrapejob_status_created_idx'),
+        ]
+
+class ScrapeJobEvent(models.Model):
+    job = models.ForeignKey(ScrapeJob, on_delete=models.CASCADE, related_name='events')
+    event = models.CharField(max_length=50)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.job_id} - {self.event}"
+
+    class Meta:
+        verbose_name = "Scrape Job Event"
+        verbose_name_plural = "Scrape Job Events"
+        ordering = ['id']
+
+class ScrapeCheckpoint(models.Model):
+    """
+    Progress of one period of a property's scrape. A row is pending while its
+    period is being scraped, holds the captured document until the scrape is
+    persisted (then it is deleted), or records a failure and when to retry.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_CAPTURED = 'captured'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_CAPTURED, 'Captured'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    property_key = models.CharField(max_length=720)
+    # What RTCScraper.scrape_documents needs to run the scrape again
+    property_data = models.JSONField(default=dict)
+    period = models.CharField(max_length=100)
+    period_text = models.CharField(max_length=255)
+    # The year range the period covers, e.g. '2012-2013'
+    year = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    # The scraped document dict, stored but not yet persisted as an RTCDocument
+    document = models.JSONField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.property_key} - {self.period_text} ({self.status})"
+
+    class Meta:
+        verbose_name = "Scrape Checkpoint"
+        verbose_name_plural = "Scrape Checkpoints"
+        constraints = [
+            models.UniqueConstraint(fields=['property_key', 'period', 'year'], name='scrapecheckpoint_period_year_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='scrapecheckpoint_due_idx'),
+        ]
+
+class Location(models.Model):
+    LEVEL_DISTRICT = 'district'
+    LEVEL_TALUK = 'taluk'
+    LEVEL_HOBLI = 'hobli'
+    LEVEL_VILLAGE = 'village'
+    LEVEL_CHOICES = [
+        (LEVEL_DISTRICT, 'District'),
+        (LEVEL_TALUK, 'Taluk'),
+        (LEVEL_HOBLI, 'Hobli'),
+        (LEVEL_VILLAGE, 'Village'),
+    ]
+
+    level = models.CharField(max_length=20, choices=LEVEL_CHOICES)
+    code = models.CharField(max_length=20)
+    name = models.CharField(max_length=255)
+    normalized_name = models.CharField(max_length=255)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='children', blank=True, null=True)
+    # When this location's children were last read from the portal
+    children_crawled_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.level} {self.code} - {self.name}"
+
+    class Meta:
+        verbose_name = "Location"
+        verbose_name_plural = "Locations"
+        constraints = [
+            models.UniqueConstraint(fields=['level', 'parent', 'code'], name='location_level_parent_code_uniq'),
+            # NULL parents never collide in a unique index, so districts need their own
+            models.UniqueConstraint(fields=['level', 'code'], condition=models.Q(parent__isnull=True),
+                                    name='location_root_code_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['level', 'parent', 'normalized_name'], name='location_lookup_idx'),
+        ]
@@ -0,0 +1,90 @@
+import re
+from django.db.models.functions import Substr
+from django.http import HttpResponse, StreamingHttpResponse
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range `Range: bytes=...` header into an inclusive (start, end).
+    Returns None when there is no usable header (serve everything) and
+    'unsatisfiable' when the range lies outside the content.
+    """
+    match = _RANGE.match((header or '').strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return 'unsatisfiable'
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def iter_file(file, start, length):
+    """Yield `length` bytes of an open file from `start`, one chunk at a time, then close it."""
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def iter_blob(queryset, field, start, length):
+    """Yield a slice of a binary column chunk by chunk, reading each chunk with SUBSTR in the database."""
+    position = start
+    end = start + length
+    while position < end:
+        size = min(CHUNK_SIZE, end - position)
+        # SUBSTR positions are 1-based
+        chunk = queryset.annotate(chunk=Substr(field, position + 1, size)).values_list('chunk', flat=True).first()
+        if not chunk:
+            break
+        yield bytes(chunk)
+        position += size
+
+
+def ranged_response(request, size, content_type, open_range, etag=None):
+    """
+    Build a streaming response honouring a single byte range.
+    `open_range(start, length)` returns an iterator over those bytes.
+    """
+    if etag and request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    byte_range = parse_range(request.headers.get('Range'), size)
+    # A stale If-Range validator means the client's partial copy is outdated: send it all
+    if etag and request.headers.get('If-Range') not in (None, etag):
+        byte_range = None
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(open_range(start, length), content_type=content_type,
+                                     status=206 if byte_range else 200)
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if etag:
+        response['ETag'] = etag
+    return response
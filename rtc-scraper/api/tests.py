@@ -1,3 +1,1007 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image, ImageDraw
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+import browser_pool
+from api.jobs import JobEventStream, claim_next_job, enqueue_image, record_event, requeue_stale_jobs
+from api.management.commands.bench_scraper import Command as BenchScraperCommand
+from api.models import RTCData, RTCDocument, RTCDocumentBlob, ScrapeCheckpoint, ScrapeJob, make_property_key
+from api.streaming import CHUNK_SIZE, iter_file, parse_range, ranged_response
+from checkpoints import ScrapeCheckpoints
+from extraction_cache import ExtractionCache
+from mock_portal import PREFIX, PortalData, serve_mock_portal
+from openai_client import parse_reset
+from persistence import persist_scrape
+from portal_governor import OPEN, PortalGovernor, PortalUnavailable
+from portal_http import PortalHTTPClient, PortalHTTPError
+from scrape_cache import ScrapeCache
+from scrape_planner import ScrapePlan, ScrapePlanner, period_year
+from scraper import RTCScraper
+from screenshot_storage import LocalScreenshotStorage, get_screenshot_storage
+from village_sessions import VillageSession, VillageSessionCache
+from wait_strategies import POSTBACK_STARTED_JS, PortalWaits, StepTimer
 
-# Create your tests here.
+
+def draw_rtc(path, village, survey, quality=95):
+    """A synthetic RTC: the same ruled form for every property, identifiers at the top."""
+    image = Image.new('RGB', (1240, 1754), 'white')
+    draw = ImageDraw.Draw(image)
+    for y in range(100, 1700, 60):
+        draw.line((50, y, 1190, y), fill='black', width=2)
+    draw.text((80, 150), f"Village: {village}", fill='black', font_size=28)
+    draw.text((80, 220), f"Survey No: {survey}  Hissa: 2", fill='black', font_size=28)
+    for y in range(500, 1600, 60):
+        draw.text((80, y + 10), "Owner  Extent  Khata", fill='black', font_size=28)
+    image.save(path, quality=quality)
+
+
+class ExtractionCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_near_matching_is_off_by_default(self):
+        cache = ExtractionCache('v1', path=self.path('cache.sqlite3'))
+        draw_rtc(self.path('a.jpg'), 'Hebbal', '123')
+        draw_rtc(self.path('a_reencoded.jpg'), 'Hebbal', '123', quality=70)
+        cache.put(self.path('a.jpg'), {'survey_number': '123'})
+
+        self.assertEqual(cache.phash_distance, 0)
+        self.assertEqual(cache.get(self.path('a.jpg')), {'survey_number': '123'})
+        self.assertIsNone(cache.get(self.path('a_reencoded.jpg')))
+
+    def test_near_match_requires_the_same_identifiers(self):
+        cache = ExtractionCache('v1', path=self.path('cache.sqlite3'), phash_distance=4)
+        draw_rtc(self.path('a.jpg'), 'Hebbal', '123')
+        draw_rtc(self.path('a_reencoded.jpg'), 'Hebbal', '123', quality=70)
+        draw_rtc(self.path('other_survey.jpg'), 'Hebbal', '128')
+        draw_rtc(self.path('other_village.jpg'), 'Yelahanka', '45')
+        cache.put(self.path('a.jpg'), {'survey_number': '123'})
+
+        self.assertEqual(cache.get(self.path('a_reencoded.jpg')), {'survey_number': '123'})
+        self.assertIsNone(cache.get(self.path('other_survey.jpg')))
+        self.assertIsNone(cache.get(self.path('other_village.jpg')))
+
+
+class BenchScraperCompareTests(SimpleTestCase):
+    def result(self, concurrency, p50, documents_per_minute, engine='http'):
+        return {
+            'target': 'scraper', 'engine': engine, 'concurrency': concurrency,
+            'p50_seconds': p50, 'p95_seconds': p50 * 2, 'documents_per_minute': documents_per_minute,
+            'mb_per_worker': None,
+        }
+
+    def test_compare_against_a_saved_report(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as previous:
+            json.dump({'commit': 'abc1234', 'results': [self.result(1, 2.0, 30.0), self.result(2, 1.0, 60.0)]}, previous)
+        self.addCleanup(os.remove, previous.name)
+        stdout = StringIO()
+        command = BenchScraperCommand(stdout=stdout)
+
+        command.compare({'results': [
+            self.result(1, 1.0, 60.0), self.result(2, 1.5, 40.0), self.result(4, 1.0, 90.0),
+            self.result(1, 1.0, 60.0, engine='browser'),
+        ]}, previous.name)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[0], 'Changes since abc1234:')
+        self.assertEqual(len(lines), 3)
+        self.assertIn('p50_seconds 2.0 -> 1.0 (-50%)', lines[1])
+        self.assertIn('documents_per_minute 30.0 -> 60.0 (+100%)', lines[1])
+        self.assertIn('p50_seconds 1.0 -> 1.5 (+50%)', lines[2])
+        self.assertNotIn('mb_per_worker', stdout.getvalue())
+
+
+class PeriodYearTests(SimpleTestCase):
+    def test_year_ranges(self):
+        self.assertEqual(period_year('01/04/2012 - 31/03/2013 (2012-13 )'), '2012-2013')
+        self.assertEqual(period_year('01/04/2012 - 31/03/2013 (2012-2013)'), '2012-2013')
+        self.assertIsNone(period_year('01/04/2012 - 31/03/2013'))
+
+    def test_two_digit_end_year_rolls_over_the_century(self):
+        self.assertEqual(period_year('01/04/1999 - 31/03/2000 (1999-00 )'), '1999-2000')
+
+
+class JobEventsTests(TestCase):
+    def test_wsgi_streams_events_before_the_job_finishes(self):
+        job = enqueue_image('upload.png')
+        record_event(job, 'started', worker='w1', attempt=1)
+
+        response = self.client.get(f'/api/jobs/{job.id}/events/')
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertFalse(response.is_async)
+        stream = iter(response.streaming_content)
+        self.assertTrue(next(stream).startswith(b'retry: '))
+        self.assertIn(b'"event": "queued"', next(stream))
+        self.assertIn(b'"event": "started"', next(stream))
+        response.close()
+
+    async def test_asgi_streams_until_the_end_event(self):
+        job = await ScrapeJob.objects.acreate(image_path='upload.png', status=ScrapeJob.STATUS_SUCCEEDED)
+
+        response = await self.async_client.get(f'/api/jobs/{job.id}/events/')
+
+        self.assertTrue(response.is_async)
+        frames = [frame async for frame in response.streaming_content]
+        self.assertEqual(frames[-1], b'event: end\ndata: {"status": "succeeded"}\n\n')
+
+    def test_resumes_after_the_last_event_id(self):
+        job = enqueue_image('upload.png')
+        started = record_event(job, 'started', worker='w1', attempt=1)
+        record_event(job, 'succeeded')
+        ScrapeJob.objects.filter(id=job.id).update(status=ScrapeJob.STATUS_SUCCEEDED)
+
+        response = self.client.get(f'/api/jobs/{job.id}/events/', HTTP_LAST_EVENT_ID=str(started.id))
+
+        frames = b''.join(response.streaming_content)
+        self.assertNotIn(b'"event": "started"', frames)
+        self.assertIn(b'"event": "succeeded"', frames)
+        self.assertTrue(frames.endswith(b'event: end\ndata: {"status": "succeeded"}\n\n'))
+
+    def test_idle_streams_send_heartbeats(self):
+        job = enqueue_image('upload.png')
+        stream = JobEventStream(job.id, poll_interval=1, heartbeat=2)
+
+        self.assertIn('"event": "queued"', ''.join(stream.poll()))
+        self.assertEqual(stream.poll(), [])
+        self.assertEqual(stream.poll(), [': keep-alive\n\n'])
+        self.assertEqual(stream.poll(), [])
+
+        record_event(job, 'failed', error='boom')
+        ScrapeJob.objects.filter(id=job.id).update(status=ScrapeJob.STATUS_FAILED)
+        chunks = stream.poll()
+        self.assertTrue(stream.finished)
+        self.assertIn('"event": "failed"', chunks[0])
+        self.assertEqual(chunks[-1], 'event: end\ndata: {"status": "failed"}\n\n')
+
+
+class ParseResetTests(SimpleTestCase):
+    def test_durations(self):
+        self.assertEqual(parse_reset('1s'), 1.0)
+        self.assertEqual(parse_reset('6m0s'), 360.0)
+        self.assertEqual(parse_reset('1m30.5s'), 90.5)
+        self.assertEqual(parse_reset('20ms'), 0.02)
+        self.assertEqual(parse_reset('1h2m'), 3720.0)
+
+    def test_plain_seconds_and_garbage(self):
+        self.assertEqual(parse_reset('2'), 2.0)
+        self.assertIsNone(parse_reset(''))
+        self.assertIsNone(parse_reset(None))
+        self.assertIsNone(parse_reset('soon'))
+
+
+class PropertyKeyTests(TestCase):
+    property_data = {
+        'district': 'Bangalore Rural', 'taluk': 'Devanahalli', 'hobli': 'Kasaba', 'village': 'Avathi',
+        'survey_number': 22, 'surnoc': '*', 'hissa': '53',
+    }
+
+    def test_ignores_case_and_whitespace(self):
+        messy = {**self.property_data, 'district': '  BANGALORE   rural ', 'village': 'avathi\t'}
+        self.assertEqual(make_property_key(messy), make_property_key(self.property_data))
+        self.assertEqual(make_property_key(self.property_data), 'bangalore rural|devanahalli|kasaba|avathi|22|*|53')
+
+    def test_other_fields_give_other_keys(self):
+        self.assertNotEqual(make_property_key({**self.property_data, 'hissa': '54'}), make_property_key(self.property_data))
+
+    def test_saving_sets_the_key(self):
+        rtc_data = RTCData.objects.create(**{**self.property_data, 'village': ' AVATHI '})
+        self.assertEqual(rtc_data.property_key, make_property_key(self.property_data))
+
+
+class PortalGovernorTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'governor.sqlite3')
+
+    def governor(self, **options):
+        defaults = {
+            'enabled': True, 'path': self.path, 'initial_rate': 100, 'max_rate': 200, 'min_rate': 1, 'rate_step': 1,
+            'failure_threshold': 3, 'cooldown': 0.2, 'acquire_timeout': 1,
+        }
+        return PortalGovernor(**{**defaults, **options})
+
+    async def send(self, governor, outcome=None, retry_after=None):
+        async with governor.request('http://portal.test/Service2/') as slot:
+            if outcome == 'fail':
+                slot.fail()
+            elif outcome == 'throttle':
+                slot.throttle(retry_after)
+            elif outcome == 'timeout':
+                slot.timeout()
+
+    def host(self, governor):
+        return governor.state()['portal.test']
+
+    async def test_rate_grows_on_success_and_shrinks_on_errors(self):
+        governor = self.governor()
+        await self.send(governor)
+        self.assertEqual(self.host(governor)['rate_per_second'], 101)
+        await self.send(governor, 'fail')
+        self.assertAlmostEqual(self.host(governor)['rate_per_second'], 70.7)
+        await self.send(governor, 'throttle', retry_after='0')
+        self.assertAlmostEqual(self.host(governor)['rate_per_second'], 35.35)
+
+    async def test_slow_responses_ease_the_rate(self):
+        governor = self.governor(latency_target=0.01)
+        async with governor.request('http://portal.test/'):
+            await asyncio.sleep(0.05)
+        self.assertAlmostEqual(self.host(governor)['rate_per_second'], 90)
+
+    async def test_timeouts_ease_the_rate_but_never_open_the_circuit(self):
+        governor = self.governor()
+        for _ in range(10):
+            await self.send(governor, 'timeout')
+        host = self.host(governor)
+        self.assertEqual(host['circuit'], 'closed')
+        self.assertEqual(host['consecutive_failures'], 0)
+        self.assertEqual(host['error_rate'], 0)
+        self.assertLess(host['rate_per_second'], 100)
+        self.assertEqual(governor.stats()['timeouts_total'], 10)
+
+    async def test_exceptions_are_classified(self):
+        governor = self.governor()
+        with self.assertRaises(ValueError):
+            async with governor.request('http://portal.test/'):
+                raise ValueError('not the portal')
+        with self.assertRaises(ConnectionError):
+            async with governor.request('http://portal.test/'):
+                raise ConnectionError('refused')
+        self.assertEqual(self.host(governor)['consecutive_failures'], 1)
+        self.assertEqual(self.host(governor)['in_flight'], 0)
+
+    async def test_circuit_opens_probes_and_closes(self):
+        governor = self.governor()
+        for _ in range(3):
+            await self.send(governor, 'fail')
+        self.assertEqual(self.host(governor)['circuit'], OPEN)
+        with self.assertRaises(PortalUnavailable):
+            await self.send(governor)
+
+        await asyncio.sleep(0.25)
+        # The probe fails, so the circuit opens for another cooldown
+        await self.send(governor, 'fail')
+        self.assertEqual(self.host(governor)['circuit'], OPEN)
+        with self.assertRaises(PortalUnavailable):
+            await self.send(governor)
+
+        await asyncio.sleep(0.25)
+        await self.send(governor)
+        host = self.host(governor)
+        self.assertEqual(host['circuit'], 'closed')
+        self.assertEqual(host['rate_per_second'], 1)
+        self.assertEqual(governor.stats()['rejected_total'], 2)
+
+    async def test_concurrency_is_shared_through_the_file(self):
+        first, second = self.governor(max_concurrency=1, acquire_timeout=0.3), self.governor(max_concurrency=1, acquire_timeout=0.3)
+        async with first.request('http://portal.test/'):
+            with self.assertRaises(PortalUnavailable):
+                await self.send(second)
+        await self.send(second)
+
+    async def test_disabled_governor_admits_everything(self):
+        governor = self.governor(enabled=False)
+        for _ in range(5):
+            await self.send(governor, 'fail')
+        self.assertEqual(governor.state(), {})
+
+    async def test_mock_portal_errors_open_the_circuit(self):
+        mock = serve_mock_portal(latency_ms=0, jitter_ms=0, failure_rate=1.0)
+        self.addCleanup(mock.shutdown)
+        governor = self.governor()
+        client = PortalHTTPClient(mock.url, governor=governor)
+        await client.open()
+        for _ in range(3):
+            with self.assertRaises(PortalHTTPError):
+                await client.click('Old Year')
+        with self.assertRaises(PortalUnavailable):
+            await client.click('Old Year')
+
+        mock.failure_rate = 0.0
+        await asyncio.sleep(0.25)
+        await client.click('Old Year')
+        self.assertEqual(governor.state()[f"127.0.0.1:{mock.server_address[1]}"]['circuit'], 'closed')
+
+    async def test_mock_portal_throttling_pushes_the_next_slot_back(self):
+        mock = serve_mock_portal(latency_ms=0, jitter_ms=0, popup_failure_rate=1.0)
+        self.addCleanup(mock.shutdown)
+        governor = self.governor()
+        client = PortalHTTPClient(mock.url, governor=governor)
+        await client.open()
+        with self.assertRaises(PortalHTTPError):
+            await client.get(f"{PREFIX}Sketch.ashx?t=x")
+        self.assertEqual(governor.stats()['throttled_total'], 1)
+        started = time.monotonic()
+        await client.open()
+        self.assertGreater(time.monotonic() - started, 0.005)
+
+
+class ScrapePlannerTests(SimpleTestCase):
+    def setUp(self):
+        # The mock's periods run from 2005-06 to 2023-24
+        self.periods = PortalData().period_options()
+        self.planner = ScrapePlanner(year_from=2012, year_to=2020)
+
+    def value_of(self, year):
+        return next(period['value'] for period in self.periods if f"({year}-" in period['text'])
+
+    def test_plan_fetches_only_periods_in_range_and_not_stored(self):
+        stored = {self.value_of(2014): {'period': self.value_of(2014)}}
+
+        plan = self.planner.plan(self.periods, stored)
+
+        self.assertEqual([target_year for _, _, target_year in plan.fetch],
+                         [f"{year}-{year + 1}" for year in range(2012, 2021) if year != 2014])
+        self.assertEqual(plan.reused, [stored[self.value_of(2014)]])
+        self.assertEqual(len(plan.out_of_range), len(self.periods) - 9)
+        self.assertEqual(plan.report()['naive_fetches'], len(self.periods))
+        self.assertEqual(plan.report()['planned_fetches'], 8)
+
+    def test_resumed_periods_leave_the_fetch_list(self):
+        plan = self.planner.plan(self.periods, {})
+        plan.resume({self.value_of(2012): {'period': self.value_of(2012)}})
+
+        self.assertNotIn(self.value_of(2012), [option['value'] for _, option, _ in plan.fetch])
+        self.assertEqual(plan.report()['resumed'], 1)
+        self.assertEqual(plan.report()['planned_fetches'], 8)
+
+    def test_periods_without_a_year_are_skipped(self):
+        plan = self.planner.plan([{'value': '1', 'text': 'Current'}], {})
+        self.assertEqual(plan.fetch, [])
+        self.assertEqual(len(plan.no_year), 1)
+
+    def test_record_counts_the_plan(self):
+        self.planner.record(self.planner.plan(self.periods, {}))
+        stats = self.planner.stats()
+        self.assertEqual(stats['plans_total'], 1)
+        self.assertEqual(stats['fetch_ratio'], 9 / len(self.periods))
+
+    def test_rejects_an_inverted_range(self):
+        with self.assertRaises(ValueError):
+            ScrapePlanner(year_from=2020, year_to=2012)
+
+    def test_choose_year_prefers_the_exact_range(self):
+        years = [{'value': '1', 'text': '2012-2013'}, {'value': '2', 'text': '2013-2014'}]
+        self.assertEqual(self.planner.choose_year(years, 'p', '2013-2014'), years[1])
+
+    def test_choose_year_falls_back_to_the_same_start_year(self):
+        years = [{'value': '1', 'text': '2012-13'}, {'value': '2', 'text': '2013-14'}]
+        self.assertEqual(self.planner.choose_year(years, 'p', '2013-2014'), years[1])
+
+    def test_choose_year_never_takes_another_year(self):
+        years = PortalData().years(self.value_of(2015))
+        self.assertIsNone(self.planner.choose_year(years, 'p', '2012-2013'))
+        self.assertIsNone(self.planner.choose_year([], 'p', '2012-2013'))
+
+    def test_empty_plan_report(self):
+        self.assertEqual(ScrapePlan([]).report()['planned_fetches'], 0)
+
+
+class BrowserPoolShutdownTests(SimpleTestCase):
+    def test_forked_pools_share_one_shutdown_hook(self):
+        hooks = []
+        with mock.patch.object(browser_pool, '_pool', None), mock.patch.object(browser_pool, '_shutdown_registered', False), \
+                mock.patch.object(browser_pool, 'register_shutdown_hook', hooks.append):
+            first = browser_pool.get_browser_pool()
+            # What a forked worker sees: the parent's pool under another pid
+            browser_pool._pool_pid = -1
+            second = browser_pool.get_browser_pool()
+
+            self.assertIsNot(first, second)
+            self.assertEqual(hooks, [browser_pool._close_pool])
+            with mock.patch.object(second, 'close', mock.AsyncMock()) as close:
+                asyncio.run(browser_pool._close_pool())
+            close.assert_awaited_once()
+
+
+class FakePortalPage:
+    """Just enough of a Playwright page for PortalWaits: scripted results per JS snippet."""
+
+    def __init__(self, started, done=None, elements=1):
+        self.started, self.done, self.elements = started, done, elements
+        self.waited = []
+
+    async def evaluate(self, script):
+        pass
+
+    async def wait_for_function(self, script, arg=None, timeout=None):
+        self.waited.append(script)
+        if script == POSTBACK_STARTED_JS:
+            if not self.started:
+                raise PlaywrightTimeoutError('Timeout exceeded')
+            return None
+        if self.done is None:
+            raise PlaywrightTimeoutError('Timeout exceeded')
+        return mock.Mock(json_value=mock.AsyncMock(return_value=self.done))
+
+    async def wait_for_load_state(self, state, timeout=None):
+        pass
+
+    def locator(self, selector):
+        return mock.Mock(count=mock.AsyncMock(return_value=self.elements))
+
+
+class PortalWaitsTests(SimpleTestCase):
+    def wait(self, page, dependent=None):
+        slot = mock.Mock()
+        waits = PortalWaits(page, timeout=50, start_timeout=10, governor=mock.Mock())
+        return asyncio.run(waits.wait_for_postback(dependent, slot)), slot
+
+    def test_an_action_without_a_postback_does_not_wait(self):
+        page = FakePortalPage(started=False)
+        done, slot = self.wait(page)
+        self.assertTrue(done)
+        self.assertEqual(page.waited, [POSTBACK_STARTED_JS])
+        slot.timeout.assert_not_called()
+
+    def test_without_a_postback_the_dependent_must_already_be_there(self):
+        done, slot = self.wait(FakePortalPage(started=False, elements=0), dependent='#ddlYear')
+        self.assertFalse(done)
+        slot.timeout.assert_not_called()
+
+    def test_a_started_postback_is_waited_for(self):
+        done, slot = self.wait(FakePortalPage(started=True, done={'error': None}), dependent='#ddlYear')
+        self.assertTrue(done)
+        slot.fail.assert_not_called()
+
+    def test_a_postback_that_never_ends_times_out(self):
+        done, slot = self.wait(FakePortalPage(started=True))
+        self.assertFalse(done)
+        slot.timeout.assert_called_once()
+
+    def test_a_failed_postback_counts_against_the_portal(self):
+        done, slot = self.wait(FakePortalPage(started=True, done={'error': 'Server error 500'}))
+        self.assertFalse(done)
+        slot.fail.assert_called_once()
+
+
+class PeriodConcurrencyTests(SimpleTestCase):
+    def test_periods_are_spread_over_pages_and_returned_in_portal_order(self):
+        scraper = RTCScraper(db_handler=mock.Mock(), period_concurrency=3)
+        targets = [(index, {'value': str(index), 'text': f"Period {index}"}, f"{2012 + index}-{2013 + index}") for index in range(6)]
+        main_page = mock.Mock(name='main')
+        extra_pages = []
+        scraped = []
+
+        async def new_page(context, tally):
+            # The second extra page will fail to navigate
+            extra_pages.append(mock.Mock(name=f"extra{len(extra_pages)}", close=mock.AsyncMock(), broken=len(extra_pages) == 1))
+            return extra_pages[-1]
+
+        async def navigate(page, waits, timer, property_data, codes):
+            if getattr(page, 'broken', False):
+                raise ConnectionError('navigation failed')
+
+        async def scrape_period(page, waits, timer, period_option, target_year):
+            scraped.append((page, period_option['value']))
+            # Later periods finish first
+            await asyncio.sleep(0.01 * (6 - int(period_option['value'])))
+            return None if period_option['value'] == '4' else {'period': period_option['value']}
+
+        async def run_period(progress, property_data, period_option, target_year, scrape):
+            return await scrape()
+
+        with mock.patch.multiple(scraper, _new_page=new_page, _navigate_to_periods=navigate,
+                                 _scrape_period=scrape_period, _run_period=run_period):
+            documents = asyncio.run(scraper._scrape_periods_concurrently(
+                mock.Mock(), main_page, mock.Mock(), StepTimer(), targets, {}, {}
+            ))
+
+        self.assertEqual([doc['period'] for doc in documents], ['0', '1', '2', '3', '5'])
+        self.assertEqual(sorted(value for _, value in scraped), ['0', '1', '2', '3', '4', '5'])
+        # The page that failed to navigate left its share to the others
+        self.assertEqual({page for page, _ in scraped}, {main_page, extra_pages[0]})
+        for page in extra_pages:
+            page.close.assert_awaited_once()
+
+
+class JobQueueTests(TestCase):
+    def enqueue(self, minutes_ago):
+        job = enqueue_image(f"/tmp/upload-{minutes_ago}.png")
+        ScrapeJob.objects.filter(id=job.id).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return job
+
+    def test_claims_the_oldest_queued_job(self):
+        newer, older = self.enqueue(1), self.enqueue(5)
+
+        job = claim_next_job('worker-1')
+
+        self.assertEqual(job.id, older.id)
+        self.assertEqual((job.status, job.worker, job.attempts), (ScrapeJob.STATUS_RUNNING, 'worker-1', 1))
+        self.assertEqual(claim_next_job('worker-2').id, newer.id)
+        self.assertIsNone(claim_next_job('worker-3'))
+
+    def test_a_job_lost_to_another_worker_moves_on_to_the_next(self):
+        newer, older = self.enqueue(1), self.enqueue(5)
+        update = QuerySet.update
+        raced = []
+
+        def racing_update(queryset, **fields):
+            if not raced and fields.get('worker') == 'worker-1':
+                # worker-2 claims the job between worker-1's SELECT and its UPDATE
+                raced.append(True)
+                update(ScrapeJob.objects.filter(id=older.id), status=ScrapeJob.STATUS_RUNNING, worker='worker-2')
+            return update(queryset, **fields)
+
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            job = claim_next_job('worker-1')
+
+        self.assertEqual(job.id, newer.id)
+        older.refresh_from_db()
+        self.assertEqual(older.worker, 'worker-2')
+
+    @override_settings(SCRAPE_JOB_STALE_SECONDS=60, SCRAPE_JOB_MAX_ATTEMPTS=2)
+    def test_stale_jobs_are_requeued_until_they_run_out_of_attempts(self):
+        retried, exhausted, alive = self.enqueue(3), self.enqueue(2), self.enqueue(1)
+        for job in (retried, exhausted, alive):
+            claim_next_job('worker-1')
+        ScrapeJob.objects.filter(id=exhausted.id).update(attempts=2)
+        ScrapeJob.objects.filter(id__in=[retried.id, exhausted.id]).update(updated_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+
+        statuses = dict(ScrapeJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[retried.id], ScrapeJob.STATUS_QUEUED)
+        self.assertEqual(statuses[exhausted.id], ScrapeJob.STATUS_FAILED)
+        self.assertEqual(statuses[alive.id], ScrapeJob.STATUS_RUNNING)
+        # A requeued job is claimed again, as its next attempt
+        self.assertEqual(claim_next_job('worker-2').attempts, 2)
+
+
+class ScrapeCacheTests(TestCase):
+    property_data = {
+        'district': 'Bangalore Rural', 'taluk': 'Devanahalli', 'hobli': 'Kasaba', 'village': 'Avathi',
+        'survey_number': '22', 'surnoc': '*', 'hissa': '53',
+    }
+
+    def setUp(self):
+        self.cache = ScrapeCache(ttl=3600, immutable_until=2020)
+        self.rtc_data = RTCData.objects.create(**self.property_data)
+
+    def add_document(self, period, year_text, screenshot_path=None):
+        return RTCDocument.objects.create(
+            rtc_data=self.rtc_data, period=period, period_text=f"Period {period}", year=period, year_text=year_text,
+            screenshot_path=screenshot_path or get_screenshot_storage().key_for(f"{period} {year_text}".encode()),
+        )
+
+    def test_unknown_property_is_a_miss(self):
+        entry = self.cache.lookup({**self.property_data, 'survey_number': '23'})
+        self.assertEqual(entry, {'rtc_data': None, 'documents': {}, 'fresh': False})
+
+    def test_fresh_until_the_ttl_runs_out(self):
+        doc = self.add_document('1', '2015-2016')
+        self.assertFalse(self.cache.lookup(self.property_data)['fresh'])
+
+        self.cache.mark_scraped(self.rtc_data, [doc])
+        entry = self.cache.lookup(self.property_data)
+        self.assertTrue(entry['fresh'])
+        self.assertEqual(entry['documents'], {'1': doc})
+
+        scraped_at = (timezone.now() - timedelta(hours=2)).isoformat()
+        RTCData.objects.filter(id=self.rtc_data.id).update(data={'scraped_at': scraped_at})
+        self.assertFalse(self.cache.lookup(self.property_data)['fresh'])
+
+    def test_a_rescrape_replaces_superseded_documents(self):
+        old = self.add_document('1', '2015-2016')
+        new = RTCDocument.objects.create(
+            rtc_data=self.rtc_data, period='1', period_text='Period 1', year='2', year_text='2015-16', screenshot_path='',
+        )
+        self.cache.mark_scraped(self.rtc_data, [new])
+        self.assertFalse(RTCDocument.objects.filter(id=old.id).exists())
+
+    def test_only_historical_documents_with_content_keys_are_reused(self):
+        historical = self.add_document('1', '2015-2016')
+        self.add_document('2', '2023-2024')
+        self.add_document('3', '2014-2015', screenshot_path='/media/screenshots/rtc_3.png')
+        self.add_document('4', 'Current')
+
+        with mock.patch.object(type(get_screenshot_storage()), 'size') as size:
+            reusable = self.cache.reusable_documents(self.cache.lookup(self.property_data))
+
+        self.assertEqual(reusable, {'1': historical})
+        # Content-addressed keys are trusted without asking the store
+        size.assert_not_called()
+
+
+class ChooseLocationTests(SimpleTestCase):
+    property_data = {'district': 'Bangalore Rural', 'taluk': 'Hoskote', 'hobli': 'Kasaba', 'village': 'Avathi'}
+
+    def setUp(self):
+        self.scraper = RTCScraper(db_handler=mock.Mock(), resolver=mock.Mock())
+
+    def choose(self, options, codes, parent_codes, key):
+        return asyncio.run(self.scraper._choose_location(options, self.property_data, codes, parent_codes, key))
+
+    def test_gazetteer_code_is_used_when_offered(self):
+        codes = {'district': '21', 'taluk': '3', 'hobli': '2', 'village': '27'}
+        self.assertEqual(self.choose([{'value': '21', 'text': 'Bangalore Rural'}], codes, [], 'district'), '21')
+        self.assertEqual(codes['taluk'], '3')
+        self.scraper.resolver.record.assert_not_called()
+
+    def test_a_stale_parent_sends_every_deeper_level_to_live_matching(self):
+        codes = {'district': '21', 'taluk': '3', 'hobli': '2', 'village': '27'}
+        districts = [{'value': '20', 'text': 'Bangalore Urban'}, {'value': '29', 'text': 'Bangalore Rural'}]
+
+        self.assertEqual(self.choose(districts, codes, [], 'district'), '29')
+        self.assertEqual(codes, {'district': '29', 'taluk': None, 'hobli': None, 'village': None})
+
+        # The stale taluk code is still offered under the new district, but for another taluk
+        taluks = [{'value': '3', 'text': 'Devanahalli'}, {'value': '4', 'text': 'Hoskote'}]
+        self.assertEqual(self.choose(taluks, codes, ['29'], 'taluk'), '4')
+        self.scraper.resolver.record.assert_called_with(['29'], taluks)
+
+
+class ScreenshotStorageTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.storage = LocalScreenshotStorage(root=tmp.name, base_url='/media/', output_format='WEBP', lossless=True)
+
+    def render(self, text, image_format='PNG'):
+        image = Image.new('RGB', (240, 120), 'white')
+        ImageDraw.Draw(image).text((10, 50), text, fill='black')
+        buffer = BytesIO()
+        image.save(buffer, format=image_format)
+        return buffer.getvalue()
+
+    def test_identical_renders_are_stored_once(self):
+        data = self.render('Avathi')
+        with mock.patch.object(self.storage, '_write', wraps=self.storage._write) as write:
+            first = self.storage.save(data)
+            second = self.storage.save(data)
+
+        self.assertEqual(first, second)
+        write.assert_called_once()
+        key, size = first
+        self.assertTrue(key.startswith('screenshots/') and key.endswith('.webp'))
+        self.assertTrue(self.storage.is_content_key(key))
+        self.assertEqual(os.path.getsize(self.storage.path(key)), size)
+        self.assertEqual(self.storage.stats()['deduplicated'], 1)
+
+    def test_different_renders_get_different_keys(self):
+        self.assertNotEqual(self.storage.save(self.render('Avathi'))[0], self.storage.save(self.render('Budigere'))[0])
+
+    def test_a_smaller_source_image_is_kept_as_it_is(self):
+        data = self.render('Avathi', 'JPEG')
+        with mock.patch.object(self.storage, 'encode', return_value=data + b'padding'):
+            key, size = self.storage.save(data)
+        self.assertTrue(key.endswith('.jpg'))
+        self.assertEqual(size, len(data))
+        self.assertEqual(self.storage.read(key), data)
+        self.assertEqual(self.storage.content_type(key), 'image/jpeg')
+        # The same source is then found under its passthrough key
+        self.assertEqual(self.storage.save(data), (key, size))
+
+
+class SketchResourceTests(SimpleTestCase):
+    def response(self, page, body):
+        return mock.Mock(
+            url='https://portal.test/Sketch.ashx', ok=True, request=mock.Mock(resource_type='image'),
+            frame=mock.Mock(page=page), body=mock.AsyncMock(return_value=body),
+        )
+
+    def test_only_the_popups_own_image_is_used(self):
+        scraper = RTCScraper(db_handler=mock.Mock())
+        popup, other_popup = mock.Mock(name='popup'), mock.Mock(name='other_popup')
+        popup.locator.return_value.evaluate = mock.AsyncMock(return_value='https://portal.test/Sketch.ashx')
+        responses = {}
+        collect = scraper._image_collector(responses)
+
+        collect(self.response(popup, b'this period'))
+        # Another page of the context loads the same session-backed URL afterwards
+        collect(self.response(other_popup, b'another period'))
+
+        self.assertEqual(asyncio.run(scraper._sketch_resource(popup, responses)), b'this period')
+
+
+class PersistScrapeTests(TestCase):
+    property_data = {
+        'district': 'Bangalore Rural', 'taluk': 'Devanahalli', 'hobli': 'Kasaba', 'village': 'Avathi',
+        'survey_number': '22', 'surnoc': '*', 'hissa': '53',
+    }
+
+    def documents(self, screenshot_prefix='a'):
+        return [
+            {'period': str(period), 'period_text': f"Period {period}", 'year': str(period),
+             'year_text': f"{2012 + period}-{2013 + period}", 'screenshot_path': f"screenshots/{screenshot_prefix}{period}.webp"}
+            for period in range(3)
+        ]
+
+    def test_a_retried_scrape_updates_in_place(self):
+        rtc_data, saved = persist_scrape(self.property_data, None, self.documents())
+        # The retry doesn't know the row yet and spells the property differently
+        retried, resaved = persist_scrape({**self.property_data, 'village': 'AVATHI '}, None, self.documents('b'))
+
+        self.assertEqual(retried.id, rtc_data.id)
+        self.assertEqual(RTCData.objects.count(), 1)
+        self.assertEqual(rtc_data.documents.count(), 3)
+        self.assertEqual(
+            sorted(rtc_data.documents.values_list('screenshot_path', flat=True)),
+            [f"screenshots/b{period}.webp" for period in range(3)],
+        )
+        rtc_data.refresh_from_db()
+        self.assertEqual(rtc_data.documents_version, 2)
+
+    def test_a_failing_callback_rolls_the_scrape_back(self):
+        def on_persisted(rtc_data, saved):
+            raise RuntimeError('bookkeeping failed')
+
+        with self.assertRaises(RuntimeError):
+            persist_scrape(self.property_data, None, self.documents(), on_persisted=on_persisted)
+        self.assertFalse(RTCData.objects.exists())
+        self.assertFalse(RTCDocument.objects.exists())
+
+    def test_benchmark_leaves_no_rows_behind(self):
+        out = StringIO()
+        call_command('bench_persistence', properties=2, documents=3, stdout=out)
+        self.assertIn('Bulk speedup', out.getvalue())
+        self.assertFalse(RTCData.objects.exists())
+
+
+class RangeTests(SimpleTestCase):
+    def test_parse_range(self):
+        cases = {
+            None: None,
+            '': None,
+            'bytes=-': None,
+            'items=0-10': None,
+            # Multiple ranges aren't supported, so the whole body is served
+            'bytes=0-1,5-6': None,
+            'bytes=0-99': (0, 99),
+            'bytes=900-': (900, 999),
+            'bytes=500-5000': (500, 999),
+            'bytes=-100': (900, 999),
+            'bytes=-5000': (0, 999),
+            'bytes=-0': 'unsatisfiable',
+            'bytes=1000-': 'unsatisfiable',
+            'bytes=5-2': 'unsatisfiable',
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 1000), expected)
+
+    def test_nothing_in_empty_content_is_satisfiable(self):
+        self.assertEqual(parse_range('bytes=-10', 0), 'unsatisfiable')
+        self.assertEqual(parse_range('bytes=0-', 0), 'unsatisfiable')
+
+    def get(self, content, etag='"v1"', **headers):
+        request = RequestFactory().get('/', headers=headers)
+        response = ranged_response(request, len(content), 'image/webp', lambda start, length: iter_file(BytesIO(content), start, length), etag=etag)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_ranges_are_served_partially(self):
+        content = bytes(range(256)) * 1024
+        response, body = self.get(content, Range='bytes=-100')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, content[-100:])
+        self.assertEqual(response['Content-Range'], f"bytes {len(content) - 100}-{len(content) - 1}/{len(content)}")
+        self.assertEqual(response['Content-Length'], '100')
+
+        # Spans several chunks
+        response, body = self.get(content, Range=f"bytes=10-{CHUNK_SIZE * 2}")
+        self.assertEqual(body, content[10:CHUNK_SIZE * 2 + 1])
+
+    def test_whole_body_without_a_range(self):
+        response, body = self.get(b'sketch')
+        self.assertEqual((response.status_code, body, response['Accept-Ranges']), (200, b'sketch', 'bytes'))
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.get(b'sketch', Range='bytes=50-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */6')
+
+    def test_validators(self):
+        response, body = self.get(b'sketch', **{'If-None-Match': '"v1"'})
+        self.assertEqual((response.status_code, body), (304, b''))
+        # A partial copy of another version gets the whole current one
+        response, body = self.get(b'sketch', Range='bytes=0-1', **{'If-Range': '"v0"'})
+        self.assertEqual((response.status_code, body), (200, b'sketch'))
+        response, body = self.get(b'sketch', Range='bytes=0-1', **{'If-Range': '"v1"'})
+        self.assertEqual((response.status_code, body), (206, b'sk'))
+
+
+class DocumentScreenshotTests(TestCase):
+    def test_database_blobs_are_streamed_by_range(self):
+        rtc_data = RTCData.objects.create(
+            district='Bangalore Rural', taluk='Devanahalli', hobli='Kasaba', village='Avathi', survey_number='22', surnoc='*', hissa='53',
+        )
+        doc = RTCDocument.objects.create(rtc_data=rtc_data, period='1', period_text='P', year='1', year_text='2015-2016', screenshot_path='')
+        data = os.urandom(CHUNK_SIZE + 500)
+        RTCDocumentBlob.objects.create(document=doc, data=data, size=len(data), content_type='image/png')
+
+        response = self.client.get(f"/api/documents/{doc.id}/screenshot/", HTTP_RANGE=f"bytes={CHUNK_SIZE - 10}-")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), data[CHUNK_SIZE - 10:])
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+        self.assertEqual(self.client.get('/api/documents/999999/screenshot/').status_code, 404)
+
+
+class ScreenshotListingTests(TestCase):
+    property_data = {
+        'district': 'Bangalore Rural', 'taluk': 'Devanahalli', 'hobli': 'Kasaba', 'village': 'Avathi',
+        'survey_number': '22', 'surnoc': '*', 'hissa': '53',
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.rtc_data, _ = persist_scrape(self.property_data, None, [self.document(period) for period in range(3)])
+        # Documents without a screenshot are never listed
+        RTCDocument.objects.create(rtc_data=self.rtc_data, period='9', period_text='P9', year='9', year_text='2021-2022', screenshot_path='')
+
+    def document(self, period):
+        return {'period': str(period), 'period_text': f"Period {period}", 'year': str(period),
+                'year_text': f"{2012 + period}-{2013 + period}", 'screenshot_path': f"screenshots/{period}.webp"}
+
+    def url(self, **params):
+        query = '&'.join(f"{name}={value}" for name, value in params.items())
+        return f"/api/screenshots/{self.rtc_data.id}/?{query}"
+
+    def test_cursor_paging(self):
+        first = self.client.get(self.url(limit=2, fields='period,name')).json()
+        self.assertEqual(first['screenshots'], [{'period': '0', 'name': '0.webp'}, {'period': '1', 'name': '1.webp'}])
+        second = self.client.get(self.url(limit=2, fields='period', cursor=first['next_cursor'])).json()
+        self.assertEqual(second, {'success': True, 'screenshots': [{'period': '2'}], 'next_cursor': None})
+
+    def test_unchanged_listing_is_not_modified(self):
+        response = self.client.get(self.url())
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another view of the same documents has its own tag
+        self.assertNotEqual(self.client.get(self.url(limit=1))['ETag'], etag)
+
+    def test_writing_documents_changes_the_listing(self):
+        etag = self.client.get(self.url(fields='period'))['ETag']
+        persist_scrape(self.property_data, self.rtc_data, [self.document(3)])
+
+        response = self.client.get(self.url(fields='period'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([doc['period'] for doc in response.json()['screenshots']], ['0', '1', '2', '3'])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url(fields='image_data')).status_code, 400)
+        self.assertEqual(self.client.get(self.url(cursor='not-a-cursor')).status_code, 400)
+        self.assertEqual(self.client.get('/api/screenshots/999999/').status_code, 404)
+
+
+class VillageSessionCacheTests(SimpleTestCase):
+    codes = {'district': '21', 'taluk': '3', 'hobli': '2', 'village': '14'}
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('village_sessions.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.key = VillageSessionCache.key('https://portal/', self.codes)
+
+    def test_idle_snapshots_expire_and_use_extends_them(self):
+        sessions = VillageSessionCache(enabled=True, ttl=60)
+        session = VillageSession('https://portal/', '<html></html>', [])
+        sessions.store(self.key, session)
+
+        self.now += 50
+        self.assertIs(sessions.get(self.key), session)
+        sessions.touch(self.key, session)
+        self.now += 50
+        self.assertIs(sessions.get(self.key), session)
+
+        self.now += 61
+        self.assertIsNone(sessions.get(self.key))
+        self.assertEqual(sessions.stats()['expired_total'], 1)
+        self.assertEqual(sessions.stats()['villages'], 0)
+
+    def test_least_recently_used_villages_are_evicted(self):
+        sessions = VillageSessionCache(enabled=True, ttl=60, max_entries=2)
+        keys = [VillageSessionCache.key('https://portal/', {**self.codes, 'village': str(n)}) for n in range(3)]
+        for key in keys[:2]:
+            sessions.store(key, VillageSession('https://portal/', '', []))
+        sessions.get(keys[0])
+        sessions.store(keys[2], VillageSession('https://portal/', '', []))
+
+        self.assertIsNone(sessions.get(keys[1]))
+        self.assertIsNotNone(sessions.get(keys[0]))
+        self.assertIsNotNone(sessions.get(keys[2]))
+        self.assertEqual(sessions.stats()['evictions_total'], 1)
+
+    def test_invalidate_keeps_a_replacement(self):
+        sessions = VillageSessionCache(enabled=True, ttl=60)
+        stale = VillageSession('https://portal/', '', [])
+        fresh = VillageSession('https://portal/', '', [])
+        sessions.store(self.key, stale)
+        sessions.store(self.key, fresh)
+
+        sessions.invalidate(self.key, stale)
+        self.assertIs(sessions.get(self.key), fresh)
+        sessions.invalidate(self.key, fresh)
+        self.assertIsNone(sessions.get(self.key))
+
+    def test_disabled_cache_parks_nothing(self):
+        sessions = VillageSessionCache(enabled=False)
+        sessions.store(self.key, VillageSession('https://portal/', '', []))
+        self.assertIsNone(sessions.get(self.key))
+        self.assertEqual(sessions.stats()['villages'], 0)
+
+
+class ScrapeCheckpointsTests(TestCase):
+    property_data = {
+        'district': 'Bangalore Rural', 'taluk': 'Devanahalli', 'hobli': 'Kasaba', 'village': 'Avathi',
+        'survey_number': '22', 'surnoc': '*', 'hissa': '53',
+    }
+    periods = [{'value': str(n), 'text': f'Period {n}'} for n in range(3)]
+
+    def setUp(self):
+        self.checkpoints = ScrapeCheckpoints(lease=600, backoff=60, backoff_max=300, max_attempts=3)
+        self.targets = [(n, period, f'{2012 + n}-{2013 + n}') for n, period in enumerate(self.periods)]
+
+    def rows(self):
+        return {row.period: row for row in ScrapeCheckpoint.objects.all()}
+
+    def test_plan_leases_periods_and_resumes_captured_ones(self):
+        self.assertEqual(self.checkpoints.plan(self.property_data, self.targets), {})
+        rows = self.rows()
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(row.status == ScrapeCheckpoint.STATUS_PENDING and row.attempts == 1 for row in rows.values()))
+        self.assertGreater(rows['0'].next_attempt_at, timezone.now() + timedelta(seconds=590))
+
+        _, period, year = self.targets[1]
+        self.checkpoints.captured(self.property_data, period, year, {'period': 'Period 1'})
+        resumed = self.checkpoints.plan(self.property_data, self.targets)
+
+        self.assertEqual(resumed, {'1': {'period': 'Period 1'}})
+        rows = self.rows()
+        self.assertEqual((rows['0'].attempts, rows['1'].attempts, rows['2'].attempts), (2, 1, 2))
+        self.assertEqual(rows['1'].status, ScrapeCheckpoint.STATUS_CAPTURED)
+
+    def test_failed_backs_off_exponentially_up_to_the_max(self):
+        _, period, year = self.targets[0]
+        delays = []
+        with mock.patch('checkpoints.random.uniform', return_value=1.0):
+            for _ in range(4):
+                self.checkpoints.plan(self.property_data, self.targets[:1])
+                before = timezone.now()
+                self.checkpoints.failed(self.property_data, period, year, 'popup timed out')
+                delays.append((self.rows()['0'].next_attempt_at - before).total_seconds())
+
+        self.assertEqual([round(delay) for delay in delays], [60, 120, 240, 300])
+        row = self.rows()['0']
+        self.assertEqual((row.status, row.error), (ScrapeCheckpoint.STATUS_FAILED, 'popup timed out'))
+        self.assertEqual(self.checkpoints.stats()['periods_exhausted'], 2)
+
+    def test_due_lists_overdue_properties_with_attempts_left(self):
+        other = {**self.property_data, 'hissa': '54'}
+        self.checkpoints.plan(self.property_data, self.targets)
+        self.checkpoints.plan(other, self.targets[:1])
+        self.assertEqual(self.checkpoints.due(), [])
+
+        past = timezone.now() - timedelta(seconds=1)
+        ScrapeCheckpoint.objects.filter(period='0').update(next_attempt_at=past - timedelta(seconds=60))
+        ScrapeCheckpoint.objects.filter(period='1').update(next_attempt_at=past)
+        due = self.checkpoints.due()
+
+        self.assertEqual(len(due), 2)
+        mine = next(entry for entry in due if entry['property_data'] == self.property_data)
+        self.assertEqual(mine['periods'], ['Period 0', 'Period 1'])
+        self.assertEqual(len(self.checkpoints.due(limit=1)), 1)
+
+        ScrapeCheckpoint.objects.filter(property_key=make_property_key(other)).update(attempts=3)
+        self.assertEqual([entry['property_data'] for entry in self.checkpoints.due()], [self.property_data])
+        self.assertEqual(len(self.checkpoints.due(include_exhausted=True)), 2)
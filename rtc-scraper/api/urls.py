@@ -3,5 +3,11 @@ from . import views
 
 urlpatterns = [
     path('process-image/', views.process_image, name='process_image'),
+    path('process-batch/', views.process_batch, name='process_batch'),
     path('screenshots/<int:record_id>/', views.get_screenshots, name='get_screenshots'),
+    path('documents/<int:document_id>/screenshot/', views.document_screenshot, name='document_screenshot'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/events/', views.job_events, name='job_events'),
+    path('jobs/<int:job_id>/result/', views.job_result, name='job_result'),
+    path('portal/status/', views.portal_status, name='portal_status'),
 ] 
\ No newline at end of file
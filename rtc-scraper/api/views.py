@@ -4,21 +4,31 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
+from django.core.handlers.asgi import ASGIRequest
 import sys
 import os
 import uuid
+import shutil
 import traceback
+import zipfile
 from image_processor import ImageProcessor
 from scraper import RTCScraper
 from db_handler import DBHandler
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from .models import RTCData, RTCDocument
+from django.urls import reverse
+from .models import RTCData, RTCDocument, RTCDocumentBlob, ScrapeJob
+from .jobs import enqueue_image, iter_job_events, iter_job_events_sync, serialize_job
+from .batch import extract_zip, is_image_name, iter_batch_results, make_batch_dir
+from .streaming import iter_blob, iter_file, ranged_response
+from .listing import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, listing_etag, parse_fields, screenshot_page
+from screenshot_storage import get_screenshot_storage
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, get_metrics, span
+from portal_governor import get_portal_governor
 from django.conf import settings
 import json
 import logging
-import asyncio
 
 logger = logging.getLogger(__name__)
 
@@ -111,85 +121,29 @@ class ProcessImageView(APIView):
 @csrf_exempt
 @require_http_methods(["POST"])
 def process_image(request):
+    """Save the upload and queue it for the workers; returns the job id right away."""
     try:
         if not request.FILES.get('image'):
             return JsonResponse({'error': 'No image provided'}, status=400)
 
         # Save the uploaded image
         uploaded_file = request.FILES['image']
-        file_name = default_storage.save(uploaded_file.name, uploaded_file)
+        with span('upload.save'):
+            file_name = default_storage.save(uploaded_file.name, uploaded_file)
         file_path = os.path.join(settings.MEDIA_ROOT, file_name)
 
-        try:
-            # Process the image
-            processor = ImageProcessor()
-            extracted_info = processor.extract_info_from_image(file_path)
-            
-            if not extracted_info:
-                return JsonResponse({'error': 'Failed to extract information from image'}, status=400)
-
-            # Format the extracted information
-            property_data = {
-                'survey_number': str(extracted_info.get('Survey Number', '')),
-                'surnoc': str(extracted_info.get('Surnoc', '')),
-                'hissa': str(extracted_info.get('Hissa', '')),
-                'village': str(extracted_info.get('Village', '')),
-                'hobli': str(extracted_info.get('Hobli', '')),
-                'taluk': str(extracted_info.get('Taluk', '')),
-                'district': str(extracted_info.get('District', ''))
-            }
-
-            # Run the scraper in an event loop
-            scraper = RTCScraper()
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            scraping_result = loop.run_until_complete(scraper.scrape_documents(property_data))
-            loop.close()
-
-            # Find the latest RTCData record for this property
-            rtc_data = RTCData.objects.filter(
-                survey_number=property_data['survey_number'],
-                surnoc=property_data['surnoc'],
-                hissa=property_data['hissa'],
-                village=property_data['village'],
-                hobli=property_data['hobli'],
-                taluk=property_data['taluk'],
-                district=property_data['district'],
-            ).order_by('-created_at').first()
-
-            screenshots = []
-            if rtc_data:
-                for doc in rtc_data.documents.all():
-                    if doc.screenshot_path:
-                        screenshots.append({
-                            'name': os.path.basename(doc.screenshot_path),
-                            'url': f'/media/{doc.screenshot_path}'
-                        })
-
-            return JsonResponse({
-                'success': True,
-                'message': 'Image processed and documents scraped successfully',
-                'extracted_info': extracted_info,
-                'scraping_result': scraping_result,
-                'screenshots': screenshots,
-                'record_id': rtc_data.id if rtc_data else None
-            })
-
-        except Exception as e:
-            logger.error(f"Error processing image: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            return JsonResponse({
-                'error': f'Error processing image: {str(e)}',
-                'traceback': traceback.format_exc()
-            }, status=500)
+        # force_refresh=true skips the scrape cache and fetches every period again
+        force_refresh = request.POST.get('force_refresh', '').lower() in ('1', 'true', 'yes')
+        job = enqueue_image(file_path, force_refresh=force_refresh)
 
-        finally:
-            # Clean up the temporary file
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except Exception as e:
-                logger.error(f"Error cleaning up temporary file: {str(e)}")
+        return JsonResponse({
+            'success': True,
+            'message': 'Image queued for processing',
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': reverse('job_status', args=[job.id]),
+            'result_url': reverse('job_result', args=[job.id]),
+        }, status=202)
 
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
@@ -199,25 +153,192 @@ def process_image(request):
             'traceback': traceback.format_exc()
         }, status=500)
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def process_batch(request):
+    """
+    Process many images in one call: any number of `images` files and/or `zip`
+    archives. Results are streamed as newline-delimited JSON, one object per
+    extraction, duplicate and scrape, as soon as each finishes.
+    """
+    images = request.FILES.getlist('images')
+    archives = request.FILES.getlist('zip')
+    if not images and not archives:
+        return JsonResponse({'error': 'No images provided'}, status=400)
+
+    batch_dir = make_batch_dir()
+    try:
+        paths = []
+        with span('upload.save_batch'):
+            for index, uploaded_file in enumerate(images):
+                if not is_image_name(uploaded_file.name):
+                    continue
+                path = os.path.join(batch_dir, f"{index:05d}_{os.path.basename(uploaded_file.name)}")
+                with open(path, 'wb') as destination:
+                    for chunk in uploaded_file.chunks():
+                        destination.write(chunk)
+                paths.append(path)
+            for archive in archives:
+                paths.extend(extract_zip(archive, batch_dir))
+    except zipfile.BadZipFile:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return JsonResponse({'error': 'Invalid zip archive'}, status=400)
+    except Exception as e:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        logger.error(f"Error saving batch: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+    if not paths:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return JsonResponse({'error': 'No supported image files found'}, status=400)
+
+    force_refresh = request.POST.get('force_refresh', '').lower() in ('1', 'true', 'yes')
+
+    def stream():
+        try:
+            for result in iter_batch_results(paths, force_refresh=force_refresh):
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            logger.error(f"Batch failed: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+    response = StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+    response['X-Accel-Buffering'] = 'no'  # Let proxies pass each line through
+    return response
+
 @require_http_methods(["GET"])
-def get_screenshots(request, record_id):
+def job_status(request, job_id):
+    """Job status plus progress events; pass ?after=<event id> to get only new ones."""
     try:
-        rtc_data = RTCData.objects.get(id=record_id)
-        documents = rtc_data.documents.all()
-        screenshots = []
-        for doc in documents:
-            if doc.screenshot_path:
-                screenshots.append({
-                    'name': os.path.basename(doc.screenshot_path),
-                    'url': f'/media/{doc.screenshot_path}' if not doc.screenshot_path.startswith('/media/') else doc.screenshot_path
-                })
+        job = ScrapeJob.objects.get(id=job_id)
+        after_event = request.GET.get('after')
         return JsonResponse({
             'success': True,
-            'screenshots': screenshots
+            **serialize_job(job, after_event=int(after_event) if after_event else None)
         })
-    except RTCData.DoesNotExist:
-        return JsonResponse({'error': 'Record not found'}, status=404)
+    except ScrapeJob.DoesNotExist:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid event id'}, status=400)
+
+@require_http_methods(["GET"])
+async def job_events(request, job_id):
+    """
+    Live job progress as Server-Sent Events. Resumes after the `Last-Event-ID`
+    header (sent by EventSource on reconnect) or `?after=<event id>`.
+    Under WSGI (e.g. runserver) the stream is a sync generator, since WSGI
+    handlers buffer async ones until they end.
+    """
+    if not await ScrapeJob.objects.filter(id=job_id).aexists():
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    try:
+        after_event = request.headers.get('Last-Event-ID') or request.GET.get('after')
+        after_event = int(after_event) if after_event else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid event id'}, status=400)
+
+    if isinstance(request, ASGIRequest):
+        events = iter_job_events(job_id, after_event)
+    else:
+        events = iter_job_events_sync(job_id, after_event)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Let proxies pass each event through
+    return response
+
+@require_http_methods(["GET"])
+def job_result(request, job_id):
+    """The processing result of a finished job, in the old process-image response shape."""
+    try:
+        job = ScrapeJob.objects.get(id=job_id)
+    except ScrapeJob.DoesNotExist:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+
+    if not job.is_finished:
+        return JsonResponse({'success': False, 'job_id': job.id, 'status': job.status}, status=202)
+    if job.status == ScrapeJob.STATUS_FAILED:
+        return JsonResponse({'success': False, 'job_id': job.id, 'status': job.status, 'error': job.error}, status=422)
+    return JsonResponse(job.result)
+
+@require_http_methods(["GET"])
+def get_screenshots(request, record_id):
+    """
+    Screenshots of a record, oldest first. Query parameters: `fields` (comma
+    separated, default name,url,download_url), `limit` and `cursor` (the
+    previous page's next_cursor). Replies 304 to a matching If-None-Match, so
+    polling while a scrape runs is cheap.
+    """
+    try:
+        version = RTCData.objects.filter(id=record_id).values_list('documents_version', flat=True).first()
+        if version is None:
+            return JsonResponse({'error': 'Record not found'}, status=404)
+        try:
+            fields = parse_fields(request.GET.get('fields'))
+            limit = min(max(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+            cursor = request.GET.get('cursor', '')
+            decode_cursor(cursor)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        etag = listing_etag(record_id, version, cursor, limit, fields)
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(screenshot_page(record_id, version, cursor, limit, fields),
+                                    content_type='application/json')
+        response['ETag'] = etag
+        # Let browsers keep the body but revalidate on every poll
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         logger.error(f"Error getting screenshots: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         return JsonResponse({'error': str(e)}, status=500)
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """Stage latency histograms, counters and component stats of this process, for Prometheus."""
+    return HttpResponse(get_metrics().render(), content_type=METRICS_CONTENT_TYPE)
+
+@require_http_methods(["GET"])
+def portal_status(request):
+    """The portal governor's shared state per host: circuit, adapted request rate, latency, errors and requests in flight."""
+    governor = get_portal_governor()
+    return JsonResponse({'success': True, 'enabled': governor.enabled, 'hosts': governor.state()})
+
+@require_http_methods(["GET"])
+def document_screenshot(request, document_id):
+    """
+    Stream a document's screenshot in chunks, honouring Range requests, without
+    holding the whole image in memory. Blobs in a remote store are redirected to.
+    """
+    doc = RTCDocument.objects.filter(id=document_id).only('id', 'screenshot_path').first()
+    if doc is None:
+        return JsonResponse({'error': 'Document not found'}, status=404)
+
+    # Bytes kept in the database are read slice by slice, never as a whole column
+    blob = RTCDocumentBlob.objects.filter(document_id=document_id).values('size', 'content_type').first()
+    if blob:
+        rows = RTCDocumentBlob.objects.filter(document_id=document_id)
+        return ranged_response(
+            request, blob['size'], blob['content_type'],
+            lambda start, length: iter_blob(rows, 'data', start, length),
+            etag=f'"blob-{document_id}-{blob["size"]}"',
+        )
+
+    storage = get_screenshot_storage()
+    key = doc.screenshot_path
+    size = storage.size(key) if key else None
+    if size is None:
+        return JsonResponse({'error': 'Screenshot not found'}, status=404)
+    if not storage.streamable:
+        # The remote store serves ranges itself
+        return HttpResponseRedirect(storage.url(key))
+    return ranged_response(
+        request, size, storage.content_type(key),
+        lambda start, length: iter_file(storage.open(key), start, length),
+        etag=f'"{os.path.splitext(os.path.basename(key))[0]}-{size}"',
+    )
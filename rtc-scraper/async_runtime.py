@@ -0,0 +1,79 @@
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import logging
+import os
+import threading
+
+logger = logging.getLogger('AsyncRuntime')
+
+_loop = None
+_loop_pid = None
+_thread = None
+_lock = threading.Lock()
+_shutdown_hooks = []
+
+
+def get_loop():
+    """
+    Return the process-wide background event loop, starting it on first use.
+
+    Long-lived async resources (the browser pool, shared HTTP clients) are bound
+    to the loop they were created on, so every coroutine that touches them must
+    run here instead of on a throwaway loop per request.
+    """
+    global _loop, _loop_pid, _thread
+    with _lock:
+        # A forked worker inherits the globals but not the thread running the loop
+        if _loop is None or _loop_pid != os.getpid() or not _thread.is_alive():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            _thread = threading.Thread(target=_loop.run_forever, name='async-runtime', daemon=True)
+            _thread.start()
+            logger.info("Started background event loop")
+        return _loop
+
+
+def run_coroutine(coro, timeout=None):
+    """
+    Run a coroutine on the background loop and block until it finishes.
+    The coroutine sees the caller's context variables, so e.g. its trace spans
+    nest under the caller's.
+    """
+    loop = get_loop()
+    future = concurrent.futures.Future()
+
+    def done(task):
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def start():
+        # A task copies the context current when it is created
+        loop.create_task(coro).add_done_callback(done)
+
+    loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+    return future.result(timeout)
+
+
+def register_shutdown_hook(hook):
+    """Register an async callable to be awaited on the background loop at exit."""
+    _shutdown_hooks.append(hook)
+
+
+def _shutdown():
+    if _loop is None or _loop_pid != os.getpid() or not _loop.is_running():
+        return
+    for hook in reversed(_shutdown_hooks):
+        try:
+            asyncio.run_coroutine_threadsafe(hook(), _loop).result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Shutdown hook failed: {str(e)}")
+    _loop.call_soon_threadsafe(_loop.stop)
+
+
+atexit.register(_shutdown)
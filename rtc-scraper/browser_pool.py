@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from async_runtime import get_loop, register_shutdown_hook
+from metrics import get_metrics, span
+
+logger = logging.getLogger('BrowserPool')
+
+DEFAULT_CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},  # Set viewport for better quality screenshots
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class _PooledContext:
+    def __init__(self, context, browser):
+        self.context = context
+        self.browser = browser
+        self.uses = 0
+        self.closed = False
+        context.on('close', self._on_close)
+
+    def _on_close(self, _context=None):
+        self.closed = True
+
+
+class BrowserPool:
+    """
+    Long-lived Chromium instance with a fixed number of warm browser contexts.
+
+    Contexts are leased per scrape, health-checked before they are handed out
+    and recycled after `max_uses` leases or when a lease ends in an error.
+    A released context keeps no pages or cookies, so no lease inherits the
+    previous scrape's portal session; resuming a parked village session
+    restores its cookies explicitly.
+    The pool must only be used from the loop returned by `async_runtime.get_loop()`.
+    """
+
+    def __init__(self, size=None, max_uses=None, acquire_timeout=None, launch_options=None, context_options=None):
+        self.size = size or int(os.getenv('BROWSER_POOL_SIZE', '2'))
+        self.max_uses = max_uses or int(os.getenv('BROWSER_CONTEXT_MAX_USES', '25'))
+        self.acquire_timeout = acquire_timeout or float(os.getenv('BROWSER_POOL_ACQUIRE_TIMEOUT', '600'))
+        self.launch_options = launch_options or {
+            'headless': True,
+            'slow_mo': int(os.getenv('BROWSER_SLOW_MO', '0')),
+        }
+        self.context_options = context_options or DEFAULT_CONTEXT_OPTIONS
+        self._playwright = None
+        self._browser = None
+        self._idle = None
+        self._start_lock = asyncio.Lock()
+        self._in_use = 0
+        self._metrics = {
+            'leases_total': 0,
+            'recycled_total': 0,
+            'browser_restarts_total': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'lease_seconds_total': 0.0,
+            'lease_seconds_max': 0.0,
+        }
+
+    async def start(self):
+        """Launch the browser and warm up the contexts if not already running."""
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            self._playwright = await async_playwright().start()
+            try:
+                await self._launch_browser()
+                idle = asyncio.Queue()
+                for _ in range(self.size):
+                    idle.put_nowait(await self._new_context())
+            except BaseException:
+                # Leave nothing running, so the next lease can start afresh
+                if self._browser is not None:
+                    await self._browser.close()
+                    self._browser = None
+                await self._playwright.stop()
+                self._playwright = None
+                raise
+            self._idle = idle
+            logger.info(f"Browser pool started with {self.size} warm contexts")
+
+    async def _launch_browser(self):
+        with span('browser.launch'):
+            self._browser = await self._playwright.chromium.launch(**self.launch_options)
+
+    async def _new_context(self):
+        if self._browser is None or not self._browser.is_connected():
+            logger.warning("Browser is not connected, relaunching")
+            self._metrics['browser_restarts_total'] += 1
+            await self._launch_browser()
+        with span('browser.new_context'):
+            context = await self._browser.new_context(**self.context_options)
+        return _PooledContext(context, self._browser)
+
+    def _is_healthy(self, entry):
+        return (
+            not entry.closed
+            and entry.browser is self._browser
+            and self._browser.is_connected()
+        )
+
+    async def _recycle(self, entry):
+        self._metrics['recycled_total'] += 1
+        try:
+            if not entry.closed:
+                await entry.context.close()
+        except Exception as e:
+            logger.warning(f"Error closing recycled context: {str(e)}")
+        return await self._new_context()
+
+    @asynccontextmanager
+    async def lease(self):
+        """Lease a warm browser context for the duration of the `async with` block."""
+        await self.start()
+
+        wait_started = time.monotonic()
+        entry = await asyncio.wait_for(self._idle.get(), timeout=self.acquire_timeout)
+        waited = time.monotonic() - wait_started
+        get_metrics().stage_seconds.observe(waited, stage='browser.lease_wait')
+        self._metrics['wait_seconds_total'] += waited
+        self._metrics['wait_seconds_max'] = max(self._metrics['wait_seconds_max'], waited)
+
+        failed = False
+        lease_started = time.monotonic()
+        try:
+            if not self._is_healthy(entry):
+                logger.info("Leased context failed health check, recycling")
+                entry = await self._recycle(entry)
+            self._in_use += 1
+            self._metrics['leases_total'] += 1
+            try:
+                yield entry.context
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self._in_use -= 1
+                entry.uses += 1
+                held = time.monotonic() - lease_started
+                self._metrics['lease_seconds_total'] += held
+                self._metrics['lease_seconds_max'] = max(self._metrics['lease_seconds_max'], held)
+        finally:
+            await self._release(entry, failed)
+
+    async def _release(self, entry, failed):
+        try:
+            if failed or entry.uses >= self.max_uses or not self._is_healthy(entry):
+                entry = await self._recycle(entry)
+            else:
+                # Leave the context clean for the next lease
+                for page in list(entry.context.pages):
+                    await page.close()
+                await entry.context.clear_cookies()
+        except Exception as e:
+            logger.error(f"Error releasing browser context: {str(e)}")
+            try:
+                entry = await self._new_context()
+            except Exception as e:
+                # Put the broken entry back; the next lease will recycle it
+                logger.error(f"Could not replace browser context: {str(e)}")
+                entry.closed = True
+        self._idle.put_nowait(entry)
+
+    def stats(self):
+        """Return a snapshot of pool size, wait time and lease duration metrics."""
+        leases = self._metrics['leases_total']
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize() if self._idle is not None else 0,
+            'in_use': self._in_use,
+            'max_uses': self.max_uses,
+            **self._metrics,
+            'wait_seconds_avg': self._metrics['wait_seconds_total'] / leases if leases else 0.0,
+            'lease_seconds_avg': self._metrics['lease_seconds_total'] / leases if leases else 0.0,
+        }
+
+    async def close(self):
+        """Close every context, the browser and the Playwright driver."""
+        if self._idle is not None:
+            while not self._idle.empty():
+                entry = self._idle.get_nowait()
+                try:
+                    await entry.context.close()
+                except Exception:
+                    pass
+            self._idle = None
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+_pool = None
+_pool_pid = None
+_shutdown_registered = False
+
+
+async def _close_pool():
+    """Close this process's pool, whichever one is current at exit."""
+    if _pool is not None and _pool_pid == os.getpid():
+        await _pool.close()
+
+
+def get_browser_pool():
+    """Return the process-wide browser pool."""
+    global _pool, _pool_pid, _shutdown_registered
+    # A forked worker must not reuse the parent's browser handles
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = BrowserPool()
+        _pool_pid = os.getpid()
+        get_metrics().register_stats('browser_pool', _pool.stats)
+    # Inherited across forks along with the hook itself, so a fork doesn't register again
+    if not _shutdown_registered:
+        register_shutdown_hook(_close_pool)
+        _shutdown_registered = True
+    return _pool
+
+
+def prewarm_browser_pool(wait=False):
+    """
+    Start the process-wide pool ahead of the first scrape, so that no scrape
+    pays Chromium's cold start. Does nothing with BROWSER_POOL_PREWARM=false
+    or SCRAPER_ENGINE=http, which only launches the browser for popups it
+    can't read over HTTP. Unless `wait`, returns while the pool starts in the
+    background; a failed start is logged and retried on the first lease.
+    """
+    if os.getenv('BROWSER_POOL_PREWARM', 'true').lower() not in ('1', 'true', 'yes'):
+        return
+    if os.getenv('SCRAPER_ENGINE', 'browser') == 'http':
+        return
+    future = asyncio.run_coroutine_threadsafe(get_browser_pool().start(), get_loop())
+
+    def report(done):
+        if not done.cancelled() and done.exception() is not None:
+            logger.warning(f"Could not pre-warm the browser pool: {str(done.exception())}")
+
+    future.add_done_callback(report)
+    if wait:
+        try:
+            future.result()
+        except Exception:
+            pass
@@ -0,0 +1,181 @@
+import logging
+import os
+import random
+import threading
+from datetime import timedelta
+from django.db.models import Count, F
+from django.utils import timezone
+from api.models import ScrapeCheckpoint, make_property_key
+from metrics import get_metrics
+
+logger = logging.getLogger('ScrapeCheckpoints')
+
+
+class ScrapeCheckpoints:
+    """
+    Per-period progress of scrapes, kept in ScrapeCheckpoint rows so that no
+    period is lost to a failed popup or a crashed worker.
+
+    When a scrape starts, its target periods are checkpointed as pending and
+    leased for `lease` seconds. A captured period keeps its document on the
+    row until the scrape is persisted, so a scrape that dies before then
+    resumes without capturing it again. A failed period is retried after an
+    exponential, jittered backoff. Rows whose lease or backoff ran out are
+    due for `due()` and the `resume_scrapes` command, until a period has
+    failed `max_attempts` times.
+    """
+
+    def __init__(self, lease=None, backoff=None, backoff_max=None, max_attempts=None):
+        self.lease = lease or int(os.getenv('SCRAPE_CHECKPOINT_LEASE_SECONDS', '900'))
+        self.backoff = backoff or float(os.getenv('SCRAPE_RETRY_BACKOFF_SECONDS', '60'))
+        self.backoff_max = backoff_max or float(os.getenv('SCRAPE_RETRY_BACKOFF_MAX_SECONDS', '3600'))
+        self.max_attempts = max_attempts or int(os.getenv('SCRAPE_PERIOD_MAX_ATTEMPTS', '5'))
+        self._lock = threading.Lock()
+        self._stats = {
+            'periods_planned': 0,
+            'periods_resumed': 0,
+            'periods_captured': 0,
+            'periods_failed': 0,
+            'periods_exhausted': 0,
+        }
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _rows(self, property_data, period_option=None, target_year=None):
+        rows = ScrapeCheckpoint.objects.filter(property_key=make_property_key(property_data))
+        if period_option is not None:
+            rows = rows.filter(period=period_option['value'], year=target_year)
+        return rows
+
+    def outstanding(self, property_data):
+        """
+        Values of the periods an earlier scrape of the property left uncaptured
+        or unpersisted and that still have attempts left; empty if none.
+        """
+        rows = self._rows(property_data).filter(attempts__lt=self.max_attempts)
+        return set(rows.values_list('period', flat=True))
+
+    def plan(self, property_data, targets):
+        """
+        Checkpoint the periods about to be scraped, `targets` being
+        (index, period_option, target_year) tuples, and count an attempt for
+        each. Returns the documents an earlier attempt captured but never
+        persisted, keyed by period value; those periods need no scraping.
+        """
+        key = make_property_key(property_data)
+        existing = {(row.period, row.year): row for row in ScrapeCheckpoint.objects.filter(property_key=key)}
+        captured, attempted, new = {}, [], []
+        for _, period_option, target_year in targets:
+            row = existing.get((period_option['value'], target_year))
+            if row is not None and row.status == ScrapeCheckpoint.STATUS_CAPTURED and row.document:
+                captured[period_option['value']] = row.document
+                continue
+            attempted.append(period_option['value'])
+            if row is None:
+                new.append(ScrapeCheckpoint(
+                    property_key=key,
+                    property_data=property_data,
+                    period=period_option['value'],
+                    period_text=period_option['text'],
+                    year=target_year,
+                ))
+        ScrapeCheckpoint.objects.bulk_create(new, ignore_conflicts=True)
+        ScrapeCheckpoint.objects.filter(property_key=key, period__in=attempted).exclude(
+            status=ScrapeCheckpoint.STATUS_CAPTURED
+        ).update(
+            status=ScrapeCheckpoint.STATUS_PENDING,
+            property_data=property_data,
+            attempts=F('attempts') + 1,
+            next_attempt_at=timezone.now() + timedelta(seconds=self.lease),
+            updated_at=timezone.now(),
+        )
+        self._count('periods_planned', len(attempted))
+        self._count('periods_resumed', len(captured))
+        if captured:
+            logger.info(f"Resuming {len(captured)} periods captured by an earlier attempt")
+        return captured
+
+    def captured(self, property_data, period_option, target_year, document):
+        """Keep a scraped document until the scrape is persisted; due again if that never happens."""
+        self._rows(property_data, period_option, target_year).update(
+            status=ScrapeCheckpoint.STATUS_CAPTURED,
+            document=document,
+            error='',
+            next_attempt_at=timezone.now() + timedelta(seconds=self.lease),
+            updated_at=timezone.now(),
+        )
+        self._count('periods_captured')
+
+    def unavailable(self, property_data, period_option, target_year):
+        """The portal has no document for the period; there is nothing to retry."""
+        self._rows(property_data, period_option, target_year).delete()
+
+    def failed(self, property_data, period_option, target_year, error):
+        """Record a failed attempt and when the period may be tried again."""
+        row = self._rows(property_data, period_option, target_year).first()
+        if row is None:
+            return
+        delay = min(self.backoff_max, self.backoff * (2 ** max(row.attempts - 1, 0))) * random.uniform(0.5, 1.5)
+        row.status = ScrapeCheckpoint.STATUS_FAILED
+        row.error = str(error)
+        row.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        row.save(update_fields=['status', 'error', 'next_attempt_at', 'updated_at'])
+        self._count('periods_failed')
+        if row.attempts >= self.max_attempts:
+            self._count('periods_exhausted')
+            logger.warning(
+                f"Period {row.period_text} of {row.property_key} failed {row.attempts} times; "
+                f"it is only retried when the property is scraped again"
+            )
+        else:
+            logger.info(f"Period {row.period_text} of {row.property_key} failed, retry due in {int(delay)}s")
+
+    def complete(self, property_data, saved_documents):
+        """Drop the checkpoints of periods now stored as RTCDocuments. Runs in the persist transaction."""
+        self._rows(property_data).filter(period__in=[doc.period for doc in saved_documents]).delete()
+
+    def due(self, limit=None, include_exhausted=False):
+        """
+        Properties with periods due for another attempt, most overdue first,
+        as [{'property_data', 'periods', 'attempts'}].
+        """
+        rows = ScrapeCheckpoint.objects.filter(next_attempt_at__lte=timezone.now())
+        if not include_exhausted:
+            rows = rows.filter(attempts__lt=self.max_attempts)
+        properties = {}
+        for row in rows.order_by('next_attempt_at'):
+            entry = properties.setdefault(
+                row.property_key, {'property_data': row.property_data, 'periods': [], 'attempts': 0}
+            )
+            entry['periods'].append(row.period_text)
+            entry['attempts'] = max(entry['attempts'], row.attempts)
+            if limit and len(properties) > limit:
+                del properties[row.property_key]
+                break
+        return list(properties.values())
+
+    def summary(self):
+        """Checkpointed periods by status, and how many have used up their attempts."""
+        counts = {status: 0 for status, _ in ScrapeCheckpoint.STATUS_CHOICES}
+        for row in ScrapeCheckpoint.objects.values('status').annotate(count=Count('id')):
+            counts[row['status']] = row['count']
+        counts['exhausted'] = ScrapeCheckpoint.objects.filter(attempts__gte=self.max_attempts).count()
+        return counts
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+_checkpoints = None
+
+
+def get_scrape_checkpoints():
+    """Return the process-wide scrape checkpoint store."""
+    global _checkpoints
+    if _checkpoints is None:
+        _checkpoints = ScrapeCheckpoints()
+        get_metrics().register_stats('scrape_checkpoints', _checkpoints.stats)
+    return _checkpoints
@@ -5,6 +5,7 @@ import logging
 from datetime import datetime
 from dotenv import load_dotenv
 from api.models import RTCData, RTCDocument
+from metrics import traced
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
@@ -22,6 +23,7 @@ class DBHandler:
         self.connect()
         self.initialize_db()
 
+    @traced('db.connect')
     def connect(self):
         """Establish database connection"""
         try:
@@ -80,6 +82,7 @@ class DBHandler:
         if self.conn is None or self.conn.closed:
             self.connect()
 
+    @traced('db.insert_property')
     def insert_property(self, property_data):
         """Insert property details and return property_id"""
         self.ensure_connection()
@@ -106,6 +109,7 @@ class DBHandler:
             logger.error(f"Error inserting property: {str(e)}")
             raise
 
+    @traced('db.insert_document')
     def insert_document(self, property_id, document_data):
         """Insert RTC document details and screenshot path"""
         self.ensure_connection()
@@ -131,6 +135,7 @@ class DBHandler:
             logger.error(f"Error inserting document: {str(e)}")
             raise
 
+    @traced('db.get_property_documents')
     def get_property_documents(self, property_id):
         """Retrieve all documents for a given property"""
         self.ensure_connection()
@@ -148,6 +153,7 @@ class DBHandler:
             logger.error(f"Error getting property documents: {str(e)}")
             raise
 
+    @traced('db.get_document_by_id')
     def get_document_by_id(self, document_id):
         """Retrieve a specific document by its ID"""
         self.ensure_connection()
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -143,6 +144,22 @@ CORS_ALLOW_CREDENTIALS = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Background job queue (run workers with `python manage.py run_workers`)
+SCRAPE_WORKER_CONCURRENCY = int(os.getenv('SCRAPE_WORKER_CONCURRENCY', '2'))
+SCRAPE_JOB_POLL_INTERVAL = float(os.getenv('SCRAPE_JOB_POLL_INTERVAL', '1.0'))
+SCRAPE_JOB_STALE_SECONDS = int(os.getenv('SCRAPE_JOB_STALE_SECONDS', '1800'))
+SCRAPE_JOB_MAX_ATTEMPTS = int(os.getenv('SCRAPE_JOB_MAX_ATTEMPTS', '2'))
+# Job progress stream (/api/jobs/<id>/events/): how often it checks for new events,
+# and the idle seconds between keep-alive comments
+SCRAPE_EVENTS_POLL_INTERVAL = float(os.getenv('SCRAPE_EVENTS_POLL_INTERVAL', '0.5'))
+SCRAPE_EVENTS_HEARTBEAT = float(os.getenv('SCRAPE_EVENTS_HEARTBEAT', '15'))
+
+# Metrics: each job worker serves its own /metrics on this port plus its index (0 disables)
+SCRAPE_WORKER_METRICS_PORT = int(os.getenv('SCRAPE_WORKER_METRICS_PORT', '0'))
+
+# Batch processing: vision extractions in flight at once
+BATCH_EXTRACTION_CONCURRENCY = int(os.getenv('BATCH_EXTRACTION_CONCURRENCY', '4'))
+
 # CORS Configuration
 CORS_ALLOW_METHODS = [
     'DELETE',
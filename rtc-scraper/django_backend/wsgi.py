@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_backend.settings')
 
 application = get_wsgi_application()
+
+# Scrapes run in this process too (batches); start the browser before the first one
+from browser_pool import prewarm_browser_pool  # noqa: E402
+
+prewarm_browser_pool()
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from PIL import Image
+
+logger = logging.getLogger('ExtractionCache')
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'extraction.sqlite3')
+
+# Bump when the shape of the cached result changes
+CACHE_SCHEMA_VERSION = '1'
+
+_HASH_MASK = (1 << 64) - 1
+
+# The top of an RTC holds its identifiers (village, survey and hissa number);
+# the rest is the same printed form for every property
+HEADER_FRACTION = 0.25
+HEADER_SIZE = (160, 40)
+# Grey levels a header pixel may differ by: re-encoding moves them by a few,
+# a changed digit by far more
+HEADER_TOLERANCE = 16
+
+
+def content_hash(image_path: str) -> str:
+    """SHA-256 of the file contents."""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def perceptual_hash(image_path: str) -> int:
+    """64-bit difference hash (dHash); near-identical scans differ in only a few bits."""
+    with Image.open(image_path) as image:
+        pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def header_thumbnail(image_path: str) -> bytes:
+    """Greyscale thumbnail of the header band, fine enough to show the identifiers the page hash averages away."""
+    with Image.open(image_path) as image:
+        width, height = image.size
+        header = image.convert('L').crop((0, 0, width, max(1, int(height * HEADER_FRACTION))))
+        return header.resize(HEADER_SIZE, Image.BOX).tobytes()
+
+
+def same_header(first: bytes, second: bytes) -> bool:
+    """True if no header pixel differs by more than HEADER_TOLERANCE once brightness is evened out."""
+    if len(first) != len(second):
+        return False
+    shift = (sum(first) - sum(second)) / len(first)
+    return all(abs(a - b - shift) <= HEADER_TOLERANCE for a, b in zip(first, second))
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def cache_version(*parts: str) -> str:
+    """Version key derived from everything that affects the extraction result."""
+    digest = hashlib.sha256(CACHE_SCHEMA_VERSION.encode('utf-8'))
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(part.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class ExtractionCache:
+    """
+    Persistent cache of post-processed vision extraction results.
+
+    Entries are keyed by the SHA-256 of the image bytes and tagged with a
+    version derived from the model and prompts, so changing either silently
+    invalidates old entries. The least recently used entries are evicted
+    beyond `max_entries`.
+
+    Near-duplicate matching is opt-in (`phash_distance`, 0 by default). Every
+    RTC is printed on the same form, so whole-page hashes of different
+    properties can be 0 bits apart; a near match is therefore only reused if
+    a thumbnail of the header band holding the identifiers matches too.
+    """
+
+    def __init__(self, version: str, path: Optional[str] = None, max_entries: Optional[int] = None,
+                 phash_distance: Optional[int] = None):
+        self.version = version
+        self.path = path or os.getenv('EXTRACTION_CACHE_PATH', DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries or int(os.getenv('EXTRACTION_CACHE_MAX_ENTRIES', '10000'))
+        self.phash_distance = (
+            phash_distance if phash_distance is not None
+            else int(os.getenv('EXTRACTION_CACHE_PHASH_DISTANCE', '0'))
+        )
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'near_hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS extractions (
+                    content_hash TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    phash INTEGER,
+                    header BLOB,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL,
+                    PRIMARY KEY (content_hash, version)
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(extractions)")]
+            if 'header' not in columns:
+                # Entries stored before header confirmation can't near-match until stored again
+                conn.execute("ALTER TABLE extractions ADD COLUMN header BLOB")
+            conn.execute("CREATE INDEX IF NOT EXISTS extractions_lru ON extractions (last_accessed)")
+            # Entries from older prompt or model versions can never be hit again
+            conn.execute("DELETE FROM extractions WHERE version != ?", (self.version,))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _count(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def get(self, image_path: str) -> Optional[Dict[str, str]]:
+        """Return the cached result for an identical (or near-identical) image, or None."""
+        try:
+            key = content_hash(image_path)
+            now = time.time()
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT result FROM extractions WHERE content_hash = ? AND version = ?",
+                    (key, self.version)
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE extractions SET last_accessed = ? WHERE content_hash = ? AND version = ?",
+                        (now, key, self.version)
+                    )
+                    self._count('hits')
+                    return json.loads(row[0])
+
+                if self.phash_distance > 0:
+                    phash = perceptual_hash(image_path)
+                    header = None
+                    best = None
+                    for stored_key, stored_phash, stored_header, result in conn.execute(
+                        "SELECT content_hash, phash, header, result FROM extractions "
+                        "WHERE version = ? AND phash IS NOT NULL AND header IS NOT NULL",
+                        (self.version,)
+                    ):
+                        distance = bin((phash ^ stored_phash) & _HASH_MASK).count('1')
+                        if distance > self.phash_distance or (best is not None and distance >= best[0]):
+                            continue
+                        header = header or header_thumbnail(image_path)
+                        if not same_header(header, stored_header):
+                            continue
+                        best = (distance, stored_key, result)
+                    if best:
+                        conn.execute(
+                            "UPDATE extractions SET last_accessed = ? WHERE content_hash = ? AND version = ?",
+                            (now, best[1], self.version)
+                        )
+                        logger.info(f"Near-duplicate match for {image_path} ({best[0]} bits apart)")
+                        self._count('near_hits')
+                        return json.loads(best[2])
+        except Exception as e:
+            logger.warning(f"Extraction cache lookup failed: {str(e)}")
+        self._count('misses')
+        return None
+
+    def put(self, image_path: str, result: Dict[str, str]):
+        """Store a post-processed result and evict the least recently used overflow."""
+        try:
+            key = content_hash(image_path)
+            phash = _to_signed(perceptual_hash(image_path)) if self.phash_distance > 0 else None
+            header = header_thumbnail(image_path) if self.phash_distance > 0 else None
+            now = time.time()
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO extractions "
+                    "(content_hash, version, phash, header, result, created_at, last_accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, self.version, phash, header, json.dumps(result), now, now)
+                )
+                evicted = conn.execute("""
+                    DELETE FROM extractions WHERE rowid IN (
+                        SELECT rowid FROM extractions ORDER BY last_accessed DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,)).rowcount
+            if evicted:
+                with self._lock:
+                    self._stats['evictions'] += evicted
+        except Exception as e:
+            logger.warning(f"Extraction cache store failed: {str(e)}")
+
+    def stats(self):
+        """Hit, near-duplicate hit and miss counters for this process."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['near_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['near_hits']) / lookups if lookups else 0.0
+        return stats
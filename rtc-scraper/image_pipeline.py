@@ -0,0 +1,169 @@
+import io
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from PIL import Image, ImageOps
+from metrics import get_metrics
+
+logger = logging.getLogger('ImagePipeline')
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+def estimate_skew(image: Image.Image, max_angle: float = 5.0, step: float = 0.5) -> float:
+    """
+    Estimate the skew angle (degrees) of a scanned page with a projection profile.
+
+    Text lines are sharpest, so row darkness varies the most, when the page is
+    level. Each candidate rotation is squashed to a single column with a box
+    filter, which yields the row means without any per-pixel Python work.
+    """
+    small = image.convert('L')
+    small.thumbnail((800, 800))
+    # Dark text on white: invert so ink counts as signal
+    small = ImageOps.invert(small)
+    best_angle, best_score = 0.0, -1.0
+    steps = int(max_angle / step)
+    for i in range(-steps, steps + 1):
+        angle = i * step
+        rotated = small.rotate(angle, resample=Image.BILINEAR, fillcolor=0)
+        rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        score = sum((row - mean) ** 2 for row in rows)
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+class ImagePipeline:
+    """
+    Shrinks an RTC upload before it is sent to the vision API.
+
+    Stages, each configurable: deskew, crop to the header region (survey
+    number, hissa and the village/hobli/taluk/district block), downsize so the
+    longest side is at most `max_dimension`, grayscale, and re-encode to a
+    compact format.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, deskew: Optional[bool] = None,
+                 crop_header: Optional[bool] = None, header_fraction: Optional[float] = None,
+                 max_dimension: Optional[int] = None, grayscale: Optional[bool] = None,
+                 output_format: Optional[str] = None, quality: Optional[int] = None):
+        self.enabled = enabled if enabled is not None else _env_flag('IMAGE_PIPELINE_ENABLED', 'true')
+        self.deskew = deskew if deskew is not None else _env_flag('IMAGE_PIPELINE_DESKEW', 'true')
+        self.crop_header = crop_header if crop_header is not None else _env_flag('IMAGE_PIPELINE_CROP_HEADER', 'false')
+        self.header_fraction = header_fraction or float(os.getenv('IMAGE_PIPELINE_HEADER_FRACTION', '0.35'))
+        self.max_dimension = max_dimension or int(os.getenv('IMAGE_PIPELINE_MAX_DIMENSION', '1600'))
+        self.grayscale = grayscale if grayscale is not None else _env_flag('IMAGE_PIPELINE_GRAYSCALE', 'true')
+        self.output_format = (output_format or os.getenv('IMAGE_PIPELINE_FORMAT', 'JPEG')).upper()
+        self.quality = quality or int(os.getenv('IMAGE_PIPELINE_QUALITY', '80'))
+        if self.output_format not in MIME_TYPES:
+            raise ValueError(f"Unsupported output format: {self.output_format}")
+        self._lock = threading.Lock()
+        self._stats = {
+            'images': 0,
+            'failures': 0,
+            'bytes_in': 0,
+            'bytes_out': 0,
+            'seconds_total': 0.0,
+        }
+
+    def signature(self) -> str:
+        """Settings that change what the vision model sees; used to version cached extractions."""
+        if not self.enabled:
+            return 'raw'
+        return (
+            f"deskew={self.deskew};crop={self.crop_header}:{self.header_fraction};"
+            f"max={self.max_dimension};gray={self.grayscale};"
+            f"fmt={self.output_format}:{self.quality}"
+        )
+
+    def process(self, image_path: str) -> Tuple[bytes, str, Dict[str, float]]:
+        """Return (encoded bytes, mime type, per-image stats) for the image at `image_path`."""
+        started = time.monotonic()
+        original_size = os.path.getsize(image_path)
+        stages = []
+
+        with Image.open(image_path) as source:
+            image = ImageOps.exif_transpose(source)
+            if self.grayscale:
+                # Convert first so every later stage works on a single channel
+                image = image.convert('L')
+                stages.append('grayscale')
+            elif image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            if self.deskew:
+                angle = estimate_skew(image)
+                if angle:
+                    fill = 255 if image.mode == 'L' else (255, 255, 255)
+                    image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+                    stages.append(f'deskew({angle})')
+
+            if self.crop_header:
+                image = image.crop((0, 0, image.width, max(1, int(image.height * self.header_fraction))))
+                stages.append('crop_header')
+
+            if max(image.size) > self.max_dimension:
+                image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+                stages.append('downsize')
+
+            buffer = io.BytesIO()
+            save_options = {'optimize': True}
+            if self.output_format in ('JPEG', 'WEBP'):
+                save_options['quality'] = self.quality
+            image.save(buffer, format=self.output_format, **save_options)
+            data = buffer.getvalue()
+
+        elapsed = time.monotonic() - started
+        stats = {
+            'bytes_in': original_size,
+            'bytes_out': len(data),
+            'bytes_saved': original_size - len(data),
+            'seconds': elapsed,
+            'stages': stages,
+        }
+        with self._lock:
+            self._stats['images'] += 1
+            self._stats['bytes_in'] += original_size
+            self._stats['bytes_out'] += len(data)
+            self._stats['seconds_total'] += elapsed
+        logger.info(
+            f"Pre-processed {os.path.basename(image_path)}: {original_size} -> {len(data)} bytes "
+            f"in {elapsed * 1000:.0f} ms ({', '.join(stages) or 'encode only'})"
+        )
+        return data, MIME_TYPES[self.output_format], stats
+
+    def record_failure(self):
+        with self._lock:
+            self._stats['failures'] += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Totals across every processed image, including bytes saved."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+        stats['seconds_avg'] = stats['seconds_total'] / stats['images'] if stats['images'] else 0.0
+        return stats
+
+
+_pipeline = None
+
+
+def get_image_pipeline() -> ImagePipeline:
+    """Return the process-wide pipeline built from the IMAGE_PIPELINE_* settings."""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = ImagePipeline()
+        get_metrics().register_stats('image_pipeline', _pipeline.stats)
+    return _pipeline
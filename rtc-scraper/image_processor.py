@@ -1,38 +1,26 @@
 import os
-from openai import OpenAI
+import asyncio
+import logging
 from dotenv import load_dotenv
 import base64
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 import json
+import mimetypes
+from extraction_cache import ExtractionCache, cache_version
+from image_pipeline import ImagePipeline, get_image_pipeline
+from openai_client import AsyncVisionClient, get_vision_client
+from local_ocr import LocalHeaderOCR, get_local_ocr
+from async_runtime import run_coroutine
+from metrics import get_metrics, span, traced
+
+logger = logging.getLogger('ImageProcessor')
 
 # Load environment variables from parent directory
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
-class ImageProcessor:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
-    def encode_image(self, image_path: str) -> str:
-        """Encode image to base64 string."""
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-    
-    def extract_info_from_image(self, image_path: str) -> Optional[Dict[str, str]]:
-        """
-        Extract information from image using OpenAI's vision API.
-        Returns a dictionary with the required fields or None if extraction fails.
-        """
-        try:
-            # Encode the image
-            base64_image = self.encode_image(image_path)
-            
-            # Call OpenAI's vision API
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are an expert at reading Kannada RTC (Village Account Form) documents. 
+MODEL = "gpt-4-turbo"
+
+SYSTEM_PROMPT = """You are an expert at reading Kannada RTC (Village Account Form) documents. 
             Your task is to extract specific fields from the document.
 
             FIELD LOCATIONS:
@@ -80,13 +68,8 @@ class ImageProcessor:
                 "Taluk": "name",
                 "District": "name"
             }"""
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": """Please analyze this RTC document and extract the following information:
+
+USER_PROMPT = """Please analyze this RTC document and extract the following information:
             1. Survey Number (look for numbers in top-left)
             2. Hissa (look for numbers near Survey Number)
             3. Village (translate from Kannada)
@@ -95,11 +78,132 @@ class ImageProcessor:
             6. District (translate from Kannada)
 
             Return the information in JSON format."""
+
+_extraction_cache = None
+
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """Process-wide extraction cache, or None if EXTRACTION_CACHE_ENABLED is off."""
+    global _extraction_cache
+    if os.getenv('EXTRACTION_CACHE_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return None
+    if _extraction_cache is None:
+        # Any change to the model, prompts or pre-processing invalidates previously cached results
+        _extraction_cache = ExtractionCache(
+            version=cache_version(MODEL, SYSTEM_PROMPT, USER_PROMPT, get_image_pipeline().signature())
+        )
+        get_metrics().register_stats('extraction_cache', _extraction_cache.stats)
+    return _extraction_cache
+
+
+def _count_extraction(source):
+    get_metrics().counter(
+        'rtc_extractions_total', 'Image extractions by where the result came from', ['source']
+    ).inc(source=source)
+
+
+class ImageProcessor:
+    def __init__(self, cache: Optional[ExtractionCache] = None, pipeline: Optional[ImagePipeline] = None,
+                 client: Optional[AsyncVisionClient] = None, local_ocr: Optional[LocalHeaderOCR] = None):
+        self.cache = cache or get_extraction_cache()
+        self.pipeline = pipeline or get_image_pipeline()
+        self._client = client
+        self.local_ocr = local_ocr or get_local_ocr()
+    
+    @property
+    def client(self) -> AsyncVisionClient:
+        # Resolved lazily so the shared client is created on the background loop
+        return self._client or get_vision_client()
+        
+    def encode_image(self, image_path: str) -> str:
+        """Encode image to base64 string."""
+        with open(image_path, "rb") as image_file:
+            return base64.b64encode(image_file.read()).decode('utf-8')
+    
+    def prepare_image(self, image_path: str) -> Tuple[str, str]:
+        """
+        Run the pre-processing pipeline and return (base64 payload, mime type).
+        Falls back to the raw file if the pipeline is disabled or cannot read the image.
+        """
+        if self.pipeline.enabled:
+            try:
+                data, mime_type, _ = self.pipeline.process(image_path)
+                return base64.b64encode(data).decode('utf-8'), mime_type
+            except Exception as e:
+                self.pipeline.record_failure()
+                logger.warning(f"Image pre-processing failed, sending original: {str(e)}")
+        mime_type = mimetypes.guess_type(image_path)[0] or 'image/png'
+        return self.encode_image(image_path), mime_type
+    
+    def extract_info_from_image(self, image_path: str) -> Optional[Dict[str, str]]:
+        """
+        Synchronous wrapper around `extract_info_from_image_async`, run on the
+        shared background loop. Must not be called from that loop itself.
+        """
+        return run_coroutine(self.extract_info_from_image_async(image_path))
+    
+    @traced('extraction')
+    async def extract_info_from_image_async(self, image_path: str) -> Optional[Dict[str, str]]:
+        """
+        Extract information from image, reusing the cached result for an
+        identical or near-identical image, then trying local header OCR, before
+        calling the vision API.
+        Returns a dictionary with the required fields or None if extraction fails.
+        """
+        if self.cache:
+            with span('extraction.cache_lookup'):
+                cached = await asyncio.to_thread(self.cache.get, image_path)
+            if cached:
+                _count_extraction('cache')
+                return cached
+        
+        result = None
+        if self.local_ocr.available:
+            with span('extraction.local_ocr'):
+                local = await asyncio.to_thread(self.local_ocr.extract, image_path)
+            if local:
+                result = self.post_process_results({
+                    field: local[field]
+                    for field in ("Survey Number", "Surnoc", "Hissa", "Village", "Hobli", "Taluk", "District")
+                })
+                _count_extraction('local_ocr')
+        if result is None:
+            result = await self._extract_with_vision(image_path)
+            _count_extraction('vision' if result else 'failed')
+        if result and self.cache:
+            await asyncio.to_thread(self.cache.put, image_path, result)
+        return result
+    
+    async def _extract_with_vision(self, image_path: str) -> Optional[Dict[str, str]]:
+        """
+        Extract information from image using OpenAI's vision API.
+        Returns a dictionary with the required fields or None if extraction fails.
+        """
+        try:
+            # Shrink and encode the image off the event loop
+            with span('extraction.encode_image'):
+                base64_image, mime_type = await asyncio.to_thread(self.prepare_image, image_path)
+            
+            # Call OpenAI's vision API; its duration is the extraction.vision_request stage
+            logger.info(f"Sending a {len(base64_image)} byte {mime_type} payload to the vision API")
+            response = await self.client.create_chat_completion(
+                model=MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": USER_PROMPT
                             },
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}",
+                                    "url": f"data:{mime_type};base64,{base64_image}",
                                     "detail": "high"
                                 }
                             }
@@ -0,0 +1,214 @@
+import difflib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, ImageOps
+from metrics import get_metrics
+
+try:
+    import pytesseract
+except ImportError:  # Optional: without it every extraction goes to the vision API
+    pytesseract = None
+
+logger = logging.getLogger('LocalOCR')
+
+# Kannada place names as they appear on RTC headers, mapped to the English
+# spelling the portal uses. Extend with LOCAL_OCR_GAZETTEER_PATH (a JSON object).
+GAZETTEER = {
+    'ದೇವನಹಳ್ಳಿ': 'Devanahalli',
+    'ಕಸಬಾ': 'Kasaba',
+    'ಕಸಬ': 'Kasaba',
+    'ಬೆಂಗಳೂರು ಗ್ರಾಮಾಂತರ': 'Bangalore Rural',
+    'ಬೆಂಗಳೂರು ನಗರ': 'Bangalore Urban',
+    'ಬೆಂಗಳೂರು': 'Bangalore',
+    'ದೊಡ್ಡಬಳ್ಳಾಪುರ': 'Doddaballapura',
+    'ಹೊಸಕೋಟೆ': 'Hosakote',
+    'ನೆಲಮಂಗಲ': 'Nelamangala',
+    'ಆನೇಕಲ್': 'Anekal',
+    'ಯಲಹಂಕ': 'Yelahanka',
+    'ಕೆ.ಆರ್.ಪುರಂ': 'K R Puram',
+    'ವಿಜಯಪುರ': 'Vijayapura',
+    'ಚನ್ನರಾಯಪಟ್ಟಣ': 'Channarayapatna',
+    'ಕುಂದಾಣ': 'Kundana',
+}
+
+KANNADA_DIGITS = str.maketrans('೦೧೨೩೪೫೬೭೮೯', '0123456789')
+
+# Header labels, with the common spelling variants Tesseract produces
+FIELD_LABELS = {
+    'Survey Number': r'ಸರ್ವೆ\s*(?:ಸಂಖ್ಯೆ|ನಂಬರ್|ನಂ)',
+    'Hissa': r'ಹಿಸ್ಸಾ\s*ಸಂಖ್ಯೆ|ಹಿಸ್ಸಾ',
+    'Village': r'ಗ್ರಾಮದ\s*ಹೆಸರು|ಗ್ರಾಮ',
+    'Hobli': r'ಹೋಬಳಿ',
+    'Taluk': r'ತಾಲ್ಲೂಕು|ತಾಲೂಕು',
+    'District': r'ಜಿಲ್ಲೆ',
+}
+# A label must not run on into more Kannada letters (ಗ್ರಾಮ inside ಗ್ರಾಮಾಂತರ is not a label)
+_LABEL_PATTERN = re.compile('|'.join(
+    f'(?P<f{i}>(?:{pattern})(?![\u0C80-\u0CFF]))' for i, pattern in enumerate(FIELD_LABELS.values())
+))
+_FIELD_NAMES = list(FIELD_LABELS)
+PLACE_FIELDS = ('Village', 'Hobli', 'Taluk', 'District')
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+def load_gazetteer(path: Optional[str] = None) -> Dict[str, str]:
+    """The built-in gazetteer plus any entries from LOCAL_OCR_GAZETTEER_PATH."""
+    gazetteer = dict(GAZETTEER)
+    path = path or os.getenv('LOCAL_OCR_GAZETTEER_PATH')
+    if path:
+        try:
+            with open(path, encoding='utf-8') as gazetteer_file:
+                gazetteer.update(json.load(gazetteer_file))
+        except Exception as e:
+            logger.warning(f"Could not load gazetteer {path}: {str(e)}")
+    return gazetteer
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.replace(':', ' ').replace('|', ' ').split())
+
+
+class LocalHeaderOCR:
+    """
+    Offline extractor for the RTC header fields.
+
+    Runs Tesseract (Kannada + English) on the header crop, reads the value
+    after each label, and translates place names through the gazetteer. A
+    result is only returned when every field was found, every place name
+    resolved, and the weakest word confidence is at least `min_confidence`;
+    otherwise the caller falls back to the vision API.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, lang: Optional[str] = None,
+                 min_confidence: Optional[float] = None, header_fraction: Optional[float] = None,
+                 gazetteer: Optional[Dict[str, str]] = None):
+        self.enabled = enabled if enabled is not None else _env_flag('LOCAL_OCR_ENABLED', 'true')
+        self.lang = lang or os.getenv('LOCAL_OCR_LANG', 'kan+eng')
+        self.min_confidence = min_confidence or float(os.getenv('LOCAL_OCR_MIN_CONFIDENCE', '80'))
+        self.header_fraction = header_fraction or float(os.getenv('IMAGE_PIPELINE_HEADER_FRACTION', '0.35'))
+        self.gazetteer = gazetteer if gazetteer is not None else load_gazetteer()
+        self._lock = threading.Lock()
+        self._stats = {'attempts': 0, 'accepted': 0, 'low_confidence': 0, 'unresolved': 0, 'errors': 0, 'seconds_total': 0.0}
+
+    @property
+    def available(self) -> bool:
+        """True if local OCR is enabled and Tesseract is installed."""
+        return self.enabled and pytesseract is not None and shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
+    def _count(self, outcome: str, elapsed: float):
+        with self._lock:
+            self._stats['attempts'] += 1
+            self._stats[outcome] += 1
+            self._stats['seconds_total'] += elapsed
+
+    def _header_lines(self, image_path: str) -> List[Tuple[str, float]]:
+        """OCR the header crop and return (text, min word confidence) per line."""
+        with Image.open(image_path) as source:
+            image = ImageOps.exif_transpose(source).convert('L')
+            image = image.crop((0, 0, image.width, max(1, int(image.height * self.header_fraction))))
+            if image.width < 1600:
+                # Tesseract reads Kannada conjuncts much better at ~300 dpi
+                scale = 1600 / image.width
+                image = image.resize((1600, int(image.height * scale)), Image.LANCZOS)
+            data = pytesseract.image_to_data(image, lang=self.lang, output_type=pytesseract.Output.DICT)
+
+        lines = {}
+        for i, word in enumerate(data['text']):
+            confidence = float(data['conf'][i])
+            if not word.strip() or confidence < 0:
+                continue
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            lines.setdefault(key, []).append((word, confidence))
+        return [
+            (' '.join(word for word, _ in words), min(confidence for _, confidence in words))
+            for _, words in sorted(lines.items())
+        ]
+
+    def _resolve_place(self, text: str) -> Optional[str]:
+        text = _normalize(text)
+        if not text:
+            return None
+        if text in self.gazetteer:
+            return self.gazetteer[text]
+        if re.fullmatch(r'[A-Za-z .]+', text):
+            return text.title()
+        # Tolerate a dropped or misread vowel sign
+        match = difflib.get_close_matches(text, self.gazetteer.keys(), n=1, cutoff=0.8)
+        return self.gazetteer[match[0]] if match else None
+
+    def parse(self, lines: List[Tuple[str, float]]) -> Tuple[Dict[str, str], float]:
+        """Map OCR lines to extraction fields; returns (fields, weakest confidence used)."""
+        found = {}
+        confidence = 100.0
+        for text, line_confidence in lines:
+            labels = list(_LABEL_PATTERN.finditer(text))
+            for position, label in enumerate(labels):
+                field = _FIELD_NAMES[int(label.lastgroup[1:])]
+                if field in found:
+                    continue
+                end = labels[position + 1].start() if position + 1 < len(labels) else len(text)
+                value = text[label.end():end]
+                if field in PLACE_FIELDS:
+                    resolved = self._resolve_place(value)
+                else:
+                    digits = re.search(r'\d+', value.translate(KANNADA_DIGITS))
+                    resolved = digits.group(0) if digits else None
+                if resolved:
+                    found[field] = resolved
+                    confidence = min(confidence, line_confidence)
+        return found, confidence
+
+    def extract(self, image_path: str) -> Optional[Dict[str, str]]:
+        """Return the header fields if they were read confidently, else None."""
+        started = time.monotonic()
+        try:
+            lines = self._header_lines(image_path)
+        except Exception as e:
+            logger.warning(f"Local OCR failed for {os.path.basename(image_path)}: {str(e)}")
+            self._count('errors', time.monotonic() - started)
+            return None
+
+        found, confidence = self.parse(lines)
+        elapsed = time.monotonic() - started
+        missing = [field for field in FIELD_LABELS if field not in found]
+        if missing:
+            logger.info(f"Local OCR could not resolve {', '.join(missing)}; falling back")
+            self._count('unresolved', elapsed)
+            return None
+        if confidence < self.min_confidence:
+            logger.info(f"Local OCR confidence {confidence:.0f} below {self.min_confidence:.0f}; falling back")
+            self._count('low_confidence', elapsed)
+            return None
+
+        self._count('accepted', elapsed)
+        logger.info(f"Local OCR read {os.path.basename(image_path)} in {elapsed * 1000:.0f} ms (confidence {confidence:.0f})")
+        return {**found, 'Surnoc': '*'}
+
+    def stats(self) -> Dict[str, float]:
+        """Attempt outcomes and the share of extractions served locally."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['accept_rate'] = stats['accepted'] / stats['attempts'] if stats['attempts'] else 0.0
+        stats['seconds_avg'] = stats['seconds_total'] / stats['attempts'] if stats['attempts'] else 0.0
+        return stats
+
+
+_ocr = None
+
+
+def get_local_ocr() -> LocalHeaderOCR:
+    """Return the process-wide header OCR built from the LOCAL_OCR_* settings."""
+    global _ocr
+    if _ocr is None:
+        _ocr = LocalHeaderOCR()
+        get_metrics().register_stats('local_ocr', _ocr.stats)
+    return _ocr
@@ -0,0 +1,141 @@
+import difflib
+import logging
+import os
+import re
+from django.db import transaction
+from django.utils import timezone
+from api.models import Location
+
+logger = logging.getLogger('LocationResolver')
+
+# Cascade order on the portal, with the property_data key for each level
+LEVELS = [
+    (Location.LEVEL_DISTRICT, 'district'),
+    (Location.LEVEL_TALUK, 'taluk'),
+    (Location.LEVEL_HOBLI, 'hobli'),
+    (Location.LEVEL_VILLAGE, 'village'),
+]
+
+# Spelling variants between the vision model's transliteration and the portal's
+_VARIANTS = [
+    (r'bengaluru', 'bangalore'),
+    (r'mysuru', 'mysore'),
+    (r'kasba', 'kasaba'),
+    (r'ee', 'i'),
+    (r'oo', 'u'),
+    (r'([aeiou])\1', r'\1'),
+    (r'([bcdgjkpt])h', r'\1'),
+    (r'w', 'v'),
+]
+
+
+def normalize_place_name(name):
+    """Lowercase, strip punctuation and fold common transliteration variants."""
+    name = re.sub(r'[^a-z ]', ' ', (name or '').lower())
+    name = ' '.join(name.split())
+    for pattern, replacement in _VARIANTS:
+        name = re.sub(pattern, replacement, name)
+    return name
+
+
+def match_option(options, name, cutoff=None):
+    """
+    Return the [{'value', 'text'}] option whose text best matches `name`, or None.
+    An exact normalized match wins; otherwise the closest name above `cutoff`.
+    """
+    cutoff = cutoff or float(os.getenv('LOCATION_MATCH_CUTOFF', '0.75'))
+    wanted = normalize_place_name(name)
+    if not wanted or wanted == 'na':
+        return None
+    by_name = {}
+    for option in options:
+        by_name.setdefault(normalize_place_name(option['text']), option)
+    if wanted in by_name:
+        return by_name[wanted]
+    close = difflib.get_close_matches(wanted, by_name.keys(), n=1, cutoff=cutoff)
+    return by_name[close[0]] if close else None
+
+
+class LocationResolver:
+    """
+    Resolves the district/taluk/hobli/village names in property_data to portal
+    dropdown codes using the locally stored gazetteer (see the crawl_gazetteer
+    command). Options read live during a scrape are recorded too, so the
+    gazetteer fills in incrementally even without a full crawl.
+    """
+
+    def __init__(self, cutoff=None):
+        self.cutoff = cutoff or float(os.getenv('LOCATION_MATCH_CUTOFF', '0.75'))
+
+    def _match(self, level, parent_id, name):
+        siblings = Location.objects.filter(level=level, parent_id=parent_id)
+        exact = siblings.filter(normalized_name=normalize_place_name(name)).first()
+        if exact:
+            return {'value': exact.code, 'text': exact.name, 'id': exact.id}
+        return match_option([
+            {'value': code, 'text': location_name, 'id': location_id}
+            for location_id, code, location_name in siblings.values_list('id', 'code', 'name')
+        ], name, self.cutoff)
+
+    def resolve(self, property_data):
+        """
+        Return {'district': code, 'taluk': code, 'hobli': code, 'village': code}.
+        Levels below the first one that can't be resolved from the gazetteer are None.
+        """
+        codes = {key: None for _, key in LEVELS}
+        parent_id = None
+        for level, key in LEVELS:
+            option = self._match(level, parent_id, property_data.get(key))
+            if option is None:
+                logger.info(f"No gazetteer match for {level} '{property_data.get(key)}'")
+                break
+            codes[key] = option['value']
+            parent_id = option['id']
+        return codes
+
+    def _parent(self, parent_codes):
+        """The stored Location for a chain of ancestor codes, e.g. ['21', '3']."""
+        parent = None
+        for (level, _), code in zip(LEVELS, parent_codes):
+            parent = Location.objects.filter(level=level, parent=parent, code=code).first()
+            if parent is None:
+                return None
+        return parent
+
+    def record(self, parent_codes, options):
+        """Store the dropdown options read below the given ancestor codes."""
+        level = LEVELS[len(parent_codes)][0]
+        with transaction.atomic():
+            parent = self._parent(parent_codes) if parent_codes else None
+            if parent_codes and parent is None:
+                return
+            for option in options:
+                Location.objects.update_or_create(
+                    level=level,
+                    parent=parent,
+                    code=option['value'],
+                    defaults={'name': option['text'], 'normalized_name': normalize_place_name(option['text'])},
+                )
+
+    def mark_crawled(self, parent_codes):
+        """Record that everything below these ancestor codes has just been crawled."""
+        parent = self._parent(parent_codes)
+        if parent is not None:
+            parent.children_crawled_at = timezone.now()
+            parent.save(update_fields=['children_crawled_at'])
+
+    def crawled_at(self, parent_codes):
+        """When the children below these ancestor codes were last crawled, or None."""
+        parent = self._parent(parent_codes)
+        return parent.children_crawled_at if parent else None
+
+
+_resolver = None
+
+
+def get_location_resolver():
+    """Return the process-wide location resolver."""
+    global _resolver
+    if _resolver is None:
+        _resolver = LocationResolver()
+    return _resolver
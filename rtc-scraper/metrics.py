@@ -0,0 +1,305 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('Metrics')
+
+# Upper bounds in seconds; stages range from a cache lookup to a whole scrape
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Cumulative latency histogram per label set, in Prometheus' bucket layout."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            state = self._values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += seconds
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: {**state, 'buckets': list(state['buckets'])} for key, state in self._values.items()}
+        for key, state in sorted(values.items()):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['buckets']):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (('le', _format_value(bound)),), cumulative
+            yield f"{self.name}_sum", labels, state['sum']
+            yield f"{self.name}_count", labels, state['count']
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms, plus the stats() snapshots of the
+    long-lived components (browser pool, caches, storage, ...) exported as
+    gauges. Rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.stage_seconds = self.histogram(
+            'rtc_stage_duration_seconds', 'Time spent in each pipeline stage', ['stage']
+        )
+        self.stage_errors = self.counter(
+            'rtc_stage_errors_total', 'Pipeline stages that raised', ['stage']
+        )
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_stats(self, component, stats):
+        """Export the numeric values of `stats()` as rtc_<component>_<key> gauges."""
+        with self._lock:
+            self._stats[component] = stats
+
+    def _stats_lines(self):
+        with self._lock:
+            components = dict(self._stats)
+        for component, stats in sorted(components.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Could not collect {component} stats: {str(e)}")
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"rtc_{component}_{key}"
+                yield f"# TYPE {name} {'counter' if key.endswith('_total') else 'gauge'}"
+                yield f"{name} {_format_value(value)}"
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        lines.extend(self._stats_lines())
+        return '\n'.join(lines) + '\n'
+
+
+class SpanExporter:
+    """
+    Appends finished spans as JSON lines, one OpenTelemetry-style record per
+    span (trace/span/parent ids, name, start/end in unix nanoseconds,
+    attributes, status), for offline inspection or a collector's file receiver.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, record):
+        line = json.dumps(record, default=str)
+        try:
+            with self._lock, open(self.path, 'a', encoding='utf-8') as spans_file:
+                spans_file.write(line + '\n')
+        except OSError as e:
+            logger.warning(f"Could not export span to {self.path}: {str(e)}")
+
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a pipeline stage: records it in rtc_stage_duration_seconds and, when
+    METRICS_SPANS_PATH is set, exports it as a span nested under the
+    enclosing one. Context variables carry the parent across awaits and threads.
+    """
+    parent = _current_span.get()
+    current = {
+        'trace_id': parent['trace_id'] if parent else secrets.token_hex(16),
+        'span_id': secrets.token_hex(8),
+        'parent_span_id': parent['span_id'] if parent else None,
+        'name': name,
+        'attributes': attributes,
+    }
+    token = _current_span.set(current)
+    start_ns = time.time_ns()
+    started = time.monotonic()
+    status = 'OK'
+    try:
+        yield current
+    except BaseException:
+        status = 'ERROR'
+        raise
+    finally:
+        _current_span.reset(token)
+        elapsed = time.monotonic() - started
+        metrics = get_metrics()
+        metrics.stage_seconds.observe(elapsed, stage=name)
+        if status == 'ERROR':
+            metrics.stage_errors.inc(stage=name)
+        exporter = get_span_exporter()
+        if exporter:
+            exporter.export({
+                **current,
+                'start_time_unix_nano': start_ns,
+                'end_time_unix_nano': start_ns + int(elapsed * 1e9),
+                'status': status,
+                'pid': os.getpid(),
+            })
+
+
+def traced(name):
+    """Decorator form of `span` for plain and async functions."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = get_metrics().render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host='0.0.0.0'):
+    """
+    Serve this process's metrics on their own port from a daemon thread.
+    For processes without a Django server, such as the job workers.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+    logger.info(f"Serving metrics on {host}:{port}")
+    return server
+
+
+_metrics = None
+_metrics_pid = None
+_exporter = None
+
+
+def get_metrics():
+    """Return the process-wide metrics registry."""
+    global _metrics, _metrics_pid
+    # A forked worker starts from zero instead of repeating its parent's counts,
+    # but keeps the component stats registered before the fork
+    if _metrics is None or _metrics_pid != os.getpid():
+        registered = dict(_metrics._stats) if _metrics else {}
+        _metrics = MetricsRegistry()
+        _metrics._stats.update(registered)
+        _metrics_pid = os.getpid()
+    return _metrics
+
+
+def get_span_exporter():
+    """Return the JSON-lines span exporter for METRICS_SPANS_PATH, or None when unset."""
+    global _exporter
+    path = os.getenv('METRICS_SPANS_PATH')
+    if not path:
+        return None
+    if _exporter is None or _exporter.path != path:
+        _exporter = SpanExporter(path)
+    return _exporter
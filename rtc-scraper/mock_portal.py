@@ -0,0 +1,618 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import html
+import json
+import logging
+import random
+import secrets
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger('MockPortal')
+
+PREFIX = '/Service2/'
+
+# Control names as the portal's WebForms posts them; ids replace '$' with '_'
+CASCADE = [
+    ('district', 'ctl00$MainContent$ddlODist', 'Select District'),
+    ('taluk', 'ctl00$MainContent$ddlOTaluk', 'Select Taluk'),
+    ('hobli', 'ctl00$MainContent$ddlOHobli', 'Select Hobli'),
+    ('village', 'ctl00$MainContent$ddlOVillage', 'Select Village'),
+    ('surnoc', 'ctl00$MainContent$ddlOSurnocNo', 'Select Surnoc'),
+    ('hissa', 'ctl00$MainContent$ddlOHissaNo', 'Select Hissa'),
+    ('period', 'ctl00$MainContent$ddlOPeriod', 'Select Period'),
+    ('year', 'ctl00$MainContent$ddlOYear', 'Select Year'),
+]
+KEYS = [key for key, _, _ in CASCADE]
+SURVEY_INPUT = 'ctl00$MainContent$txtOSurveyNo'
+OLD_YEAR_BUTTON = 'ctl00$MainContent$btnOldYear'
+GO_BUTTON = 'ctl00$MainContent$btnOGo'
+FETCH_BUTTON = 'ctl00$MainContent$btnFetchDetails'
+VIEW_BUTTON = 'ctl00$MainContent$btnOView'
+PANEL_ID = 'ctl00_MainContent_UpdatePanel1'
+
+_SYLLABLES = ['ba', 'de', 'ga', 'ho', 'ka', 'ko', 'ma', 'na', 'ra', 'sa', 'te', 'va', 'ye', 'chi', 'dod', 'hun']
+_SUFFIXES = ['halli', 'pura', 'kere', 'palya', 'doddi', 'gere', 'kote', 'hosur']
+
+
+def _control_id(name):
+    return name.replace('$', '_')
+
+
+class PortalData:
+    """
+    Deterministic stand-in for the portal's location tree, survey numbers and
+    RTC periods. Place names are made up, so records scraped from the mock
+    never collide with real properties.
+    """
+
+    def __init__(self, seed=0, districts=3, taluks=3, hoblis=3, villages=4, surveys=50,
+                 first_year=2005, last_year=2023):
+        self.seed = seed
+        self.surveys = surveys
+        self.children = {}
+        self.names = {}
+        rng = random.Random(seed)
+        self._fill(rng, (), [districts, taluks, hoblis, villages])
+        # One period per agricultural year, in the portal's "(2012-13 )" style
+        self.periods = [
+            {'value': str(index + 1), 'text': f"01/04/{year} - 31/03/{year + 1} ({year}-{(year + 1) % 100:02d} )", 'year': year}
+            for index, year in enumerate(range(first_year, last_year + 1))
+        ]
+
+    def _fill(self, rng, parent, counts):
+        count, rest = counts[0], counts[1:]
+        used = set()
+        options = []
+        for index in range(count):
+            name = None
+            while name is None or name.lower() in used:
+                name = (rng.choice(_SYLLABLES) + rng.choice(_SYLLABLES) + rng.choice(_SUFFIXES)).title()
+            used.add(name.lower())
+            code = str(index + 1)
+            options.append({'value': code, 'text': name})
+            self.names[parent + (code,)] = name
+            if rest:
+                self._fill(rng, parent + (code,), rest)
+        self.children[parent] = options
+
+    def locations(self, codes):
+        """Options of the location level below the given ancestor codes."""
+        return self.children.get(tuple(codes), [])
+
+    def _digest(self, *parts):
+        return int(hashlib.sha1(repr((self.seed,) + parts).encode()).hexdigest(), 16)
+
+    def has_survey(self, village_codes, survey):
+        return survey.isdigit() and 1 <= int(survey) <= self.surveys and len(village_codes) == 4
+
+    def surnocs(self, village_codes, survey):
+        options = [{'value': '*', 'text': '*'}]
+        if self._digest(village_codes, survey, 'surnoc') % 4 == 0:
+            options.append({'value': 'A', 'text': 'A'})
+        return options
+
+    def hissas(self, village_codes, survey, surnoc):
+        count = 1 + self._digest(village_codes, survey, surnoc, 'hissa') % 3
+        return [{'value': str(index), 'text': str(index)} for index in range(1, count + 1)]
+
+    def period_options(self):
+        return [{'value': period['value'], 'text': period['text']} for period in self.periods]
+
+    def years(self, period):
+        for option in self.periods:
+            if option['value'] == period:
+                year = option['year']
+                return [{'value': str(year), 'text': f"{year}-{year + 1}"}]
+        return []
+
+    def properties(self, limit):
+        """Up to `limit` valid property_data dicts, spread across villages."""
+        villages = [codes for codes in self.names if len(codes) == 4]
+        result = []
+        for survey in range(1, self.surveys + 1):
+            for codes in villages:
+                if len(result) >= limit:
+                    return result
+                result.append({
+                    'survey_number': str(survey),
+                    'surnoc': '*',
+                    'hissa': self.hissas(codes, str(survey), '*')[0]['text'],
+                    'district': self.names[codes[:1]],
+                    'taluk': self.names[codes[:2]],
+                    'hobli': self.names[codes[:3]],
+                    'village': self.names[codes],
+                })
+        return result
+
+    def sketch_png(self, key, width=800, height=600, ink=0.04):
+        """A grayscale PNG of scattered ink, deterministic for `key`."""
+        rng = random.Random(self._digest(key, 'sketch'))
+        threshold = int(256 * ink)
+        table = bytes(0 if value < threshold else 255 for value in range(256))
+        raw = b''.join(b'\x00' + rng.randbytes(width).translate(table) for _ in range(height))
+
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        return (b'\x89PNG\r\n\x1a\n'
+                + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(raw, 6))
+                + chunk(b'IEND', b''))
+
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Bhoomi RTC - Old Year</title>
+<link rel="stylesheet" href="{prefix}css/site.css">
+<script async src="{prefix}js/gtag.js"></script>
+</head><body>
+<img class="banner" src="{prefix}images/banner.png" alt="Bhoomi">
+<form method="post" action="{prefix}" id="aspnetForm">
+<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="">
+<input type="hidden" name="__EVENTARGUMENT" id="__EVENTARGUMENT" value="">
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}">
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{validation}">
+<div id="{panel_id}">{panel}</div>
+</form>
+<script>
+var prm = {{
+    _busy: false, _beginRequest: [], _endRequest: [],
+    get_isInAsyncPostBack: function () {{ return this._busy; }},
+    add_beginRequest: function (handler) {{ this._beginRequest.push(handler); }},
+    add_endRequest: function (handler) {{ this._endRequest.push(handler); }}
+}};
+var Sys = {{WebForms: {{PageRequestManager: {{getInstance: function () {{ return prm; }}}}}}}};
+var form = document.getElementById('aspnetForm');
+function __asyncPostBack(target, button) {{
+    var data = new FormData(form);
+    data.set('__EVENTTARGET', target);
+    if (button) data.set(button.name, button.value);
+    data.set('__ASYNCPOST', 'true');
+    var error = null;
+    prm._busy = true;
+    prm._beginRequest.forEach(function (handler) {{ handler(prm, {{}}); }});
+    fetch(form.action, {{method: 'POST', body: new URLSearchParams(data), headers: {{'X-MicrosoftAjax': 'Delta=true'}}}})
+        .then(function (response) {{
+            if (!response.ok) error = new Error('Sys.WebForms.PageRequestManagerServerErrorException: ' + response.status);
+            return response.text();
+        }})
+        .then(function (text) {{
+            if (error) return;
+            var doc = new DOMParser().parseFromString(text, 'text/html');
+            ['__VIEWSTATE', '__EVENTVALIDATION'].forEach(function (id) {{
+                var field = doc.getElementById(id);
+                if (field) document.getElementById(id).value = field.value;
+            }});
+            var panel = doc.getElementById('{panel_id}');
+            document.getElementById('{panel_id}').innerHTML = panel ? panel.innerHTML : doc.body.innerHTML;
+        }})
+        .catch(function (e) {{ error = e; }})
+        .finally(function () {{
+            prm._busy = false;
+            var args = {{get_error: function () {{ return error; }}}};
+            prm._endRequest.forEach(function (handler) {{ handler(prm, args); }});
+        }});
+}}
+function __doPostBack(target, argument) {{ __asyncPostBack(target, null); }}
+form.addEventListener('submit', function (event) {{
+    event.preventDefault();
+    __asyncPostBack('', event.submitter);
+}});
+</script>
+</body></html>"""
+
+POPUP_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>RTC</title>
+<link rel="stylesheet" href="{prefix}css/site.css"></head>
+<body><h3>{title}</h3><img id="ImgSketchPage" src="{prefix}Sketch.ashx?t={token}" alt="RTC"></body></html>"""
+
+ERROR_TEMPLATE = """<!DOCTYPE html>
+<html><head><title>Runtime Error</title></head><body><h2>Server Error in '/Service2' Application.</h2>
+<p>{message}</p></body></html>"""
+
+
+class PortalError(Exception):
+    pass
+
+
+class MockPortalServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the land-records Service2 portal: the Old Year flow,
+    the cascading dropdowns as __VIEWSTATE/__EVENTVALIDATION postbacks (async
+    from the page's script, full page from plain form posts), Fetch details and
+    the View popup with #ImgSketchPage. Sessions expire like ASP.NET's.
+
+    Latency and failures can be injected per request class, and heavy page
+    assets (stylesheet, font, banner, analytics script) are served so their
+    cost shows up. It also answers /v1/chat/completions with the property
+    details of one of its own properties, so the whole upload path can run
+    offline. Per-path request and byte counts are at /__mock__/stats.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, data=None, latency_ms=50, jitter_ms=25, sketch_latency_ms=200,
+                 vision_latency_ms=500, failure_rate=0.0, popup_failure_rate=0.0, session_timeout=1200,
+                 asset_kb=256):
+        super().__init__(address, _PortalHandler)
+        self.data = data or PortalData()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.sketch_latency_ms = sketch_latency_ms
+        self.vision_latency_ms = vision_latency_ms
+        self.failure_rate = failure_rate
+        self.popup_failure_rate = popup_failure_rate
+        self.session_timeout = session_timeout
+        self.assets = self._make_assets(asset_kb * 1024)
+        self.secret = secrets.token_bytes(16)
+        self.sessions = {}
+        self._sketches = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self._vision_answers = self.data.properties(1000)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{PREFIX}"
+
+    def _make_assets(self, size):
+        rng = random.Random(0)
+        rule = '.c{0} {{ margin: {0}px; color: #{0:06x}; }}\n'
+        css = '@font-face { font-family: Nudi; src: url(../fonts/nudi.woff2); }\nbody { font-family: Nudi; }\n'
+        css += ''.join(rule.format(index) for index in range(size // 48))
+        banner = self.data.sketch_png('banner', width=1200, height=max(1, size // 1200), ink=0.5)
+        return {
+            'css/site.css': ('text/css', css.encode()),
+            'fonts/nudi.woff2': ('font/woff2', rng.randbytes(size)),
+            'images/banner.png': ('image/png', banner),
+            'js/gtag.js': ('application/javascript', b'window.dataLayer = window.dataLayer || [];\n' + b'//' * (size // 8)),
+        }
+
+    # -- bookkeeping --
+
+    def record(self, kind, sent):
+        with self._lock:
+            stats = self._stats.setdefault(kind, {'requests': 0, 'bytes': 0})
+            stats['requests'] += 1
+            stats['bytes'] += sent
+
+    def stats(self):
+        with self._lock:
+            return {kind: dict(stats) for kind, stats in self._stats.items()}
+
+    def delay(self, base_ms):
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0
+        if base_ms + jitter > 0:
+            time.sleep((base_ms + jitter) / 1000)
+
+    def fails(self, rate):
+        with self._lock:
+            return rate > 0 and self._rng.random() < rate
+
+    def sketch(self, key):
+        with self._lock:
+            if key in self._sketches:
+                self._sketches.move_to_end(key)
+                return self._sketches[key]
+        image = self.data.sketch_png(key)
+        with self._lock:
+            self._sketches[key] = image
+            while len(self._sketches) > 256:
+                self._sketches.popitem(last=False)
+        return image
+
+    # -- sessions and signed state --
+
+    def new_session(self):
+        sid = secrets.token_hex(12)
+        with self._lock:
+            self.sessions[sid] = time.monotonic()
+        return sid
+
+    def touch_session(self, sid):
+        """True if the session is live; refreshes its sliding expiry."""
+        now = time.monotonic()
+        with self._lock:
+            seen = self.sessions.get(sid)
+            if seen is None or now - seen > self.session_timeout:
+                self.sessions.pop(sid, None)
+                return False
+            self.sessions[sid] = now
+            return True
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def dump_state(self, state):
+        viewstate = base64.b64encode(json.dumps(state, separators=(',', ':')).encode()).decode()
+        return viewstate, self._sign(viewstate)
+
+    def load_state(self, viewstate, validation):
+        if not viewstate or not hmac.compare_digest(self._sign(viewstate), validation or ''):
+            raise PortalError('Validation of viewstate MAC failed.')
+        return json.loads(base64.b64decode(viewstate))
+
+    def token(self, payload):
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return f"{encoded}.{self._sign(encoded)}"
+
+    def read_token(self, token):
+        encoded, _, signature = (token or '').partition('.')
+        if not encoded or not hmac.compare_digest(self._sign(encoded), signature):
+            raise PortalError('Invalid token.')
+        return json.loads(base64.urlsafe_b64decode(encoded))
+
+    # -- the form --
+
+    def options(self, state, key):
+        """Options of one dropdown given the values above it, or None when it isn't shown."""
+        values = state['values']
+        codes = [values[level] for level in KEYS[:4]]
+        index = KEYS.index(key)
+        if not state['old_year'] or any(not values[level] for level in KEYS[:min(index, 4)]):
+            return None
+        if index < 4:
+            return self.data.locations(codes[:index])
+        if not state['survey']:
+            return None
+        if any(not values[level] for level in KEYS[4:index]):
+            return None
+        if key == 'surnoc':
+            return self.data.surnocs(codes, state['survey'])
+        if key == 'hissa':
+            return self.data.hissas(codes, state['survey'], values['surnoc'])
+        if key == 'period':
+            return self.data.period_options()
+        return self.data.years(values['period'])
+
+    def initial_state(self, sid):
+        return {'sid': sid, 'old_year': False, 'survey': '', 'fetched': False, 'values': {key: '' for key in KEYS}}
+
+    def apply(self, state, form):
+        """Apply one postback to the state, validating posted values like event validation does."""
+        target = form.get('__EVENTTARGET', '')
+        if OLD_YEAR_BUTTON in form:
+            state = self.initial_state(state['sid'])
+            state['old_year'] = True
+            return state
+        for index, (key, name, _) in enumerate(CASCADE):
+            if name not in form:
+                continue
+            value = form[name]
+            if value == '0':
+                value = ''
+            if value == state['values'][key]:
+                continue
+            options = self.options(state, key)
+            if value and (options is None or not any(option['value'] == value for option in options)):
+                raise PortalError('Invalid postback or callback argument.')
+            state['values'][key] = value
+            for dependent in KEYS[index + 1:]:
+                state['values'][dependent] = ''
+            if index < 4:
+                state['survey'] = ''
+            state['fetched'] = False
+            state['missing_survey'] = False
+            # The dropdowns below were posted with values for the old selection
+            break
+        if GO_BUTTON in form:
+            survey = form.get(SURVEY_INPUT, '').strip()
+            codes = [state['values'][level] for level in KEYS[:4]]
+            state['survey'] = survey if self.data.has_survey(codes, survey) else ''
+            state['missing_survey'] = not state['survey']
+            for dependent in KEYS[4:]:
+                state['values'][dependent] = ''
+            state['fetched'] = False
+        elif FETCH_BUTTON in form and state['values']['year']:
+            state['fetched'] = True
+        elif target and target not in {name for _, name, _ in CASCADE}:
+            raise PortalError('Invalid postback or callback argument.')
+        return state
+
+    def render_panel(self, state):
+        parts = []
+        if not state['old_year']:
+            parts.append(f'<input type="submit" name="{OLD_YEAR_BUTTON}" value="Old Year" id="{_control_id(OLD_YEAR_BUTTON)}">')
+            return '\n'.join(parts)
+        for key, name, placeholder in CASCADE:
+            options = self.options(state, key)
+            if options is not None:
+                selected = state['values'][key]
+                rendered = [f'<option value="0">{placeholder}</option>'] + [
+                    f'<option value="{html.escape(option["value"])}"{" selected" if option["value"] == selected else ""}>'
+                    f'{html.escape(option["text"])}</option>'
+                    for option in options
+                ]
+                parts.append(
+                    f'<select name="{name}" id="{_control_id(name)}" '
+                    f'onchange="__doPostBack(&#39;{name}&#39;,&#39;&#39;)">{"".join(rendered)}</select>'
+                )
+            if key == 'village' and state['values']['village']:
+                parts.append(
+                    f'<input type="text" name="{SURVEY_INPUT}" id="{_control_id(SURVEY_INPUT)}" '
+                    f'placeholder="Survey Number" value="{html.escape(state["survey"])}">'
+                    f'<input type="submit" name="{GO_BUTTON}" value="Go" id="{_control_id(GO_BUTTON)}">'
+                )
+                if state.get('missing_survey'):
+                    parts.append('<span class="error">Survey number not found</span>')
+        if state['values']['year']:
+            parts.append(f'<input type="submit" name="{FETCH_BUTTON}" value="Fetch details" id="{_control_id(FETCH_BUTTON)}">')
+        if state['fetched']:
+            token = self.token({key: state['values'][key] for key in KEYS} | {'survey': state['survey']})
+            parts.append('<table class="details"><tr><th>Owner</th><td>Mock Owner</td></tr></table>')
+            parts.append(
+                f'<input type="button" name="{VIEW_BUTTON}" value="View" id="{_control_id(VIEW_BUTTON)}" '
+                f'onclick="window.open(&#39;{PREFIX}ViewRTC.aspx?t={token}&#39;, &#39;_blank&#39;)">'
+            )
+        return '\n'.join(parts)
+
+    def render_page(self, state):
+        viewstate, validation = self.dump_state(state)
+        return PAGE_TEMPLATE.format(
+            prefix=PREFIX, viewstate=viewstate, validation=validation, panel_id=PANEL_ID, panel=self.render_panel(state)
+        )
+
+
+class _PortalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, content_type, body, kind, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        self.server.record(kind, len(body))
+
+    def _send_html(self, text, kind, status=200, headers=None):
+        self._send(status, 'text/html; charset=utf-8', text.encode('utf-8'), kind, headers)
+
+    def _send_json(self, payload, kind, status=200):
+        self._send(status, 'application/json', json.dumps(payload).encode('utf-8'), kind)
+
+    def _session(self):
+        cookies = self.headers.get('Cookie', '')
+        for part in cookies.split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == 'ASP.NET_SessionId':
+                return value
+        return None
+
+    def do_GET(self):
+        server = self.server
+        path, _, query = self.path.partition('?')
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+        if path == '/__mock__/stats':
+            return self._send_json(server.stats(), 'stats')
+        if path in (PREFIX, PREFIX.rstrip('/')):
+            server.delay(server.latency_ms)
+            sid = server.new_session()
+            return self._send_html(
+                server.render_page(server.initial_state(sid)), 'page',
+                headers={'Set-Cookie': f'ASP.NET_SessionId={sid}; path=/; HttpOnly'},
+            )
+        if path.startswith(PREFIX) and path[len(PREFIX):] in server.assets:
+            content_type, body = server.assets[path[len(PREFIX):]]
+            return self._send(200, content_type, body, 'asset', {'Cache-Control': 'max-age=86400'})
+        if path == PREFIX + 'ViewRTC.aspx':
+            server.delay(server.latency_ms)
+            try:
+                payload = server.read_token(params.get('t'))
+            except PortalError as e:
+                return self._send_html(ERROR_TEMPLATE.format(message=html.escape(str(e))), 'error', status=500)
+            title = f"Survey {payload['survey']} / {payload['surnoc']} / {payload['hissa']} - {payload['year']}"
+            return self._send_html(
+                POPUP_TEMPLATE.format(prefix=PREFIX, title=html.escape(title), token=params['t']), 'popup'
+            )
+        if path == PREFIX + 'Sketch.ashx':
+            server.delay(server.sketch_latency_ms)
+            if server.fails(server.popup_failure_rate):
+                return self._send_html(ERROR_TEMPLATE.format(message='Service Unavailable'), 'error', status=503)
+            try:
+                payload = server.read_token(params.get('t'))
+            except PortalError as e:
+                return self._send_html(ERROR_TEMPLATE.format(message=html.escape(str(e))), 'error', status=500)
+            return self._send(200, 'image/png', server.sketch(json.dumps(payload, sort_keys=True)), 'sketch')
+        self._send_html(ERROR_TEMPLATE.format(message='The resource cannot be found.'), 'error', status=404)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_POST(self):
+        server = self.server
+        path = urlsplit(self.path).path
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if path == '/v1/chat/completions':
+            return self._vision(body)
+        if path not in (PREFIX, PREFIX.rstrip('/')):
+            return self._send_html(ERROR_TEMPLATE.format(message='The resource cannot be found.'), 'error', status=404)
+
+        server.delay(server.latency_ms)
+        if server.fails(server.failure_rate):
+            return self._send_html(ERROR_TEMPLATE.format(message='Internal Server Error'), 'error', status=500)
+        form = {key: values[0] for key, values in parse_qs(body.decode('utf-8'), keep_blank_values=True).items()}
+        sid = self._session()
+        if not sid or not server.touch_session(sid):
+            # An expired session starts over at the landing page, as the portal does
+            sid = server.new_session()
+            return self._send_html(
+                server.render_page(server.initial_state(sid)), 'expired',
+                headers={'Set-Cookie': f'ASP.NET_SessionId={sid}; path=/; HttpOnly'},
+            )
+        try:
+            state = server.load_state(form.get('__VIEWSTATE'), form.get('__EVENTVALIDATION'))
+            if state['sid'] != sid:
+                raise PortalError('Validation of viewstate MAC failed.')
+            state = server.apply(state, form)
+        except (PortalError, ValueError, KeyError) as e:
+            return self._send_html(ERROR_TEMPLATE.format(message=html.escape(str(e))), 'error', status=500)
+        self._send_html(server.render_page(state), 'postback')
+
+    def _vision(self, body):
+        """An OpenAI chat completion whose answer is one of the mock's properties, picked by the request."""
+        server = self.server
+        server.delay(server.vision_latency_ms)
+        answers = server._vision_answers
+        prop = answers[int(hashlib.sha1(body).hexdigest(), 16) % len(answers)]
+        content = json.dumps({
+            'Survey Number': prop['survey_number'], 'Surnoc': prop['surnoc'], 'Hissa': prop['hissa'],
+            'Village': prop['village'], 'Hobli': prop['hobli'], 'Taluk': prop['taluk'], 'District': prop['district'],
+        })
+        self._send_json({
+            'id': f"chatcmpl-mock-{secrets.token_hex(6)}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': 'mock',
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        }, 'vision')
+
+
+def serve_mock_portal(port=0, host='127.0.0.1', **options):
+    """Start the mock portal on a daemon thread; the returned server's `url` is the portal URL."""
+    server = MockPortalServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='mock-portal', daemon=True).start()
+    logger.info(f"Mock portal serving {server.url}")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve a local mock of the land-records portal')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=25)
+    parser.add_argument('--sketch-latency-ms', type=float, default=200)
+    parser.add_argument('--vision-latency-ms', type=float, default=500)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of postbacks answered with a 500')
+    parser.add_argument('--popup-failure-rate', type=float, default=0.0, help='Fraction of sketches answered with a 503')
+    parser.add_argument('--session-timeout', type=float, default=1200, help='Idle seconds before a session expires')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    mock = MockPortalServer(
+        (args.host, args.port), data=PortalData(seed=args.seed), latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms, sketch_latency_ms=args.sketch_latency_ms, vision_latency_ms=args.vision_latency_ms,
+        failure_rate=args.failure_rate, popup_failure_rate=args.popup_failure_rate,
+        session_timeout=args.session_timeout,
+    )
+    print(f"Portal: RTC_PORTAL_URL={mock.url}")
+    print(f"Vision: OPENAI_BASE_URL=http://{args.host}:{args.port}/v1")
+    mock.serve_forever()
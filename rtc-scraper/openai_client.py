@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+import openai
+from openai import AsyncOpenAI
+from metrics import get_metrics, traced
+
+logger = logging.getLogger('OpenAIClient')
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+
+def parse_reset(value):
+    """Parse an x-ratelimit-reset-* header such as '1s', '6m0s' or '20ms' into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """
+    Async token bucket for request admission.
+
+    Refills at `rate` tokens per second up to `capacity`. The server's
+    x-ratelimit-* response headers override the local estimate: when the
+    server says the window is exhausted, nobody is admitted until it resets.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def update_from_headers(self, headers):
+        """Follow the server's view of the request budget."""
+        remaining = headers.get('x-ratelimit-remaining-requests')
+        reset = parse_reset(headers.get('x-ratelimit-reset-requests'))
+        if remaining is None:
+            return
+        try:
+            remaining = int(remaining)
+        except ValueError:
+            return
+        self.tokens = min(self.tokens, remaining)
+        if remaining <= 0 and reset:
+            self.block_for(reset)
+
+    def block_for(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class AsyncVisionClient:
+    """
+    Shared AsyncOpenAI client with pooled keep-alive connections, bounded concurrency,
+    a token-bucket limiter, jittered exponential backoff on 429/5xx and
+    connection errors, and an overall per-request deadline.
+
+    Bound to the event loop it is first used on; use it from the shared
+    background loop in `async_runtime`.
+    """
+
+    def __init__(self, max_concurrency=None, requests_per_minute=None, max_retries=None, deadline=None):
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('OPENAI_MAX_RETRIES', '4'))
+        self.deadline = deadline or float(os.getenv('OPENAI_REQUEST_DEADLINE', '120'))
+        max_concurrency = max_concurrency or int(os.getenv('OPENAI_MAX_CONCURRENCY', '8'))
+        requests_per_minute = requests_per_minute or float(os.getenv('OPENAI_REQUESTS_PER_MINUTE', '500'))
+        self.limiter = TokenBucket(rate=requests_per_minute / 60.0, capacity=max_concurrency)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            base_url=os.getenv('OPENAI_BASE_URL') or None,  # Point at a local mock server for testing
+            max_retries=0,  # Retries are handled here so they share the limiter and deadline
+            timeout=self.deadline,
+        )  # One instance per process, so its pooled keep-alive connections are reused
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after:
+            return retry_after
+        return min(30.0, 0.5 * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+    def _count(self, outcome):
+        get_metrics().counter(
+            'rtc_vision_requests_total', 'Vision API attempts by outcome', ['outcome']
+        ).inc(outcome=outcome)
+
+    @traced('extraction.vision_request')
+    async def create_chat_completion(self, **kwargs):
+        """Create a chat completion, retrying transient failures until the deadline."""
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            retry_after = None
+            async with self._semaphore:
+                await self.limiter.acquire()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Vision request deadline exceeded")
+                try:
+                    raw = await asyncio.wait_for(
+                        self.client.chat.completions.with_raw_response.create(**kwargs),
+                        timeout=remaining,
+                    )
+                    self.limiter.update_from_headers(raw.headers)
+                    self._count('ok')
+                    return raw.parse()
+                except openai.RateLimitError as e:
+                    self._count('rate_limited')
+                    self.limiter.update_from_headers(e.response.headers)
+                    retry_after = parse_reset(e.response.headers.get('retry-after'))
+                    if retry_after:
+                        self.limiter.block_for(retry_after)
+                    error = e
+                except openai.APIStatusError as e:
+                    self._count('client_error' if e.status_code < 500 else 'server_error')
+                    if e.status_code < 500:
+                        raise
+                    error = e
+                except (openai.APIConnectionError, openai.APITimeoutError) as e:
+                    self._count('connection_error')
+                    error = e
+
+            if attempt >= self.max_retries:
+                raise error
+            delay = self._backoff(attempt, retry_after)
+            if time.monotonic() + delay >= deadline:
+                raise error
+            attempt += 1
+            logger.warning(f"Vision request failed ({error.__class__.__name__}), retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+_client = None
+_client_pid = None
+
+
+def get_vision_client():
+    """Return the process-wide async vision client."""
+    global _client, _client_pid
+    # A forked worker must open its own connections
+    if _client is None or _client_pid != os.getpid():
+        _client = AsyncVisionClient()
+        _client_pid = os.getpid()
+    return _client
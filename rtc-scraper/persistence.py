@@ -0,0 +1,80 @@
+import logging
+from django.db import transaction
+from django.db.models import F
+from api.models import PROPERTY_FIELDS, RTCData, RTCDocument, make_property_key
+from metrics import traced
+
+logger = logging.getLogger('Persistence')
+
+# Columns refreshed when a document for the same (rtc_data, period, year) is written again
+DOCUMENT_UPDATE_FIELDS = [
+    'period_text',
+    'year_text',
+    'screenshot_path',
+    'capture_mode',
+    'capture_ms',
+    'screenshot_bytes',
+]
+
+
+def get_or_create_rtc_data(property_data):
+    """
+    The property's RTCData row, created if there is none. The unique
+    property key makes this safe against concurrent scrapes of one property.
+    """
+    rtc_data, created = RTCData.objects.get_or_create(
+        property_key=make_property_key(property_data),
+        defaults={field: property_data[field] for field in PROPERTY_FIELDS},
+    )
+    if created:
+        logger.info(f"Created RTCData with ID: {rtc_data.id}")
+    return rtc_data
+
+
+def upsert_documents(rtc_data, documents):
+    """
+    Write a property's scraped documents with one multi-row INSERT ... ON CONFLICT.
+    Writing the same (period, year) again updates the existing row, so a retried
+    scrape never duplicates documents. Returns the saved RTCDocument objects.
+    """
+    if not documents:
+        return []
+    rows = [
+        RTCDocument(
+            rtc_data=rtc_data,
+            period=doc['period'],
+            period_text=doc['period_text'],
+            year=doc['year'],
+            year_text=doc['year_text'],
+            screenshot_path=doc['screenshot_path'],
+            capture_mode=doc.get('capture_mode', ''),
+            capture_ms=doc.get('capture_ms'),
+            screenshot_bytes=doc.get('screenshot_bytes'),
+        )
+        for doc in documents
+    ]
+    return RTCDocument.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['rtc_data', 'period', 'year'],
+        update_fields=DOCUMENT_UPDATE_FIELDS,
+    )
+
+
+@traced('db.persist_scrape')
+def persist_scrape(property_data, rtc_data, documents, on_persisted=None):
+    """
+    Store one scrape in a single transaction: the RTCData row (created if
+    `rtc_data` is None) and all of its documents. `on_persisted(rtc_data,
+    saved_documents)` runs inside the same transaction.
+    Returns (rtc_data, saved documents).
+    """
+    with transaction.atomic():
+        if rtc_data is None:
+            rtc_data = get_or_create_rtc_data(property_data)
+        saved = upsert_documents(rtc_data, documents)
+        if on_persisted:
+            on_persisted(rtc_data, saved)
+        RTCData.objects.filter(id=rtc_data.id).update(documents_version=F('documents_version') + 1)
+    logger.info(f"Persisted {len(saved)} documents for RTCData ID: {rtc_data.id}")
+    return rtc_data, saved
@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlsplit
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+from metrics import get_metrics
+
+logger = logging.getLogger('PortalGovernor')
+
+DEFAULT_GOVERNOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'portal_governor.sqlite3')
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+# Weight of the newest request in the latency and error moving averages
+EWMA_ALPHA = 0.2
+
+
+class PortalUnavailable(Exception):
+    """The portal's circuit is open, or no request slot freed up in time; nothing was sent."""
+
+
+class Slot:
+    """
+    One granted portal request. Report how it went with `fail()`,
+    `throttle()` or `timeout()`; by default it succeeded.
+    """
+
+    def __init__(self):
+        self.outcome = 'ok'
+        self.retry_after = None
+
+    def fail(self):
+        """The portal could not be reached or answered with an error."""
+        self.outcome = 'error'
+
+    def timeout(self):
+        """
+        A wait on the page ran out. The portal may just be slow, or may have
+        ignored the action, so this eases the rate but leaves the circuit alone.
+        """
+        self.outcome = 'timeout'
+
+    def throttle(self, retry_after=None):
+        """The portal asked us to slow down (429/503), optionally saying for how long."""
+        self.outcome = 'throttled'
+        try:
+            self.retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            self.retry_after = None
+
+
+class PortalGovernor:
+    """
+    Rate limit, concurrency limit and circuit breaker per portal host, shared
+    by every scraper process on the machine through a SQLite file.
+
+    Each request takes a lease (at most `max_concurrency` in flight across
+    processes, reaped after `lease_seconds` if its holder died) and the next
+    slot of the host's request rate. The rate adapts: it grows additively
+    while requests succeed within `latency_target`, and shrinks
+    multiplicatively on slow responses, errors and throttling.
+
+    After `failure_threshold` consecutive failures, or once the error rate
+    reaches `error_threshold`, the circuit opens. Only transport errors and
+    error responses are failures; timeouts waiting on the page are not. Requests are then refused
+    with PortalUnavailable for `cooldown` seconds. After that a single probe
+    is let through. If it succeeds, the circuit closes and the rate restarts
+    at its minimum.
+    """
+
+    def __init__(self, enabled=None, path=None, max_concurrency=None, initial_rate=None, min_rate=None, max_rate=None,
+                 rate_step=None, latency_target=None, error_threshold=None, failure_threshold=None, cooldown=None,
+                 lease_seconds=None, acquire_timeout=None):
+        self.enabled = (
+            enabled if enabled is not None
+            else os.getenv('PORTAL_GOVERNOR_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        )
+        self.path = path or os.getenv('PORTAL_GOVERNOR_PATH', DEFAULT_GOVERNOR_PATH)
+        self.max_concurrency = max_concurrency or int(os.getenv('PORTAL_MAX_CONCURRENCY', '4'))
+        # Requests per second
+        self.min_rate = min_rate or float(os.getenv('PORTAL_RATE_MIN', '0.5'))
+        self.max_rate = max_rate or float(os.getenv('PORTAL_RATE_MAX', '10'))
+        self.initial_rate = initial_rate or float(os.getenv('PORTAL_RATE_INITIAL', '2'))
+        self.rate_step = rate_step or float(os.getenv('PORTAL_RATE_STEP', '0.05'))
+        self.latency_target = latency_target or float(os.getenv('PORTAL_LATENCY_TARGET_MS', '3000')) / 1000
+        self.error_threshold = error_threshold or float(os.getenv('PORTAL_CIRCUIT_ERROR_RATE', '0.5'))
+        self.failure_threshold = failure_threshold or int(os.getenv('PORTAL_CIRCUIT_FAILURES', '5'))
+        self.cooldown = cooldown or float(os.getenv('PORTAL_CIRCUIT_COOLDOWN_SECONDS', '60'))
+        self.lease_seconds = lease_seconds or float(os.getenv('PORTAL_LEASE_SECONDS', '300'))
+        self.acquire_timeout = acquire_timeout or float(os.getenv('PORTAL_ACQUIRE_TIMEOUT', '120'))
+        self._lock = threading.Lock()
+        self._metrics = {
+            'requests_total': 0,
+            'errors_total': 0,
+            'throttled_total': 0,
+            'timeouts_total': 0,
+            'rejected_total': 0,
+            'wait_seconds_total': 0.0,
+        }
+        if self.enabled:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self._transaction() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS hosts (
+                        host TEXT PRIMARY KEY,
+                        rate REAL NOT NULL,
+                        next_slot REAL NOT NULL,
+                        latency REAL NOT NULL DEFAULT 0,
+                        error_rate REAL NOT NULL DEFAULT 0,
+                        failures INTEGER NOT NULL DEFAULT 0,
+                        state TEXT NOT NULL DEFAULT 'closed',
+                        opened_at REAL,
+                        updated_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS leases (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        host TEXT NOT NULL,
+                        pid INTEGER NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS leases_host ON leases (host, expires_at)")
+
+    @contextmanager
+    def _transaction(self):
+        """A write transaction; BEGIN IMMEDIATE serializes the processes sharing the file."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._metrics[key] += value
+
+    def _host(self, conn, host, now):
+        row = conn.execute("SELECT * FROM hosts WHERE host = ?", (host,)).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT INTO hosts (host, rate, next_slot, updated_at) VALUES (?, ?, ?, ?)",
+                (host, self.initial_rate, now, now)
+            )
+            row = conn.execute("SELECT * FROM hosts WHERE host = ?", (host,)).fetchone()
+        return row
+
+    def _try_acquire(self, host):
+        """
+        Take a lease if the circuit and the concurrency limit allow it. Returns
+        (lease id, seconds until its rate slot), or (None, seconds to wait
+        before trying again). Raises PortalUnavailable while the circuit is open.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+            row = self._host(conn, host, now)
+            state = row['state']
+            if state == OPEN:
+                remaining = row['opened_at'] + self.cooldown - now
+                if remaining > 0:
+                    raise PortalUnavailable(f"Circuit for {host} is open, retry in {int(remaining) + 1}s")
+                state = HALF_OPEN
+                conn.execute("UPDATE hosts SET state = ?, updated_at = ? WHERE host = ?", (state, now, host))
+                logger.info(f"Circuit for {host} is half open, sending a probe")
+            in_flight = conn.execute("SELECT COUNT(*) FROM leases WHERE host = ?", (host,)).fetchone()[0]
+            if in_flight >= (1 if state == HALF_OPEN else self.max_concurrency):
+                return None, min(0.25, 1 / row['rate'])
+            slot = max(now, row['next_slot'])
+            conn.execute(
+                "UPDATE hosts SET next_slot = ?, updated_at = ? WHERE host = ?",
+                (slot + 1 / row['rate'], now, host)
+            )
+            lease = conn.execute(
+                "INSERT INTO leases (host, pid, expires_at) VALUES (?, ?, ?)",
+                (host, os.getpid(), slot + self.lease_seconds)
+            ).lastrowid
+            return lease, slot - now
+
+    def _release(self, host, lease, latency, slot):
+        """Return the lease and fold the request's outcome into the host's rate and circuit."""
+        now = time.time()
+        failed = slot.outcome in ('error', 'throttled')
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE id = ?", (lease,))
+            if slot.outcome == 'aborted':
+                return
+            row = self._host(conn, host, now)
+            if slot.outcome == 'timeout':
+                # Neither a success nor a failure: the averages, failure count and
+                # circuit stay as they are, and a half-open circuit probes again
+                conn.execute(
+                    "UPDATE hosts SET rate = ?, updated_at = ? WHERE host = ?",
+                    (max(self.min_rate, row['rate'] * 0.9), now, host)
+                )
+                return
+            latency_avg = latency if not row['latency'] else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * row['latency']
+            error_rate = EWMA_ALPHA * failed + (1 - EWMA_ALPHA) * row['error_rate']
+            failures = row['failures'] + 1 if failed else 0
+            rate, next_slot, state, opened_at = row['rate'], row['next_slot'], row['state'], row['opened_at']
+
+            if slot.outcome == 'throttled':
+                rate /= 2
+                next_slot = max(next_slot, now + (slot.retry_after or 1 / max(rate, self.min_rate)))
+            elif failed:
+                rate *= 0.7
+            elif latency_avg > self.latency_target:
+                rate *= 0.9
+            else:
+                rate += self.rate_step
+            rate = min(self.max_rate, max(self.min_rate, rate))
+
+            if state == HALF_OPEN:
+                if failed:
+                    state, opened_at = OPEN, now
+                    logger.warning(f"Probe to {host} failed, circuit stays open")
+                else:
+                    state, rate, failures, error_rate = CLOSED, self.min_rate, 0, self.error_threshold / 2
+                    logger.info(f"Probe to {host} succeeded, circuit closed")
+            elif state == CLOSED and failed and (failures >= self.failure_threshold or error_rate >= self.error_threshold):
+                state, opened_at = OPEN, now
+                logger.warning(
+                    f"Opening the circuit for {host} for {int(self.cooldown)}s: "
+                    f"{failures} consecutive failures, error rate {error_rate:.2f}"
+                )
+            conn.execute(
+                "UPDATE hosts SET rate = ?, next_slot = ?, latency = ?, error_rate = ?, failures = ?, state = ?, "
+                "opened_at = ?, updated_at = ? WHERE host = ?",
+                (rate, next_slot, latency_avg, error_rate, failures, state, opened_at, now, host)
+            )
+
+    @asynccontextmanager
+    async def request(self, url):
+        """
+        Hold a slot for one request to `url`'s host for the duration of the
+        `async with` block, which gets the Slot to report the outcome on. A
+        transport error raised in the block counts as a failure and a timeout
+        as `Slot.timeout()`; any other exception, or cancellation, says nothing
+        about the portal and only returns the slot.
+        """
+        slot = Slot()
+        if not self.enabled:
+            yield slot
+            return
+        host = urlsplit(url).netloc or url
+        started = time.monotonic()
+        try:
+            while True:
+                lease, delay = await asyncio.to_thread(self._try_acquire, host)
+                if lease is not None:
+                    break
+                if time.monotonic() - started + delay > self.acquire_timeout:
+                    raise PortalUnavailable(f"No request slot for {host} within {int(self.acquire_timeout)}s")
+                await asyncio.sleep(delay)
+        except PortalUnavailable:
+            self._count('rejected_total')
+            raise
+        if delay > 0:
+            await asyncio.sleep(delay)
+        waited = time.monotonic() - started
+        get_metrics().stage_seconds.observe(waited, stage='portal.governor_wait')
+        self._count('wait_seconds_total', waited)
+
+        sent = time.monotonic()
+        try:
+            yield slot
+        except (PlaywrightTimeoutError, TimeoutError):
+            slot.timeout()
+            raise
+        except (PlaywrightError, OSError):
+            # Includes every requests exception
+            slot.fail()
+            raise
+        except BaseException:
+            slot.outcome = 'aborted'
+            raise
+        finally:
+            self._count('requests_total')
+            if slot.outcome == 'error':
+                self._count('errors_total')
+            elif slot.outcome == 'throttled':
+                self._count('throttled_total')
+            elif slot.outcome == 'timeout':
+                self._count('timeouts_total')
+            try:
+                await asyncio.to_thread(self._release, host, lease, time.monotonic() - sent, slot)
+            except Exception as e:
+                # The lease expires on its own; a bookkeeping error must not fail the scrape
+                logger.warning(f"Could not release portal lease {lease}: {str(e)}")
+
+    def state(self):
+        """The shared state of every host: circuit, current rate, latency and error averages, requests in flight."""
+        if not self.enabled:
+            return {}
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+            in_flight = dict(conn.execute("SELECT host, COUNT(*) FROM leases GROUP BY host").fetchall())
+            rows = conn.execute("SELECT * FROM hosts ORDER BY updated_at DESC").fetchall()
+        return {
+            row['host']: {
+                'circuit': row['state'],
+                'retry_in_seconds': (
+                    max(0.0, row['opened_at'] + self.cooldown - now) if row['state'] == OPEN else 0.0
+                ),
+                'rate_per_second': round(row['rate'], 3),
+                'latency_seconds': round(row['latency'], 3),
+                'error_rate': round(row['error_rate'], 3),
+                'consecutive_failures': row['failures'],
+                'in_flight': in_flight.get(row['host'], 0),
+                'max_concurrency': self.max_concurrency,
+            }
+            for row in rows
+        }
+
+    def stats(self):
+        """This process's request counts plus the shared state of the most recently used host."""
+        with self._lock:
+            stats = {'enabled': self.enabled, **self._metrics}
+        hosts = self.state()
+        if hosts:
+            current = next(iter(hosts.values()))
+            stats.update({
+                'circuit_open': int(current['circuit'] == OPEN),
+                'circuit_half_open': int(current['circuit'] == HALF_OPEN),
+                **{key: value for key, value in current.items() if isinstance(value, (int, float))},
+            })
+        return stats
+
+
+_governor = None
+
+
+def get_portal_governor():
+    """Return the process-wide portal governor."""
+    global _governor
+    if _governor is None:
+        _governor = PortalGovernor()
+        get_metrics().register_stats('portal_governor', _governor.stats)
+    return _governor
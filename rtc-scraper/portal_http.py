@@ -0,0 +1,309 @@
+import asyncio
+import base64
+import copy
+import logging
+import os
+import re
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from browser_pool import DEFAULT_CONTEXT_OPTIONS
+from wait_strategies import SKETCH_SELECTOR, StepTimer
+from village_sessions import VillageSession
+from portal_governor import get_portal_governor
+
+logger = logging.getLogger('PortalHTTP')
+
+WINDOW_OPEN = re.compile(r"window\.open\(\s*['\"]([^'\"]+)['\"]")
+DO_POSTBACK = re.compile(r"__doPostBack\(\s*['\"]([^'\"]*)['\"]\s*,\s*['\"]([^'\"]*)['\"]")
+
+
+class PortalHTTPError(Exception):
+    pass
+
+
+class _FormParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.action = None
+        self.fields = {}
+        self.placeholders = {}
+        self.selects = {}
+        self.buttons = []
+        self.images = {}
+        self._select = None
+        self._option = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value if value is not None else '' for name, value in attrs}
+        if tag == 'form' and self.action is None:
+            self.action = attrs.get('action', '')
+        elif tag == 'input' and attrs.get('name'):
+            kind = attrs.get('type', 'text').lower()
+            if kind in ('submit', 'button', 'image'):
+                self.buttons.append(attrs)
+            elif kind in ('hidden', 'text', 'password'):
+                self.fields[attrs['name']] = attrs.get('value', '')
+                if attrs.get('placeholder'):
+                    self.placeholders[attrs['placeholder']] = attrs['name']
+        elif tag == 'select' and attrs.get('name'):
+            self._select = {'name': attrs['name'], 'id': attrs.get('id', ''), 'options': [], 'selected': None}
+        elif tag == 'option' and self._select is not None:
+            self._option = {'value': attrs.get('value'), 'text': ''}
+            if 'selected' in attrs:
+                self._select['selected'] = self._option
+        elif tag == 'img' and attrs.get('id'):
+            self.images[attrs['id']] = attrs.get('src', '')
+
+    def handle_data(self, data):
+        if self._option is not None:
+            self._option['text'] += data
+
+    def handle_endtag(self, tag):
+        if tag == 'option' and self._option is not None:
+            self._close_option()
+        elif tag == 'select' and self._select is not None:
+            if self._option is not None:
+                self._close_option()
+            select = self._select
+            # Like a browser, the first option is selected when none is marked
+            chosen = select['selected'] or (select['options'][0] if select['options'] else None)
+            select['value'] = chosen['value'] if chosen else ''
+            del select['selected']
+            self.selects[select['id'] or select['name']] = select
+            self._select = None
+
+    def _close_option(self):
+        option = self._option
+        option['text'] = ' '.join(option['text'].split())
+        if option['value'] is None:
+            option['value'] = option['text']
+        self._select['options'].append(option)
+        self._option = None
+
+
+class PortalForm:
+    """The WebForms form of one portal response: hidden state, inputs, dropdowns and buttons."""
+
+    def __init__(self, url, html):
+        parser = _FormParser()
+        parser.feed(html)
+        parser.close()
+        self.url = url
+        self.html = html
+        self.action = urljoin(url, parser.action or '')
+        self.fields = parser.fields
+        self.placeholders = parser.placeholders
+        self.selects = parser.selects
+        self.buttons = parser.buttons
+        self.images = parser.images
+
+    def select(self, selector):
+        return self.selects.get(selector.lstrip('#'))
+
+    def button(self, label):
+        """The button showing `label`, as get_by_role('button', name=label) would find it."""
+        return next((button for button in self.buttons if button.get('value', '').strip() == label), None)
+
+    def values(self):
+        """What the browser would submit: every input and the current value of every dropdown."""
+        values = dict(self.fields)
+        for select in self.selects.values():
+            values[select['name']] = select['value']
+        values['__EVENTTARGET'] = ''
+        values['__EVENTARGUMENT'] = ''
+        return values
+
+
+class PortalHTTPClient:
+    """
+    Walks the portal's WebForms postbacks without a browser: each dropdown
+    change or button click is a form post carrying the page's __VIEWSTATE and
+    __EVENTVALIDATION, and the dropdown options are parsed out of the returned
+    HTML. The blocking `requests` calls run on worker threads, each holding a
+    slot from the shared portal governor.
+
+    The connection pool is shared by every client in the process, while each
+    scrape keeps its own cookies. `fork()` returns a client at the same page
+    state, so several periods can be fetched from one navigated form.
+    """
+
+    def __init__(self, base_url, timer=None, session=None, timeout=None, pacing_floor=None, governor=None):
+        self.base_url = base_url
+        self.timer = timer or StepTimer()
+        self.governor = governor or get_portal_governor()
+        self.timeout = timeout or float(os.getenv('SCRAPER_HTTP_TIMEOUT', '30'))
+        self.pacing_floor = (
+            pacing_floor if pacing_floor is not None
+            else float(os.getenv('SCRAPER_PACING_MS', '0')) / 1000
+        )
+        self.session = session or self._new_session()
+        self.form = None
+        self._last_action = None
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = get_http_adapter()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['User-Agent'] = DEFAULT_CONTEXT_OPTIONS['user_agent']
+        return session
+
+    def fork(self):
+        """A client sharing this one's session, positioned at a copy of the current form."""
+        client = PortalHTTPClient(
+            self.base_url, timer=self.timer, session=self.session, timeout=self.timeout, pacing_floor=self.pacing_floor,
+            governor=self.governor,
+        )
+        client.form = copy.deepcopy(self.form)
+        return client
+
+    async def pace(self):
+        """Sleep only as long as needed to honour the pacing floor."""
+        if self.pacing_floor and self._last_action is not None:
+            remaining = self.pacing_floor - (time.monotonic() - self._last_action)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        self._last_action = time.monotonic()
+
+    async def _request(self, method, url, **kwargs):
+        async with self.governor.request(url) as slot:
+            response = await asyncio.to_thread(self.session.request, method, url, timeout=self.timeout, **kwargs)
+            if response.status_code in (429, 503):
+                slot.throttle(response.headers.get('Retry-After'))
+            elif response.status_code >= 500:
+                slot.fail()
+        if response.status_code >= 400:
+            raise PortalHTTPError(f"{method} {url} answered {response.status_code}")
+        return response
+
+    async def open(self):
+        """Load the portal's landing page."""
+        response = await self._request('GET', self.base_url)
+        self.form = PortalForm(response.url, response.text)
+        return self.form
+
+    async def get(self, url):
+        """GET a URL relative to the current page with the scrape's cookies. Returns the response."""
+        return await self._request('GET', urljoin(self.form.url if self.form else self.base_url, url))
+
+    async def postback(self, values):
+        await self.pace()
+        response = await self._request('POST', self.form.action, data=values, headers={'Referer': self.form.url})
+        self.form = PortalForm(response.url, response.text)
+        return self.form
+
+    def _filled(self, dependent):
+        if not dependent:
+            return True
+        select = self.form.select(dependent)
+        return bool(select and any(option['value'] != '0' for option in select['options']))
+
+    def read_options(self, selector):
+        """Non-placeholder options of a dropdown as [{'value', 'text'}]."""
+        select = self.form.select(selector)
+        if select is None:
+            raise PortalHTTPError(f"{selector} is not on the page")
+        return [{'value': option['value'], 'text': option['text']} for option in select['options'] if option['value'] != '0']
+
+    def fill(self, placeholder, value):
+        """Type into the text input with this placeholder."""
+        name = self.form.placeholders.get(placeholder)
+        if name is None:
+            raise PortalHTTPError(f"No input with placeholder '{placeholder}'")
+        self.form.fields[name] = value
+
+    def has_button(self, label):
+        return self.form.button(label) is not None
+
+    async def select(self, selector, value, dependent=None, step=None):
+        """
+        Post the dropdown's change. Returns whether the dependent dropdown
+        came back with options, like PortalWaits.select.
+        """
+        with self.timer.step(step or selector):
+            select = self.form.select(selector)
+            if select is None:
+                raise PortalHTTPError(f"{selector} is not on the page")
+            values = self.form.values()
+            values[select['name']] = value
+            values['__EVENTTARGET'] = select['name']
+            await self.postback(values)
+            return self._filled(dependent)
+
+    async def click(self, label, dependent=None, step=None):
+        """Post a button click, either as a submit or through its __doPostBack handler."""
+        with self.timer.step(step or 'click'):
+            button = self.form.button(label)
+            if button is None:
+                raise PortalHTTPError(f"No '{label}' button on the page")
+            values = self.form.values()
+            target = DO_POSTBACK.search(button.get('onclick', ''))
+            if target:
+                values['__EVENTTARGET'], values['__EVENTARGUMENT'] = target.groups()
+            else:
+                values[button['name']] = button.get('value', '')
+            await self.postback(values)
+            return self._filled(dependent)
+
+    async def popup_url(self, label):
+        """
+        The URL the button opens in a popup: straight from its window.open
+        handler, or from the script the postback it triggers responds with.
+        """
+        button = self.form.button(label)
+        if button is None:
+            return None
+        opened = WINDOW_OPEN.search(button.get('onclick', ''))
+        if opened is None and not button.get('onclick'):
+            await self.click(label, step='view_postback')
+            opened = WINDOW_OPEN.search(self.form.html)
+        return urljoin(self.form.url, opened.group(1)) if opened else None
+
+    async def sketch(self, popup_url, selector=SKETCH_SELECTOR):
+        """
+        Fetch the popup and then its sketch image directly. Returns the image
+        bytes, or None when the popup doesn't reference the image in its HTML.
+        """
+        popup = await self.get(popup_url)
+        source = PortalForm(popup.url, popup.text).images.get(selector.lstrip('#'))
+        if not source:
+            return None
+        if source.startswith('data:'):
+            header, _, payload = source.partition(',')
+            return base64.b64decode(payload) if header.endswith(';base64') else None
+        image = await self._request('GET', urljoin(popup.url, source), headers={'Referer': popup.url})
+        if not image.headers.get('Content-Type', '').startswith('image/'):
+            return None
+        return image.content
+
+    def cookies(self):
+        """The session's cookies as BrowserContext.add_cookies takes them."""
+        return [
+            {'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path}
+            for cookie in self.session.cookies
+        ]
+
+    def snapshot(self):
+        """The current page in its server session, to resume from later."""
+        return VillageSession(self.form.url, self.form.html, self.cookies())
+
+    def restore(self, snapshot):
+        """Continue from a snapshot's page, in its server session."""
+        for cookie in snapshot.cookies:
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+        self.form = PortalForm(snapshot.url, snapshot.html)
+
+
+_adapter = None
+
+
+def get_http_adapter():
+    """Return the process-wide keep-alive connection pool for portal requests."""
+    global _adapter
+    if _adapter is None:
+        size = int(os.getenv('SCRAPER_HTTP_POOL_SIZE', '16'))
+        _adapter = HTTPAdapter(pool_connections=4, pool_maxsize=size, pool_block=True)
+    return _adapter
@@ -0,0 +1,108 @@
+import logging
+import os
+import re
+import threading
+from metrics import get_metrics
+
+logger = logging.getLogger('RouteFilter')
+
+# Nothing on the search page needs to be rendered, only its form to work
+DEFAULT_BLOCKED_TYPES = 'image,stylesheet,font,media'
+DEFAULT_BLOCKED_URLS = r'google-analytics\.com|googletagmanager\.com|doubleclick\.net|/gtag(\.js|/)'
+
+
+class RouteFilter:
+    """
+    Aborts requests the search page doesn't need (images, stylesheets, fonts,
+    analytics) before they leave the browser. Installed per page with
+    `page.route`, so the View popup, a separate page, still loads the sketch.
+    The page's document, scripts and postbacks are never blocked.
+
+    Blocked bytes are estimated from the sizes of the same URLs when they were
+    last seen unblocked, e.g. in a popup; URLs never seen count as unsized.
+    """
+
+    def __init__(self, enabled=None, resource_types=None, url_patterns=None):
+        self.enabled = (
+            enabled if enabled is not None
+            else os.getenv('SCRAPER_ROUTE_FILTER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        )
+        types = resource_types if resource_types is not None else os.getenv('SCRAPER_BLOCK_RESOURCE_TYPES', DEFAULT_BLOCKED_TYPES)
+        self.resource_types = frozenset(
+            resource_type.strip() for resource_type in (types.split(',') if isinstance(types, str) else types)
+            if resource_type.strip()
+        )
+        patterns = url_patterns if url_patterns is not None else os.getenv('SCRAPER_BLOCK_URL_PATTERNS', DEFAULT_BLOCKED_URLS)
+        self.url_pattern = re.compile(patterns) if patterns else None
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._metrics = {
+            'pages_total': 0,
+            'allowed_requests_total': 0,
+            'blocked_requests_total': 0,
+            'blocked_bytes_total': 0,
+            'blocked_unsized_total': 0,
+        }
+
+    def blocks(self, resource_type, url):
+        if resource_type == 'document':
+            return False
+        if resource_type in self.resource_types:
+            return True
+        return bool(self.url_pattern and self.url_pattern.search(url))
+
+    def new_tally(self):
+        """Per-scrape counts of requests let through and blocked."""
+        return {'pages': 0, 'allowed_requests': 0, 'blocked_requests': 0, 'blocked_bytes': 0, 'blocked_unsized': 0}
+
+    def _learn(self, response):
+        length = response.headers.get('content-length')
+        if length and length.isdigit() and self.blocks(response.request.resource_type, response.url):
+            with self._lock:
+                self._sizes[response.url] = int(length)
+
+    async def install(self, page, tally):
+        """Filter this page's requests, counting them in `tally`."""
+        if not self.enabled:
+            return
+        tally['pages'] += 1
+
+        async def handle(route, request):
+            if not self.blocks(request.resource_type, request.url):
+                tally['allowed_requests'] += 1
+                await route.continue_()
+                return
+            tally['blocked_requests'] += 1
+            with self._lock:
+                size = self._sizes.get(request.url)
+            if size is None:
+                tally['blocked_unsized'] += 1
+            else:
+                tally['blocked_bytes'] += size
+            await route.abort('blockedbyclient')
+
+        await page.route('**/*', handle)
+        # Popups are not filtered; what they download tells us what blocking saves
+        page.on('popup', lambda popup: popup.on('response', self._learn))
+
+    def merge(self, tally):
+        with self._lock:
+            for key, value in tally.items():
+                self._metrics[f"{key}_total"] += value
+
+    def stats(self):
+        """Return the process-wide counts of pages filtered and requests and bytes avoided."""
+        with self._lock:
+            return {'enabled': self.enabled, 'known_urls': len(self._sizes), **self._metrics}
+
+
+_route_filter = None
+
+
+def get_route_filter():
+    """Return the process-wide route filter."""
+    global _route_filter
+    if _route_filter is None:
+        _route_filter = RouteFilter()
+        get_metrics().register_stats('route_filter', _route_filter.stats)
+    return _route_filter
@@ -0,0 +1,134 @@
+import logging
+import os
+import re
+from datetime import timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from api.models import RTCData, RTCDocument, make_property_key
+from screenshot_storage import get_screenshot_storage
+from metrics import get_metrics
+
+logger = logging.getLogger('ScrapeCache')
+
+
+def document_to_dict(doc):
+    """The dict shape RTCScraper returns for a stored document."""
+    return {
+        'id': doc.id,
+        'period': doc.period,
+        'period_text': doc.period_text,
+        'year': doc.year,
+        'year_text': doc.year_text,
+        'screenshot_path': doc.screenshot_path,
+        'screenshot_url': doc.screenshot_url,
+        'capture_mode': doc.capture_mode,
+        'capture_ms': doc.capture_ms,
+        'screenshot_bytes': doc.screenshot_bytes
+    }
+
+
+class ScrapeCache:
+    """
+    Property-keyed cache in front of RTCScraper.
+
+    A property scraped less than `ttl` seconds ago is served straight from the
+    database. Once stale, the property is scraped again, but documents for
+    historical periods (start year <= `immutable_until`) are reused, since the
+    portal never changes them; only missing or current periods are fetched.
+    """
+
+    def __init__(self, ttl=None, immutable_until=None):
+        self.ttl = ttl if ttl is not None else int(os.getenv('SCRAPE_CACHE_TTL_SECONDS', '86400'))
+        self.immutable_until = immutable_until or int(os.getenv('SCRAPE_CACHE_IMMUTABLE_UNTIL', '2020'))
+        self._stats = {
+            'hits': 0,
+            'partial_hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'periods_reused': 0,
+            'periods_scraped': 0,
+        }
+
+    def lookup(self, property_data):
+        """
+        Return {'rtc_data', 'documents', 'fresh'} for the property, where
+        `documents` maps period value to the latest stored RTCDocument.
+        """
+        rtc_data = RTCData.objects.filter(property_key=make_property_key(property_data)).first()
+        if rtc_data is None:
+            return {'rtc_data': None, 'documents': {}, 'fresh': False}
+
+        documents = {}
+        for doc in rtc_data.documents.order_by('created_at'):
+            documents[doc.period] = doc
+        return {
+            'rtc_data': rtc_data,
+            'documents': documents,
+            'fresh': self._is_fresh(rtc_data) and bool(documents),
+        }
+
+    def _is_fresh(self, rtc_data):
+        scraped_at = parse_datetime(rtc_data.data.get('scraped_at', '')) if rtc_data.data else None
+        if scraped_at is None:
+            return False
+        return timezone.now() - scraped_at < timedelta(seconds=self.ttl)
+
+    def is_immutable(self, doc):
+        """
+        True if the document belongs to a historical period that never changes.
+        Its screenshot must have a content-addressed key: that blob was written
+        before the document and is never removed, so the store isn't asked.
+        Documents with older screenshot paths are scraped again once.
+        """
+        match = re.match(r'(\d{4})', doc.year_text or '')
+        if not match:
+            return False
+        if not get_screenshot_storage().is_content_key(doc.screenshot_path):
+            return False
+        return int(match.group(1)) <= self.immutable_until
+
+    def reusable_documents(self, entry):
+        """Stored documents that can be reused without scraping, keyed by period value."""
+        return {
+            period: doc for period, doc in entry['documents'].items()
+            if self.is_immutable(doc)
+        }
+
+    def mark_scraped(self, rtc_data, scraped_documents):
+        """Record a completed scrape and drop documents superseded by the new RTCDocuments."""
+        RTCDocument.objects.filter(
+            rtc_data=rtc_data,
+            period__in=[doc.period for doc in scraped_documents],
+        ).exclude(id__in=[doc.id for doc in scraped_documents]).delete()
+        rtc_data.data = {**(rtc_data.data or {}), 'scraped_at': timezone.now().isoformat()}
+        rtc_data.save(update_fields=['data'])
+
+    def record(self, outcome, reused=0, scraped=0):
+        """Count a lookup outcome: 'hits', 'partial_hits', 'misses' or 'refreshes'."""
+        self._stats[outcome] += 1
+        self._stats['periods_reused'] += reused
+        self._stats['periods_scraped'] += scraped
+        logger.info(f"Scrape cache {outcome}: reused {reused} periods, scraped {scraped}")
+
+    def stats(self):
+        """Counters plus property and period hit rates."""
+        lookups = self._stats['hits'] + self._stats['partial_hits'] + self._stats['misses'] + self._stats['refreshes']
+        periods = self._stats['periods_reused'] + self._stats['periods_scraped']
+        return {
+            **self._stats,
+            'hit_rate': self._stats['hits'] / lookups if lookups else 0.0,
+            'miss_rate': (self._stats['misses'] + self._stats['refreshes']) / lookups if lookups else 0.0,
+            'period_hit_rate': self._stats['periods_reused'] / periods if periods else 0.0,
+        }
+
+
+_cache = None
+
+
+def get_scrape_cache():
+    """Return the process-wide scrape cache."""
+    global _cache
+    if _cache is None:
+        _cache = ScrapeCache()
+        get_metrics().register_stats('scrape_cache', _cache.stats)
+    return _cache
@@ -0,0 +1,162 @@
+import logging
+import os
+import re
+import threading
+from metrics import get_metrics
+
+logger = logging.getLogger('ScrapePlanner')
+
+
+def period_year(period_text):
+    """The year range a period covers as 'YYYY-YYYY', from text like '01/04/2012 - 31/03/2013 (2012-13 )', or None."""
+    # The year pattern in parentheses, as 2012-2013 or 2012-13
+    match = re.search(r'\((\d{4}-\d{4}|\d{4}-\d{2})\s*\)', period_text)
+    if not match:
+        return None
+    year = match.group(1)
+    if len(year) < 9:
+        # '1999-00' ends in 2000: the end year is the next one, whatever its century
+        first = int(year[:4])
+        return f"{first}-{first + 1}"
+    return year
+
+
+def start_year(year_text):
+    """The first year of '2012-2013' or '2012-13', or None."""
+    match = re.match(r'\s*(\d{4})', year_text or '')
+    return int(match.group(1)) if match else None
+
+
+class ScrapePlan:
+    """
+    What one scrape does with the periods the portal offers, decided from the
+    period dropdown alone: the (index, period_option, target_year) periods to
+    `fetch`, stored documents `reused`, documents `resumed` from checkpoints,
+    and the periods left out because they are out of range or have no year.
+    """
+
+    def __init__(self, period_options):
+        self.period_options = period_options
+        self.fetch = []
+        self.reused = []
+        self.resumed = {}
+        self.out_of_range = []
+        self.no_year = []
+
+    def resume(self, documents):
+        """Take periods whose documents were captured by an earlier attempt off the fetch list."""
+        self.resumed = documents
+        self.fetch = [target for target in self.fetch if target[1]['value'] not in documents]
+
+    def report(self):
+        """
+        Plan size against the naive loop, which selects every period the
+        portal offers and reads its years before deciding to skip it.
+        """
+        return {
+            'periods_offered': len(self.period_options),
+            'naive_fetches': len(self.period_options),
+            'planned_fetches': len(self.fetch),
+            'out_of_range': len(self.out_of_range),
+            'no_year': len(self.no_year),
+            'reused': len(self.reused),
+            'resumed': len(self.resumed),
+        }
+
+
+class ScrapePlanner:
+    """
+    Plans a scrape before any period is selected. The periods in the year
+    range (by start year, `year_from` to `year_to` inclusive) are read off the
+    period dropdown's text; of those, the ones already stored and reusable
+    are subtracted, so only the rest is ever selected on the portal.
+    """
+
+    def __init__(self, year_from=None, year_to=None):
+        self.year_from = year_from or int(os.getenv('SCRAPE_YEAR_FROM', '2012'))
+        self.year_to = year_to or int(os.getenv('SCRAPE_YEAR_TO', '2020'))
+        if self.year_from > self.year_to:
+            raise ValueError(f"SCRAPE_YEAR_FROM ({self.year_from}) is after SCRAPE_YEAR_TO ({self.year_to})")
+        self._lock = threading.Lock()
+        self._stats = {
+            'plans_total': 0,
+            'naive_fetches_total': 0,
+            'planned_fetches_total': 0,
+            'out_of_range_total': 0,
+            'reused_total': 0,
+            'resumed_total': 0,
+        }
+
+    def in_range(self, year_text):
+        year = start_year(year_text)
+        return year is not None and self.year_from <= year <= self.year_to
+
+    def plan(self, period_options, reusable):
+        """Plan the scrape of `period_options`; `reusable` maps period values to stored documents needing no scrape."""
+        plan = ScrapePlan(period_options)
+        for index, period_option in enumerate(period_options):
+            target_year = period_year(period_option['text'])
+            if not target_year:
+                logger.info(f"Could not extract year from period: {period_option['text']}, skipping")
+                plan.no_year.append(period_option)
+            elif not self.in_range(target_year):
+                plan.out_of_range.append(period_option)
+            elif period_option['value'] in reusable:
+                plan.reused.append(reusable[period_option['value']])
+            else:
+                plan.fetch.append((index, period_option, target_year))
+        return plan
+
+    def record(self, plan):
+        """Count a plan once it is final."""
+        report = plan.report()
+        with self._lock:
+            self._stats['plans_total'] += 1
+            for key in ('naive_fetches', 'planned_fetches', 'out_of_range', 'reused', 'resumed'):
+                self._stats[f"{key}_total"] += report[key]
+        logger.info(
+            f"Scrape plan: {report['planned_fetches']} of {report['periods_offered']} periods to fetch "
+            f"({report['out_of_range']} out of {self.year_from}-{self.year_to}, {report['no_year']} without a year, "
+            f"{report['reused']} stored, {report['resumed']} resumed)"
+        )
+
+    def choose_year(self, year_options, period_text, target_year):
+        """
+        The year option for a period: the one matching its year range, else
+        one starting the same year. None if neither is offered, rather than
+        capturing another year's document under this period.
+        """
+        logger.info(f"Available years for period {period_text}: {year_options}")
+        if not year_options:
+            logger.warning(f"No year options found for period {period_text}")
+            return None
+
+        matching_year = next((year for year in year_options if year['text'] == target_year), None)
+        if matching_year:
+            return matching_year
+        matching_year = next(
+            (year for year in year_options if start_year(year['text']) == start_year(target_year)), None
+        )
+        if not matching_year:
+            logger.warning(f"No year matching {target_year} offered for period {period_text}")
+        return matching_year
+
+    def stats(self):
+        """Plans made, and periods fetched, skipped and reused against the naive loop."""
+        with self._lock:
+            stats = dict(self._stats)
+        naive = stats['naive_fetches_total']
+        stats['fetch_ratio'] = stats['planned_fetches_total'] / naive if naive else 0.0
+        return stats
+
+
+_planner = None
+
+
+def get_scrape_planner():
+    """Return the process-wide scrape planner."""
+    global _planner
+    if _planner is None:
+        _planner = ScrapePlanner()
+        get_metrics().register_stats('scrape_planner', _planner.stats)
+    return _planner
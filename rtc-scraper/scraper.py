@@ -1,15 +1,28 @@
-from playwright.async_api import async_playwright, expect
+from playwright.async_api import expect
 import time
 import os
-import re
 import logging
 from datetime import datetime
 from db_handler import DBHandler
 from dotenv import load_dotenv
 import traceback
 import asyncio
-from api.models import RTCData, RTCDocument
+import base64
 from asgiref.sync import sync_to_async
+from django.urls import reverse
+from browser_pool import get_browser_pool
+from async_runtime import run_coroutine
+from wait_strategies import SKETCH_SELECTOR, PortalWaits, PostbackError, StepTimer, get_step_timer
+from scrape_cache import get_scrape_cache, document_to_dict
+from location_resolver import LEVELS, get_location_resolver, match_option
+from screenshot_storage import get_screenshot_storage
+from persistence import persist_scrape
+from checkpoints import get_scrape_checkpoints
+from scrape_planner import get_scrape_planner
+from route_filter import get_route_filter
+from portal_http import PortalHTTPClient
+from village_sessions import SNAPSHOT_JS, VillageSession, get_village_sessions
+from metrics import traced
 
 # Configure logging
 logging.basicConfig(
@@ -18,282 +31,784 @@ logging.basicConfig(
 )
 logger = logging.getLogger('RTCScraper')
 
+# RTC_PORTAL_URL points the scraper at another deployment, e.g. the local mock_portal
+PORTAL_URL = os.getenv('RTC_PORTAL_URL', "https://landrecords.karnataka.gov.in/Service2/")
+
+# Options of a <select> as [{'value', 'text'}], without the "Select" placeholder
+OPTIONS_JS = """select => {
+    return Array.from(select.options).map(option => ({
+        value: option.value,
+        text: option.text
+    })).filter(option => option.value !== '0');
+}"""
+
+CAPTURE_MODES = ('resource', 'element', 'page')
+
+# 'browser' drives the whole flow in Playwright; 'http' posts the form cascade directly
+ENGINES = ('browser', 'http')
+
+# Location dropdown for each gazetteer level, and the dropdown its postback fills
+LOCATION_DROPDOWNS = {
+    'district': ("#ctl00_MainContent_ddlODist", "#ctl00_MainContent_ddlOTaluk"),
+    'taluk': ("#ctl00_MainContent_ddlOTaluk", "#ctl00_MainContent_ddlOHobli"),
+    'hobli': ("#ctl00_MainContent_ddlOHobli", "#ctl00_MainContent_ddlOVillage"),
+    'village': ("#ctl00_MainContent_ddlOVillage", None),
+}
+
+def document_event(doc, cached=False):
+    """Progress payload for a stored document, as the gallery renders it."""
+    return {
+        'document_id': doc['id'],
+        'period_text': doc['period_text'],
+        'year_text': doc['year_text'],
+        'name': os.path.basename(doc['screenshot_path']),
+        'url': doc['screenshot_url'],
+        'download_url': reverse('document_screenshot', args=[doc['id']]),
+        'cached': cached,
+    }
+
 class RTCScraper:
-    def __init__(self, db_handler=None):
-        self.base_url = "https://landrecords.karnataka.gov.in/Service2/"
+    def __init__(self, db_handler=None, browser_pool=None, period_concurrency=None, cache=None, resolver=None,
+                 storage=None, capture_mode=None, route_filter=None, base_url=None, engine=None, village_sessions=None,
+                 checkpoints=None, planner=None):
+        self.base_url = base_url or os.getenv('RTC_PORTAL_URL', PORTAL_URL)
         self.db_handler = db_handler or DBHandler()  # Initialize DBHandler if not provided
-        self.screenshots_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media', 'screenshots')
-        os.makedirs(self.screenshots_dir, exist_ok=True)
+        self.browser_pool = browser_pool or get_browser_pool()
+        # Number of pages that scrape periods in parallel; 1 keeps the serial flow
+        self.period_concurrency = period_concurrency or int(os.getenv('SCRAPER_PERIOD_CONCURRENCY', '1'))
+        self.cache = cache or get_scrape_cache()
+        self.resolver = resolver or get_location_resolver()
+        self.storage = storage or get_screenshot_storage()
+        # 'resource' takes the sketch image off the network, 'element' clips to it, 'page' shoots the viewport
+        self.capture_mode = capture_mode or os.getenv('SCREENSHOT_CAPTURE_MODE', 'resource')
+        if self.capture_mode not in CAPTURE_MODES:
+            raise ValueError(f"Unknown SCREENSHOT_CAPTURE_MODE: {self.capture_mode}")
+        self.route_filter = route_filter or get_route_filter()
+        self.engine = engine or os.getenv('SCRAPER_ENGINE', 'browser')
+        if self.engine not in ENGINES:
+            raise ValueError(f"Unknown SCRAPER_ENGINE: {self.engine}")
+        self.village_sessions = village_sessions or get_village_sessions()
+        self.checkpoints = checkpoints or get_scrape_checkpoints()
+        self.planner = planner or get_scrape_planner()
+
+    async def _new_page(self, context, tally):
+        """Open a search page with the heavy assets it doesn't need blocked."""
+        page = await context.new_page()
+        await self.route_filter.install(page, tally)
+        return page
+
+    async def _emit(self, progress, event, **data):
+        """Report a progress event; a failing callback never fails the scrape."""
+        if progress is None:
+            return
+        try:
+            await sync_to_async(progress)(event, **data)
+        except Exception as e:
+            logger.warning(f"Progress callback failed for {event}: {str(e)}")
+
+    async def _report_period(self, progress, period_option, doc):
+        """Report a scraped period as captured, or as skipped if nothing came back."""
+        if doc is None:
+            await self._emit(progress, 'period_skipped', period_text=period_option['text'], reason='unavailable')
+            return
+        await self._emit(
+            progress,
+            'period_captured',
+            period_text=doc['period_text'],
+            year_text=doc['year_text'],
+            url=self.storage.url(doc['screenshot_path']),
+            capture_mode=doc['capture_mode'],
+            screenshot_bytes=doc['screenshot_bytes'],
+        )
+
+    async def _run_period(self, progress, property_data, period_option, target_year, scrape):
+        """
+        Scrape one period with `scrape()` and checkpoint the outcome: the
+        captured document, nothing when the portal has no document for the
+        period, or a failure to retry later. Returns the document or None.
+        """
+        try:
+            doc = await scrape()
+        except Exception as e:
+            await sync_to_async(self.checkpoints.failed)(property_data, period_option, target_year, e)
+            await self._emit(progress, 'period_skipped', period_text=period_option['text'], reason='failed')
+            return None
+        if doc is None:
+            await sync_to_async(self.checkpoints.unavailable)(property_data, period_option, target_year)
+        else:
+            await sync_to_async(self.checkpoints.captured)(property_data, period_option, target_year, doc)
+        await self._report_period(progress, period_option, doc)
+        return doc
+        
+    def _require(self, done, step):
+        """Raise unless the postback for `step` completed; the page it left can't be trusted."""
+        if not done:
+            raise PostbackError(f"The {step} postback did not complete")
+
+    async def _read_options(self, page, selector):
+        """Return the non-placeholder options of a dropdown as [{'value', 'text'}]"""
+        dropdown = page.locator(selector)
+        await dropdown.wait_for(state="visible")
+        return await dropdown.evaluate(OPTIONS_JS)
+
+    async def _choose_location(self, options, property_data, codes, parent_codes, key):
+        """
+        Pick the code for one location level, preferring the gazetteer code. The
+        options are already in the page, so checking the code against them costs
+        no round trip; a missing or stale code falls back to fuzzy matching the
+        live options, which are recorded in the gazetteer for next time.
+        The codes of every deeper level are then dropped too: they were looked
+        up under the old parent, and since small codes repeat across parents
+        one could still be offered and silently select the wrong place.
+        """
+        code = codes.get(key)
+        if code is None or not any(option['value'] == code for option in options):
+            await sync_to_async(self.resolver.record)(parent_codes, options)
+            option = match_option(options, property_data.get(key))
+            if option is None:
+                raise ValueError(f"No {key} matching '{property_data.get(key)}' on the portal")
+            logger.info(f"Matched {key} '{property_data.get(key)}' to '{option['text']}' ({option['value']}) live")
+            code = codes[key] = option['value']
+            keys = [level_key for _, level_key in LEVELS]
+            for deeper in keys[keys.index(key) + 1:]:
+                codes[deeper] = None
+        return code
+
+    async def _select_location(self, page, waits, property_data, codes, parent_codes, key):
+        """Select one location level from the gazetteer code or the live options."""
+        selector, dependent = LOCATION_DROPDOWNS[key]
+        options = await self._read_options(page, selector)
+        code = await self._choose_location(options, property_data, codes, parent_codes, key)
+        self._require(await waits.select(selector, code, dependent=dependent, step=key), key)
+        parent_codes.append(code)
+
+    def _choose_surnoc(self, surnoc_options, property_data):
+        """The Surnoc value to select, "*" when the extracted one isn't offered."""
+        return next((option['value'] for option in surnoc_options if option['text'] == property_data.get('surnoc')), '*')
+
+    def _choose_hissa(self, hissa_options, property_data):
+        """The Hissa option to select; raises if the portal doesn't offer it."""
+        hissa = next((option for option in hissa_options if option['text'].strip() == str(property_data['hissa']).strip()), None)
+        if hissa is None:
+            raise ValueError(f"Hissa '{property_data['hissa']}' not offered for survey {property_data['survey_number']}: "
+                             f"{[option['text'] for option in hissa_options]}")
+        return hissa
+
+    async def _resume_or_navigate(self, codes, resume, to_village, park, from_survey):
+        """
+        Get to the period selection, resuming from the village's parked session
+        when there is one. Otherwise walk the cascade `to_village`, park the
+        page there for the next property in the village, and go on `from_survey`.
+        A parked session that fails to resume has most likely expired, so it is
+        dropped and the cascade walked from the start.
+        """
+        key = self.village_sessions.key(self.base_url, codes)
+        session = self.village_sessions.get(key) if all(key[1:]) else None
+        if session is not None:
+            try:
+                await resume(session)
+                await from_survey()
+                self.village_sessions.touch(key, session)
+                return
+            except ValueError:
+                # The portal answered, it just doesn't offer this property
+                self.village_sessions.touch(key, session)
+                raise
+            except Exception as e:
+                logger.info(f"Parked session for village code {codes['village']} did not resume ({str(e)}), navigating from the start")
+                self.village_sessions.invalidate(key, session)
+        
+        await to_village()
+        if self.village_sessions.enabled:
+            try:
+                self.village_sessions.store(self.village_sessions.key(self.base_url, codes), await park())
+            except Exception as e:
+                logger.warning(f"Could not park the session for village code {codes['village']}: {str(e)}")
+        await from_survey()
+
+    @traced('scrape.navigate')
+    async def _navigate_to_periods(self, page, waits, timer, property_data, codes):
+        """
+        Load the portal and walk the dropdown cascade up to the period selection.
+        `codes` holds the gazetteer codes per location level and is filled in
+        with any codes that had to be matched live.
+        """
+        async def resume(session):
+            await self._resume_village(page, timer, session)
+        
+        async def park():
+            return VillageSession(page.url, await page.evaluate(SNAPSHOT_JS), await page.context.cookies(page.url))
+        
+        await self._resume_or_navigate(
+            codes,
+            resume,
+            lambda: self._navigate_to_village(page, waits, timer, property_data, codes),
+            park,
+            lambda: self._navigate_from_survey(page, waits, property_data),
+        )
+
+    async def _resume_village(self, page, timer, session):
+        """Load a parked page, with its server session's cookies, instead of fetching the portal."""
+        with timer.step('resume'):
+            await page.context.add_cookies(session.cookies)
+            
+            async def serve(route):
+                await route.fulfill(status=200, content_type='text/html; charset=utf-8', body=session.html)
+            
+            await page.route(lambda url: url == session.url, serve, times=1)
+            await page.goto(session.url, wait_until='load')
+            await page.get_by_placeholder("Survey Number").wait_for(state="visible")
+
+    async def _navigate_to_village(self, page, waits, timer, property_data, codes):
+        """Load the portal and select the district, taluk, hobli and village."""
+        # Navigate to the website and wait for it to load
+        with timer.step('goto'):
+            async with waits.governor.request(self.base_url):
+                await page.goto(self.base_url, wait_until='networkidle')
+        
+        # Click on "Old Year" button
+        old_year_button = page.get_by_role("button", name="Old Year")
+        self._require(await waits.click(old_year_button, dependent="#ctl00_MainContent_ddlODist", step='old_year'), 'old_year')
+        
+        # Select District, Taluk, Hobli and Village
+        parent_codes = []
+        for _, key in LEVELS:
+            await self._select_location(page, waits, property_data, codes, parent_codes, key)
+
+    async def _navigate_from_survey(self, page, waits, property_data):
+        """From the selected village, enter the survey number and select its Surnoc and Hissa."""
+        # Enter Survey Number
+        survey_input = page.get_by_placeholder("Survey Number")
+        await survey_input.wait_for(state="visible")
+        await waits.pace()
+        await survey_input.fill(str(property_data['survey_number']))
+        
+        # Click Go button; the portal sometimes ignores the first click,
+        # so click again only if the Surnoc dropdown did not fill in
+        go_button = page.get_by_role("button", name="Go")
+        if not await waits.click(go_button, dependent="#ctl00_MainContent_ddlOSurnocNo", step='go'):
+            self._require(await waits.click(go_button, dependent="#ctl00_MainContent_ddlOSurnocNo", step='go_retry'), 'go')
+        
+        # Select Surnoc, falling back to "*" when the extracted one isn't offered
+        surnoc_options = await self._read_options(page, "#ctl00_MainContent_ddlOSurnocNo")
+        surnoc = self._choose_surnoc(surnoc_options, property_data)
+        self._require(
+            await waits.select("#ctl00_MainContent_ddlOSurnocNo", surnoc, dependent="#ctl00_MainContent_ddlOHissaNo", step='surnoc'),
+            'surnoc',
+        )
+        
+        # Select Hissa
+        hissa_options = await self._read_options(page, "#ctl00_MainContent_ddlOHissaNo")
+        hissa = self._choose_hissa(hissa_options, property_data)
+        self._require(
+            await waits.select("#ctl00_MainContent_ddlOHissaNo", hissa['value'], dependent="#ctl00_MainContent_ddlOPeriod", step='hissa'),
+            'hissa',
+        )
+
+    def _image_collector(self, responses):
+        """A response listener that keeps image responses in `responses`, keyed by (page, url)."""
+        def collect(response):
+            if response.request.resource_type == 'image':
+                responses[(response.frame.page, response.url)] = response
+        return collect
+
+    async def _sketch_resource(self, popup_page, responses):
+        """
+        The sketch image exactly as the portal served it, or None if it can't be
+        recovered. Only responses to `popup_page` itself count: a session-backed
+        image URL can serve another popup's sketch to another page.
+        """
+        source = await popup_page.locator(SKETCH_SELECTOR).evaluate("img => img.currentSrc || img.src")
+        if not source:
+            return None
+        if source.startswith('data:'):
+            header, _, payload = source.partition(',')
+            return base64.b64decode(payload) if header.endswith(';base64') else None
+        response = responses.get((popup_page, source))
+        if response is None or not response.ok:
+            return None
+        return await response.body()
+
+    async def _capture_sketch(self, popup_page, responses):
+        """
+        Capture the loaded popup in the configured mode, degrading from the
+        network resource to an element clip to the full viewport.
+        Returns (image bytes, mode used).
+        """
+        modes = CAPTURE_MODES[CAPTURE_MODES.index(self.capture_mode):]
+        for mode in modes:
+            try:
+                if mode == 'resource':
+                    data = await self._sketch_resource(popup_page, responses)
+                elif mode == 'element':
+                    data = await popup_page.locator(SKETCH_SELECTOR).screenshot()
+                else:
+                    data = await popup_page.screenshot()
+                if data:
+                    return data, mode
+            except Exception as e:
+                if mode == 'page':
+                    raise
+                logger.warning(f"{mode} capture failed, falling back: {str(e)}")
+        return None, None
+
+    async def _store_document(self, timer, period_option, matching_year, screenshot, capture_mode, capture_ms):
+        """Store a captured sketch under its content hash and return the document to persist."""
+        with timer.step('store_screenshot'):
+            screenshot_key, screenshot_bytes = await asyncio.to_thread(self.storage.save, screenshot)
+        logger.info(
+            f"Screenshot for {period_option['text']} stored as {screenshot_key} "
+            f"({capture_mode} capture, {capture_ms} ms, {screenshot_bytes} bytes)"
+        )
+        
+        # Buffered; the whole scrape is written in one transaction at the end
+        return {
+            'period': period_option['value'],
+            'period_text': period_option['text'],
+            'year': matching_year['value'],
+            'year_text': matching_year['text'],
+            'screenshot_path': screenshot_key,
+            'capture_mode': capture_mode,
+            'capture_ms': capture_ms,
+            'screenshot_bytes': screenshot_bytes
+        }
+
+    @traced('scrape.period')
+    async def _scrape_period(self, page, waits, timer, period_option, target_year):
+        """
+        Select one period and its year, open the View popup and store the screenshot.
+        Returns the document to persist as a dict, or None if the portal has no
+        document for the period; raises if the period failed.
+        """
+        period_value = period_option['value']
+        period_text = period_option['text']
         
-    def _extract_year_from_period(self, period_text):
-        """Extract the year from period text"""
-        # First try to match the year pattern in parentheses
-        match = re.search(r'\((\d{4}-\d{4}|\d{4}-\d{2})\s*\)', period_text)
-        if match:
-            year = match.group(1)
-            # If it's in format 2020-21, convert to 2020-2021
-            if len(year) < 9:  # Less than YYYY-YYYY
-                start_year = year[:4]
-                end_year = start_year[:2] + year[-2:]
-                return f"{start_year}-{end_year}"
-            return year
-        return None
-
-    def _is_year_in_range(self, year_text):
-        """Check if the year is within 2012-13 to 2020-21 range"""
         try:
-            # Convert year text (e.g., "2012-2013") to start year
-            if not year_text:
-                return False
+            logger.info(f"Processing period: {period_text} ({target_year})")
+            
+            # Select the period
+            self._require(
+                await waits.select("#ctl00_MainContent_ddlOPeriod", period_value, dependent="#ctl00_MainContent_ddlOYear", step='period'),
+                'period',
+            )
+            
+            # Get available years for this period
+            year_options = await self._read_options(page, "#ctl00_MainContent_ddlOYear")
+            matching_year = self.planner.choose_year(year_options, period_text, target_year)
+            if not matching_year:
+                return None
+                
+            # Select the year
+            self._require(await waits.select("#ctl00_MainContent_ddlOYear", matching_year['value'], step='year'), 'year')
+            
+            # Click Fetch details
+            fetch_button = page.get_by_role("button", name="Fetch details")
+            self._require(await waits.click(fetch_button, step='fetch_details'), 'fetch_details')
+            
+            # Check if View button is available
+            view_button = page.get_by_role("button", name="View")
+            if not await view_button.is_visible():
+                logger.warning(f"View button not available for period {period_text}")
+                return None
                 
-            # Handle both formats: "2012-13" and "2012-2013"
-            parts = year_text.split('-')
-            if len(parts) != 2:
-                return False
+            # Click View and handle popup
+            try:
+                # Wait for the View button to be clickable
+                await view_button.wait_for(state="visible")
+                is_enabled = await view_button.is_enabled()
+                if not is_enabled:
+                    logger.warning("View button is not enabled, skipping.")
+                    return None
+                
+                # Keep the popup's image responses so the sketch can be taken straight off the network.
+                # The listener is on the context to catch the popup's first responses, so they are
+                # keyed by page: other pages of the context may be loading their own popups
+                responses = {}
+                collect = self._image_collector(responses)
+                popup_page = None
                 
-            # Get start year
-            start_year = int(parts[0])
-            return 2012 <= start_year <= 2020
-        except:
-            return False
+                # Click View and wait for popup with increased timeout
+                await waits.pace()
+                page.context.on('response', collect)
+                try:
+                    with timer.step('view_popup'):
+                        async with waits.governor.request(page.url):
+                            async with page.expect_popup(timeout=120000) as popup_info:  # Increased timeout to 2 minutes
+                                await view_button.click()
+                                
+                            popup_page = await popup_info.value
+                            
+                            # A full-page shot needs everything rendered; the other modes only need the sketch
+                            if self.capture_mode == 'page':
+                                await popup_page.wait_for_load_state("networkidle", timeout=120000)
+                    
+                    # Wait until the sketch image has actually decoded
+                    await waits.wait_for_sketch(popup_page)
+                    
+                    # Capture the screenshot with retry logic
+                    max_retries = 3
+                    for attempt in range(max_retries):
+                        try:
+                            started = time.monotonic()
+                            with timer.step('screenshot'):
+                                screenshot, capture_mode = await self._capture_sketch(popup_page, responses)
+                            capture_ms = int((time.monotonic() - started) * 1000)
+                            break
+                        except Exception as e:
+                            if attempt == max_retries - 1:
+                                raise
+                            logger.warning(f"Attempt {attempt + 1} failed to save screenshot, retrying...")
+                            await asyncio.sleep(1)  # Backoff before retrying, not pacing
+                finally:
+                    page.context.remove_listener('response', collect)
+                    # Close popup
+                    if popup_page is not None:
+                        await popup_page.close()
+                
+                if not screenshot:
+                    logger.warning(f"No sketch captured for period {period_text}")
+                    return None
+                return await self._store_document(timer, period_option, matching_year, screenshot, capture_mode, capture_ms)
+                
+            except Exception as e:
+                logger.error(f"Error handling popup for period {period_text}: {str(e)}")
+                raise
+                
+        except Exception as e:
+            logger.error(f"Error processing period {period_text}: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            raise
+
+    async def _scrape_periods_concurrently(self, context, page, waits, timer, targets, property_data, codes, progress=None,
+                                           tally=None):
+        """
+        Spread the target periods over up to `period_concurrency` pages of the same
+        browser context. Every extra page replays the dropdown cascade (sharing the
+        context's session cookies) and then pulls periods from a shared queue.
+        Documents are returned in portal period order.
+        """
+        queue = asyncio.Queue()
+        for target in targets:
+            queue.put_nowait(target)
+        results = {}
+
+        async def drain(worker_page, worker_waits):
+            while True:
+                try:
+                    index, period_option, target_year = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                doc = await self._run_period(
+                    progress, property_data, period_option, target_year,
+                    lambda: self._scrape_period(worker_page, worker_waits, timer, period_option, target_year),
+                )
+                if doc:
+                    results[index] = doc
+
+        async def extra_worker(worker_id):
+            worker_page = await self._new_page(context, tally if tally is not None else self.route_filter.new_tally())
+            try:
+                worker_waits = PortalWaits(worker_page, timer=timer)
+                await self._navigate_to_periods(worker_page, worker_waits, timer, property_data, codes)
+                if not queue.empty():
+                    await drain(worker_page, worker_waits)
+            except Exception as e:
+                # The remaining workers will pick up the periods this one would have taken
+                logger.error(f"Period worker {worker_id} failed: {str(e)}")
+            finally:
+                await worker_page.close()
+
+        workers = min(self.period_concurrency, len(targets))
+        logger.info(f"Scraping {len(targets)} periods across {workers} pages")
+        await asyncio.gather(
+            drain(page, waits),
+            *(extra_worker(worker_id) for worker_id in range(1, workers))
+        )
+        return [results[index] for index in sorted(results)]
+
+    async def _finish_scrape(self, property_data, rtc_data, reusable, period_options, scrape_targets, timer,
+                             force_refresh, progress):
+        """
+        Given the period options on the portal, plan the scrape, fetch the
+        planned periods with `scrape_targets(targets)`, persist them and return
+        the scrape result. Shared by both engines.
+        """
+        logger.info(f"Found {len(period_options)} periods: {period_options}")
+        
+        # Decided from the period texts alone: no period is selected unless it is fetched.
+        # Historical periods already stored never change, and periods an interrupted
+        # attempt captured are persisted now, so neither is fetched again
+        plan = self.planner.plan(period_options, reusable)
+        plan.resume(await sync_to_async(self.checkpoints.plan)(property_data, plan.fetch))
+        self.planner.record(plan)
+        reused = [document_to_dict(doc) for doc in plan.reused]
+        
+        await self._emit(
+            progress, 'periods_found',
+            count=len(period_options), targets=len(plan.fetch), reused=len(reused), resumed=len(plan.resumed),
+            plan=plan.report(),
+        )
+        for option in plan.out_of_range + plan.no_year:
+            await self._emit(progress, 'period_skipped', period_text=option['text'], reason='out_of_range')
+        for doc in reused:
+            await self._emit(progress, 'document_stored', **document_event(doc, cached=True))
+        
+        documents = list(plan.resumed.values()) + await scrape_targets(plan.fetch)
+        
+        def on_persisted(rtc_data, saved):
+            self.cache.mark_scraped(rtc_data, saved)
+            self.checkpoints.complete(property_data, saved)
+        
+        with timer.step('db_persist'):
+            rtc_data, saved = await sync_to_async(persist_scrape)(
+                property_data, rtc_data, documents, on_persisted=on_persisted
+            )
+        documents = [document_to_dict(doc) for doc in saved]
+        for doc in documents:
+            await self._emit(progress, 'document_stored', **document_event(doc))
+        
+        logger.info(f"Successfully processed {len(documents)} documents")
+        logger.info(f"Step timings: {timer.summary()}")
+        
+        if force_refresh:
+            self.cache.record('refreshes', scraped=len(documents))
+        else:
+            self.cache.record('partial_hits' if reused else 'misses', reused=len(reused), scraped=len(documents))
+        
+        # Merge cached and freshly scraped documents in portal period order
+        order = {option['value']: index for index, option in enumerate(period_options)}
+        return {
+            'record_id': rtc_data.id,
+            'documents': sorted(reused + documents, key=lambda doc: order.get(doc['period'], len(order))),
+        }
+
+    @traced('scrape.http.navigate')
+    async def _navigate_http(self, portal, timer, property_data, codes):
+        """The dropdown cascade up to the period selection, as direct postbacks."""
+        async def resume(session):
+            with timer.step('resume'):
+                portal.restore(session)
+        
+        async def park():
+            return portal.snapshot()
+        
+        await self._resume_or_navigate(
+            codes,
+            resume,
+            lambda: self._navigate_http_to_village(portal, timer, property_data, codes),
+            park,
+            lambda: self._navigate_http_from_survey(portal, property_data),
+        )
+
+    async def _navigate_http_to_village(self, portal, timer, property_data, codes):
+        with timer.step('goto'):
+            await portal.open()
+        await portal.click("Old Year", dependent="#ctl00_MainContent_ddlODist", step='old_year')
+        
+        parent_codes = []
+        for _, key in LEVELS:
+            selector, dependent = LOCATION_DROPDOWNS[key]
+            code = await self._choose_location(portal.read_options(selector), property_data, codes, parent_codes, key)
+            await portal.select(selector, code, dependent=dependent, step=key)
+            parent_codes.append(code)
+
+    async def _navigate_http_from_survey(self, portal, property_data):
+        portal.fill("Survey Number", str(property_data['survey_number']))
+        if not await portal.click("Go", dependent="#ctl00_MainContent_ddlOSurnocNo", step='go'):
+            await portal.click("Go", dependent="#ctl00_MainContent_ddlOSurnocNo", step='go_retry')
+        
+        surnoc = self._choose_surnoc(portal.read_options("#ctl00_MainContent_ddlOSurnocNo"), property_data)
+        await portal.select("#ctl00_MainContent_ddlOSurnocNo", surnoc, dependent="#ctl00_MainContent_ddlOHissaNo", step='surnoc')
+        hissa = self._choose_hissa(portal.read_options("#ctl00_MainContent_ddlOHissaNo"), property_data)
+        await portal.select("#ctl00_MainContent_ddlOHissaNo", hissa['value'], dependent="#ctl00_MainContent_ddlOPeriod", step='hissa')
+
+    async def _render_popup(self, portal, popup_url, timer):
+        """
+        Open the popup in a pooled browser context carrying the HTTP session's
+        cookies and capture the sketch. Returns (image bytes, mode used).
+        """
+        async with self.browser_pool.lease() as context:
+            await context.add_cookies(portal.cookies())
+            popup_page = await context.new_page()
+            responses = {}
+            popup_page.on('response', self._image_collector(responses))
+            try:
+                async with portal.governor.request(popup_url):
+                    await popup_page.goto(popup_url, wait_until='networkidle' if self.capture_mode == 'page' else 'load')
+                await PortalWaits(popup_page, timer=timer).wait_for_sketch(popup_page)
+                return await self._capture_sketch(popup_page, responses)
+            finally:
+                await popup_page.close()
+
+    @traced('scrape.http.period')
+    async def _scrape_period_http(self, portal, timer, period_option, target_year):
+        """
+        Select one period and its year with postbacks and fetch its sketch
+        straight from the popup's HTML, rendering the popup in a browser only
+        when the sketch can't be found that way.
+        Returns the document to persist as a dict, or None if the portal has no
+        document for the period; raises if the period failed.
+        """
+        period_text = period_option['text']
+        try:
+            logger.info(f"Processing period over HTTP: {period_text} ({target_year})")
+            await portal.select("#ctl00_MainContent_ddlOPeriod", period_option['value'], dependent="#ctl00_MainContent_ddlOYear", step='period')
+            matching_year = self.planner.choose_year(portal.read_options("#ctl00_MainContent_ddlOYear"), period_text, target_year)
+            if not matching_year:
+                return None
+            await portal.select("#ctl00_MainContent_ddlOYear", matching_year['value'], step='year')
+            await portal.click("Fetch details", step='fetch_details')
+            
+            if not portal.has_button("View"):
+                logger.warning(f"View button not available for period {period_text}")
+                return None
+            with timer.step('view_popup'):
+                popup_url = await portal.popup_url("View")
+            if popup_url is None:
+                logger.warning(f"View button for period {period_text} opened no popup")
+                return None
             
-    async def scrape_documents(self, property_data):
+            started = time.monotonic()
+            with timer.step('screenshot'):
+                screenshot, capture_mode = await portal.sketch(popup_url), 'resource'
+                if screenshot is None:
+                    logger.info(f"Sketch for {period_text} is not in the popup HTML, rendering it")
+                    screenshot, capture_mode = await self._render_popup(portal, popup_url, timer)
+            capture_ms = int((time.monotonic() - started) * 1000)
+            if not screenshot:
+                logger.warning(f"No sketch captured for period {period_text}")
+                return None
+            return await self._store_document(timer, period_option, matching_year, screenshot, capture_mode, capture_ms)
+            
+        except Exception as e:
+            logger.error(f"Error processing period {period_text} over HTTP: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            raise
+
+    async def _scrape_with_http(self, property_data, rtc_data, reusable, codes, timer, force_refresh, progress):
         """
-        Scrape RTC documents for all periods within the target year range (2012-13 to 2020-21)
+        Scrape with the HTTP engine. Every target period starts from its own
+        fork of the navigated form, up to `period_concurrency` at a time, so
+        periods need no browser pages and no replayed cascade.
         """
+        portal = PortalHTTPClient(self.base_url, timer=timer)
+        semaphore = asyncio.Semaphore(self.period_concurrency)
+        
+        async def scrape_targets(targets):
+            results = {}
+            
+            async def fetch(index, period_option, target_year):
+                async with semaphore:
+                    doc = await self._run_period(
+                        progress, property_data, period_option, target_year,
+                        lambda: self._scrape_period_http(portal.fork(), timer, period_option, target_year),
+                    )
+                if doc:
+                    results[index] = doc
+            
+            await asyncio.gather(*(fetch(*target) for target in targets))
+            return [results[index] for index in sorted(results)]
+        
         try:
-            # Create RTCData object for the property using sync_to_async
-            rtc_data = await sync_to_async(RTCData.objects.create)(
-                survey_number=property_data['survey_number'],
-                surnoc=property_data['surnoc'],
-                hissa=property_data['hissa'],
-                village=property_data['village'],
-                hobli=property_data['hobli'],
-                taluk=property_data['taluk'],
-                district=property_data['district'],
+            logger.info("Starting RTC document scraping over HTTP...")
+            await self._navigate_http(portal, timer, property_data, codes)
+            period_options = portal.read_options("#ctl00_MainContent_ddlOPeriod")
+            return await self._finish_scrape(
+                property_data, rtc_data, reusable, period_options, scrape_targets, timer, force_refresh, progress
             )
-            logger.info(f"Created RTCData with ID: {rtc_data.id}")
+        except Exception as e:
+            logger.error(f"Error during HTTP scraping: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return None
+        finally:
+            get_step_timer().merge(timer)
+
+    @traced('scrape')
+    async def scrape_documents(self, property_data, force_refresh=False, progress=None):
+        """
+        Scrape RTC documents for all periods within the target year range
+        (SCRAPE_YEAR_FROM to SCRAPE_YEAR_TO by start year, 2012-13 to 2020-21 by default).
+
+        A property scraped within the cache TTL is served from the database, and
+        stored documents for historical periods are reused instead of fetched
+        again. Pass `force_refresh=True` to bypass the cache and rescrape everything.
+        Periods are checkpointed as they are scraped, so scraping a property
+        again after failed periods or a crash only fetches what is missing.
+
+        `progress(event, **data)` is called (from a worker thread, so it may use
+        the ORM) as the scrape moves along: `periods_found`, then
+        `period_skipped` or `period_captured` for each period, and
+        `document_stored` for every document once it is in the database.
+
+        With the 'http' engine (SCRAPER_ENGINE) the form cascade is posted
+        directly and the sketch fetched without a browser where possible.
+
+        Must run on the shared background loop (see `async_runtime.run_coroutine`),
+        since the browser contexts are leased from the process-wide pool.
+
+        Returns {'record_id': RTCData id, 'documents': [document dicts]}, or None on failure.
+        """
+        try:
+            cached = await sync_to_async(self.cache.lookup)(property_data)
+            outstanding = set()
+            if cached['fresh'] and not force_refresh:
+                outstanding = await sync_to_async(self.checkpoints.outstanding)(property_data)
+            if cached['fresh'] and not force_refresh and not outstanding:
+                documents = [document_to_dict(doc) for doc in cached['documents'].values()]
+                self.cache.record('hits', reused=len(documents))
+                logger.info(f"Serving {len(documents)} cached documents for RTCData ID: {cached['rtc_data'].id}")
+                for doc in documents:
+                    await self._emit(progress, 'document_stored', **document_event(doc, cached=True))
+                return {'record_id': cached['rtc_data'].id, 'documents': documents}
+            if outstanding:
+                # A recent scrape left periods behind; everything else it stored is current
+                logger.info(f"Resuming {len(outstanding)} periods of RTCData ID: {cached['rtc_data'].id}")
+                reusable = {period: doc for period, doc in cached['documents'].items() if period not in outstanding}
+            else:
+                reusable = {} if force_refresh else await sync_to_async(self.cache.reusable_documents)(cached)
             
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(
-                    headless=True,  # Show the browser window
-                    slow_mo=500  # Add 500ms delay between actions
-                )
-                context = await browser.new_context(
-                    viewport={'width': 1920, 'height': 1080},  # Set viewport for better quality screenshots
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                )
-                page = await context.new_page()
+            # A new property's RTCData row is created together with its documents
+            rtc_data = cached['rtc_data']
+            if rtc_data is not None:
+                logger.info(f"Reusing RTCData with ID: {rtc_data.id}")
+            
+            # Resolve dropdown codes up front so navigation jumps straight to them
+            codes = await sync_to_async(self.resolver.resolve)(property_data)
+            
+            timer = StepTimer()
+            if self.engine == 'http':
+                return await self._scrape_with_http(property_data, rtc_data, reusable, codes, timer, force_refresh, progress)
+            
+            tally = self.route_filter.new_tally()
+            async with self.browser_pool.lease() as context:
+                page = await self._new_page(context, tally)
+                waits = PortalWaits(page, timer=timer)
+                
+                async def scrape_targets(targets):
+                    # Process each period
+                    if self.period_concurrency > 1 and len(targets) > 1:
+                        return await self._scrape_periods_concurrently(
+                            context, page, waits, timer, targets, property_data, codes, progress=progress, tally=tally
+                        )
+                    documents = []
+                    for index, period_option, target_year in targets:
+                        doc = await self._run_period(
+                            progress, property_data, period_option, target_year,
+                            lambda: self._scrape_period(page, waits, timer, period_option, target_year),
+                        )
+                        if doc:
+                            documents.append(doc)
+                    return documents
                 
                 try:
                     logger.info("Starting RTC document scraping with robust approach...")
-                    # Navigate to the website and wait for it to load
-                    await page.goto(self.base_url, wait_until='networkidle')
-                    await asyncio.sleep(2)  # Additional wait for page to stabilize
-                    
-                    # Click on "Old Year" button
-                    old_year_button = page.get_by_role("button", name="Old Year")
-                    await old_year_button.wait_for(state="visible")
-                    await old_year_button.click()
-                    await asyncio.sleep(1)
-                    
-                    # Select District (Bangalore Rural = "21")
-                    await page.locator("#ctl00_MainContent_ddlODist").select_option("21")
-                    await asyncio.sleep(1)
-                    
-                    # Select Taluk (Devenahalli = "3")
-                    await page.locator("#ctl00_MainContent_ddlOTaluk").select_option("3")
-                    await asyncio.sleep(1)
-                    
-                    # Select Hobli (Kasaba = "2")
-                    await page.locator("#ctl00_MainContent_ddlOHobli").select_option("2")
-                    await asyncio.sleep(1)
-                    
-                    # Select Village (Devanahalli = "27")
-                    await page.locator("#ctl00_MainContent_ddlOVillage").select_option("27")
-                    await asyncio.sleep(1)
-                    
-                    # Enter Survey Number
-                    survey_input = page.get_by_placeholder("Survey Number")
-                    await survey_input.wait_for(state="visible")
-                    await survey_input.fill("22")
-                    await asyncio.sleep(1)
-                    
-                    # Click Go button
-                    go_button = page.get_by_role("button", name="Go")
-                    await go_button.wait_for(state="visible")
-                    await go_button.click()
-                    await asyncio.sleep(2)
-                    
-                    # Click Go button again (as in your working script)
-                    await go_button.click()
-                    await asyncio.sleep(2)
-                    
-                    # Select Surnoc ("*")
-                    await page.locator("#ctl00_MainContent_ddlOSurnocNo").select_option("*")
-                    await asyncio.sleep(1)
-                    
-                    # Select Hissa ("53" as in your working script, not "1" from property_data)
-                    await page.locator("#ctl00_MainContent_ddlOHissaNo").select_option("53")
-                    await asyncio.sleep(1)
+                    await self._navigate_to_periods(page, waits, timer, property_data, codes)
                     
                     # Get all available periods
-                    period_dropdown = page.locator("#ctl00_MainContent_ddlOPeriod")
-                    await period_dropdown.wait_for(state="visible")
-                    period_options = await period_dropdown.evaluate("""select => {
-                        return Array.from(select.options).map(option => ({
-                            value: option.value,
-                            text: option.text
-                        })).filter(option => option.value !== '0');
-                    }""")
-                    
-                    logger.info(f"Found {len(period_options)} periods: {period_options}")
-                    
-                    # Process each period
-                    documents = []
-                    for period_option in period_options:
-                        period_value = period_option['value']
-                        period_text = period_option['text']
-                        
-                        try:
-                            # Extract year from period text
-                            target_year = self._extract_year_from_period(period_text)
-                            
-                            if not target_year:
-                                logger.info(f"Could not extract year from period: {period_text}, skipping")
-                                continue
-                                
-                            # Check if year is in our target range
-                            if not self._is_year_in_range(target_year):
-                                logger.info(f"Period {period_text} ({target_year}) is outside target range, skipping")
-                                continue
-                                
-                            logger.info(f"Processing period: {period_text} ({target_year})")
-                            
-                            # Select the period
-                            await page.locator("#ctl00_MainContent_ddlOPeriod").select_option(period_value)
-                            await asyncio.sleep(2)
-                            
-                            # Get available years for this period
-                            year_dropdown = page.locator("#ctl00_MainContent_ddlOYear")
-                            await year_dropdown.wait_for(state="visible")
-                            year_options = await year_dropdown.evaluate("""select => {
-                                return Array.from(select.options).map(option => ({
-                                    value: option.value,
-                                    text: option.text
-                                })).filter(option => option.value !== '0');
-                            }""")
-                            
-                            logger.info(f"Available years for period {period_text}: {year_options}")
-                            
-                            if not year_options:
-                                logger.warning(f"No year options found for period {period_text}")
-                                continue
-                                
-                            # Try to find the matching year option
-                            matching_year = next((year for year in year_options if year['text'] == target_year), None)
-                            
-                            # If no exact match, try a more flexible approach
-                            if not matching_year and year_options:
-                                logger.info(f"No exact match for year {target_year}, using first available year")
-                                matching_year = year_options[0]
-                                
-                            if not matching_year:
-                                logger.warning(f"Could not find matching year for period {period_text}")
-                                continue
-                                
-                            # Select the year
-                            await page.locator("#ctl00_MainContent_ddlOYear").select_option(matching_year['value'])
-                            await asyncio.sleep(2)
-                            
-                            # Click Fetch details
-                            fetch_button = page.get_by_role("button", name="Fetch details")
-                            await fetch_button.wait_for(state="visible")
-                            await fetch_button.click()
-                            await asyncio.sleep(2)
-                            
-                            # Check if View button is available
-                            view_button = page.get_by_role("button", name="View")
-                            if not await view_button.is_visible():
-                                logger.warning(f"View button not available for period {period_text}")
-                                continue
-                                
-                            # Click View and handle popup
-                            try:
-                                # Wait for the View button to be clickable
-                                await view_button.wait_for(state="visible")
-                                is_enabled = await view_button.is_enabled()
-                                if not is_enabled:
-                                    logger.warning("View button is not enabled, skipping.")
-                                    continue
-                                
-                                # Click View and wait for popup with increased timeout
-                                async with page.expect_popup(timeout=120000) as popup_info:  # Increased timeout to 2 minutes
-                                    await view_button.click()
-                                    
-                                popup_page = await popup_info.value
-                                
-                                # Wait for popup content and image to load with increased timeout
-                                await popup_page.wait_for_load_state("networkidle", timeout=120000)
-                                await popup_page.wait_for_selector("#ImgSketchPage", timeout=120000)
-                                
-                                # Additional wait for image to render completely
-                                await asyncio.sleep(5)  # Increased wait time
-                                
-                                # Generate a clean filename
-                                clean_period = re.sub(r'[\w\-]', '_', period_text)
-                                screenshot_filename = f"RTC_{clean_period}_{matching_year['text']}.png"
-                                screenshot_path = os.path.join(self.screenshots_dir, screenshot_filename)
-                                
-                                # Save the screenshot locally with retry logic
-                                max_retries = 3
-                                for attempt in range(max_retries):
-                                    try:
-                                        await popup_page.screenshot(path=screenshot_path)
-                                        logger.info(f"Screenshot saved locally at: {screenshot_path}")
-                                        break
-                                    except Exception as e:
-                                        if attempt == max_retries - 1:
-                                            raise
-                                        logger.warning(f"Attempt {attempt + 1} failed to save screenshot, retrying...")
-                                        await asyncio.sleep(2)
-                                
-                                # Save this relative path in the DB for Django/Frontend
-                                relative_screenshot_path = os.path.join('screenshots', screenshot_filename)
-                                doc = await sync_to_async(RTCDocument.objects.create)(
-                                    rtc_data=rtc_data,
-                                    period=period_value,
-                                    period_text=period_text,
-                                    year=matching_year['value'],
-                                    year_text=matching_year['text'],
-                                    screenshot_path=relative_screenshot_path
-                                )
-                                logger.info(f"Inserted RTCDocument with ID: {doc.id}")
-                                documents.append({
-                                    'id': doc.id,
-                                    'period': doc.period,
-                                    'period_text': doc.period_text,
-                                    'year': doc.year,
-                                    'year_text': doc.year_text,
-                                    'screenshot_path': doc.screenshot_path
-                                })
-                                
-                                # Close popup
-                                await popup_page.close()
-                                await asyncio.sleep(2)  # Increased wait time after closing popup
-                                
-                            except Exception as e:
-                                logger.error(f"Error handling popup for period {period_text}: {str(e)}")
-                                logger.error(f"Traceback: {traceback.format_exc()}")
-                                continue
-                                
-                        except Exception as e:
-                            logger.error(f"Error processing period {period_text}: {str(e)}")
-                            logger.error(f"Traceback: {traceback.format_exc()}")
-                            continue
-                    
-                    logger.info(f"Successfully processed {len(documents)} documents")
-                    return documents
+                    period_options = await self._read_options(page, "#ctl00_MainContent_ddlOPeriod")
+                    return await self._finish_scrape(
+                        property_data, rtc_data, reusable, period_options, scrape_targets, timer, force_refresh, progress
+                    )
                     
                 except Exception as e:
                     logger.error(f"Error during scraping: {str(e)}")
@@ -301,13 +816,19 @@ class RTCScraper:
                     return None
                     
                 finally:
+                    get_step_timer().merge(timer)
+                    self.route_filter.merge(tally)
+                    if tally['blocked_requests']:
+                        logger.info(
+                            f"Route filter blocked {tally['blocked_requests']} requests "
+                            f"(~{tally['blocked_bytes']} bytes, {tally['blocked_unsized']} of unknown size)"
+                        )
                     if self.db_handler:
                         try:
                             self.db_handler.close()
                         except:
                             pass
-                    await context.close()
-                    await browser.close()
+                    await page.close()
 
         except Exception as e:
             logger.error(f"Error during scraping: {str(e)}")
@@ -325,7 +846,7 @@ if __name__ == "__main__":
     property_data = {
         'survey_number': '22',
         'surnoc': '*',
-        'hissa': '53',  # Changed from "1" to "53" to match working script
+        'hissa': '53',
         'village': 'Devanahalli',
         'hobli': 'Kasaba',
         'taluk': 'Devenahalli',
@@ -339,12 +860,10 @@ if __name__ == "__main__":
     scraper = RTCScraper(db_handler)
     
     # Scrape documents
-    documents = scraper.scrape_documents(property_data)
-    print(f"Documents captured: {len(documents) if documents else 0}")
+    result = run_coroutine(scraper.scrape_documents(property_data))
+    print(f"Documents captured: {len(result['documents']) if result else 0}")
     
-    if documents:
-        print("\nStored documents:")
-        # Retrieve documents from database to verify
-        stored_docs = db_handler.get_property_documents(1)  # Assuming first property
-        for doc in stored_docs:
+    if result:
+        print(f"\nStored documents for record {result['record_id']}:")
+        for doc in result['documents']:
             print(f"ID: {doc['id']}, Period: {doc['period_text']}, Year: {doc['year_text']}")
@@ -0,0 +1,232 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+from django.conf import settings
+from PIL import Image
+from metrics import get_metrics
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # Optional: only needed for SCREENSHOT_STORAGE=s3
+    boto3 = None
+
+logger = logging.getLogger('ScreenshotStorage')
+
+EXTENSIONS = {'WEBP': 'webp', 'PNG': 'png'}
+# Source formats a browser can display as-is, kept when re-encoding would not shrink them
+PASSTHROUGH_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+CONTENT_TYPES = {'webp': 'image/webp', 'png': 'image/png', 'jpg': 'image/jpeg', 'gif': 'image/gif'}
+
+
+class ScreenshotStorage:
+    """
+    Content-addressed store for rendered RTC pages.
+
+    A screenshot is keyed by the SHA-256 of the raw render, so an identical
+    page (the same period of the same property, or a shared "no records" page)
+    is stored once however many documents point at it. Renders are re-encoded
+    as WebP (lossless by default) or optimised PNG before they are written,
+    unless the source is already a smaller web image (e.g. a sketch JPEG
+    taken straight from the network). Subclasses provide the blob operations.
+    """
+
+    # Whether open() gives a seekable file the API can stream from
+    streamable = False
+
+    def __init__(self, output_format=None, lossless=None, quality=None, prefix='screenshots'):
+        self.output_format = (output_format or os.getenv('SCREENSHOT_FORMAT', 'WEBP')).upper()
+        if self.output_format not in EXTENSIONS:
+            raise ValueError(f"Unsupported screenshot format: {self.output_format}")
+        self.lossless = lossless if lossless is not None else os.getenv('SCREENSHOT_LOSSLESS', 'true').lower() in ('1', 'true', 'yes')
+        self.quality = quality or int(os.getenv('SCREENSHOT_QUALITY', '90'))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stats = {'saved': 0, 'deduplicated': 0, 'bytes_in': 0, 'bytes_stored': 0}
+
+    def key_for(self, data, extension=None):
+        digest = hashlib.sha256(data).hexdigest()
+        return f"{self.prefix}/{digest[:2]}/{digest}.{extension or EXTENSIONS[self.output_format]}"
+
+    def is_content_key(self, key):
+        """Whether `key` is one of this store's content-addressed keys; their blobs are never rewritten or removed."""
+        return bool(key) and re.fullmatch(rf"{re.escape(self.prefix)}/([0-9a-f]{{2}})/\1[0-9a-f]{{62}}\.\w+", key) is not None
+
+    def encode(self, image):
+        """Encode an opened image in the configured format."""
+        buffer = io.BytesIO()
+        if self.output_format == 'WEBP':
+            image.save(buffer, format='WEBP', lossless=self.lossless, quality=self.quality, method=6)
+        else:
+            image.save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue()
+
+    def save(self, data):
+        """
+        Store an image and return (key, stored bytes); identical images share one blob.
+        """
+        with Image.open(io.BytesIO(data)) as image:
+            source_extension = PASSTHROUGH_EXTENSIONS.get(image.format)
+            candidates = [self.key_for(data)]
+            if source_extension:
+                candidates.append(self.key_for(data, source_extension))
+            for key in candidates:
+                size = self.size(key)
+                if size is not None:
+                    with self._lock:
+                        self._stats['deduplicated'] += 1
+                    logger.info(f"Screenshot already stored as {key}")
+                    return key, size
+            encoded = self.encode(image)
+
+        key = candidates[0]
+        if source_extension and len(encoded) >= len(data):
+            key, encoded = candidates[-1], data
+        self._write(key, encoded)
+        with self._lock:
+            self._stats['saved'] += 1
+            self._stats['bytes_in'] += len(data)
+            self._stats['bytes_stored'] += len(encoded)
+        logger.info(f"Stored screenshot {key}: {len(data)} -> {len(encoded)} bytes")
+        return key, len(encoded)
+
+    def content_type(self, key):
+        return CONTENT_TYPES.get(key.rsplit('.', 1)[-1], 'application/octet-stream')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['compression_ratio'] = stats['bytes_stored'] / stats['bytes_in'] if stats['bytes_in'] else 0.0
+        return stats
+
+    def exists(self, key):
+        return bool(key) and self.size(key) is not None
+
+    def size(self, key):
+        """Stored size of the blob in bytes, or None if it doesn't exist."""
+        raise NotImplementedError
+
+    def read(self, key):
+        raise NotImplementedError
+
+    def open(self, key):
+        """A seekable binary file object for the blob; only for `streamable` backends."""
+        raise NotImplementedError
+
+    def url(self, key):
+        raise NotImplementedError
+
+    def _write(self, key, data):
+        raise NotImplementedError
+
+
+class LocalScreenshotStorage(ScreenshotStorage):
+    """Blobs under MEDIA_ROOT, served from MEDIA_URL."""
+
+    streamable = True
+
+    def __init__(self, root=None, base_url=None, **kwargs):
+        super().__init__(**kwargs)
+        self.root = root or settings.MEDIA_ROOT
+        self.base_url = base_url or settings.MEDIA_URL
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError:
+            return None
+
+    def read(self, key):
+        with open(self.path(key), 'rb') as blob:
+            return blob.read()
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def url(self, key):
+        if key.startswith(self.base_url):
+            return key
+        return f"{self.base_url}{key}"
+
+    def _write(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a concurrent reader never sees a partial blob
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as blob:
+                blob.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+
+class S3ScreenshotStorage(ScreenshotStorage):
+    """
+    Blobs in an S3 bucket; set SCREENSHOT_S3_ENDPOINT_URL to use an
+    S3-compatible server such as MinIO. URLs are presigned unless
+    SCREENSHOT_S3_PUBLIC_URL is set.
+    """
+
+    def __init__(self, bucket=None, endpoint_url=None, public_url=None, **kwargs):
+        if boto3 is None:
+            raise RuntimeError("SCREENSHOT_STORAGE=s3 requires boto3 (pip install boto3)")
+        super().__init__(**kwargs)
+        self.bucket = bucket or os.getenv('SCREENSHOT_S3_BUCKET', 'rtc-screenshots')
+        self.public_url = public_url or os.getenv('SCREENSHOT_S3_PUBLIC_URL')
+        self.url_expiry = int(os.getenv('SCREENSHOT_S3_URL_EXPIRY', '3600'))
+        self.client = boto3.client('s3', endpoint_url=endpoint_url or os.getenv('SCREENSHOT_S3_ENDPOINT_URL') or None)
+
+    def size(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def read(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def url(self, key):
+        if self.public_url:
+            return f"{self.public_url.rstrip('/')}/{key}"
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': key}, ExpiresIn=self.url_expiry
+        )
+
+    def _write(self, key, data):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=data,
+            ContentType=self.content_type(key),
+            # Content-addressed, so a key's bytes never change
+            CacheControl='public, max-age=31536000, immutable',
+        )
+
+
+_storage = None
+
+
+def get_screenshot_storage():
+    """Return the process-wide screenshot storage selected by SCREENSHOT_STORAGE (local or s3)."""
+    global _storage
+    if _storage is None:
+        backend = os.getenv('SCREENSHOT_STORAGE', 'local').lower()
+        if backend == 's3':
+            _storage = S3ScreenshotStorage()
+        elif backend == 'local':
+            _storage = LocalScreenshotStorage()
+        else:
+            raise ValueError(f"Unknown SCREENSHOT_STORAGE: {backend}")
+        get_metrics().register_stats('screenshot_storage', _storage.stats)
+    return _storage
@@ -0,0 +1,130 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from metrics import get_metrics
+
+logger = logging.getLogger('VillageSessions')
+
+# Copies the state the page's scripts hold in DOM properties (hidden fields
+# updated by async postbacks, selected options) into the markup before serializing
+SNAPSHOT_JS = """() => {
+    for (const input of document.querySelectorAll('input')) {
+        input.setAttribute('value', input.value);
+    }
+    for (const option of document.querySelectorAll('option')) {
+        option.toggleAttribute('selected', option.selected);
+    }
+    return '<!DOCTYPE html>' + document.documentElement.outerHTML;
+}"""
+
+
+class VillageSession:
+    """
+    The portal parked at the survey number step of one village: the page's
+    markup (with its __VIEWSTATE and __EVENTVALIDATION) and the cookies of
+    the server session it belongs to.
+    """
+
+    def __init__(self, url, html, cookies):
+        self.url = url
+        self.html = html
+        self.cookies = cookies
+        self.created = self.last_used = time.monotonic()
+
+
+class VillageSessionCache:
+    """
+    Navigated portal state per (district, taluk, hobli, village), so scrapes
+    of properties in a village already visited skip loading the page, "Old
+    Year" and the four location postbacks and resume at the survey number.
+
+    The server session expires after a stretch of inactivity, so a snapshot
+    not used for `ttl` seconds is dropped. A snapshot whose session expired
+    sooner is invalidated by the scraper when resuming from it fails. The
+    least recently used villages are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, enabled=None, ttl=None, max_entries=None):
+        self.enabled = (
+            enabled if enabled is not None
+            else os.getenv('SCRAPER_SESSION_REUSE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        )
+        # Below ASP.NET's default 20 minute session timeout
+        self.ttl = ttl if ttl is not None else float(os.getenv('SCRAPER_SESSION_TTL_SECONDS', '900'))
+        self.max_entries = max_entries or int(os.getenv('SCRAPER_SESSION_CACHE_SIZE', '256'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {
+            'hits_total': 0,
+            'misses_total': 0,
+            'stores_total': 0,
+            'expired_total': 0,
+            'invalidations_total': 0,
+            'evictions_total': 0,
+        }
+
+    @staticmethod
+    def key(base_url, codes):
+        """Cache key of the village `codes` (gazetteer codes per location level) is in."""
+        return (base_url, codes.get('district'), codes.get('taluk'), codes.get('hobli'), codes.get('village'))
+
+    def get(self, key):
+        """The live snapshot for the village, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            session = self._entries.get(key)
+            if session is not None and time.monotonic() - session.last_used > self.ttl:
+                del self._entries[key]
+                self._metrics['expired_total'] += 1
+                session = None
+            if session is None:
+                self._metrics['misses_total'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._metrics['hits_total'] += 1
+            return session
+
+    def touch(self, key, session):
+        """Record that the snapshot's server session was just used, which extends it."""
+        with self._lock:
+            if self._entries.get(key) is session:
+                session.last_used = time.monotonic()
+
+    def store(self, key, session):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = session
+            self._entries.move_to_end(key)
+            self._metrics['stores_total'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics['evictions_total'] += 1
+
+    def invalidate(self, key, session):
+        """Drop the snapshot, unless another scrape has already replaced it."""
+        with self._lock:
+            if self._entries.get(key) is session:
+                del self._entries[key]
+                self._metrics['invalidations_total'] += 1
+                logger.info(f"Dropped the parked session for village {key[1:]}")
+
+    def stats(self):
+        """Return the number of parked villages and hit, miss and invalidation counts."""
+        with self._lock:
+            return {'enabled': self.enabled, 'villages': len(self._entries), **self._metrics}
+
+
+_village_sessions = None
+
+
+def get_village_sessions():
+    """Return the process-wide village session cache."""
+    global _village_sessions
+    if _village_sessions is None:
+        _village_sessions = VillageSessionCache()
+        get_metrics().register_stats('village_sessions', _village_sessions.stats)
+    return _village_sessions
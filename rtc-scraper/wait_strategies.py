@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+from metrics import span
+from portal_governor import get_portal_governor
+
+logger = logging.getLogger('WaitStrategies')
+
+# Marks the document before an action. An async postback flags the mark
+# through the PageRequestManager's beginRequest and endRequest events; a
+# full-page postback flags it on unload and then replaces the document, and
+# the mark with it.
+ARM_POSTBACK_JS = """() => {
+    window.__rtcPostback = {started: false, done: false, error: null};
+    const prm = window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager
+        ? Sys.WebForms.PageRequestManager.getInstance() : null;
+    if (!window.__rtcPostbackHooked) {
+        window.addEventListener('beforeunload', () => { window.__rtcPostback.started = true; });
+        if (prm) {
+            prm.add_beginRequest(() => { window.__rtcPostback.started = true; });
+            prm.add_endRequest((sender, args) => {
+                const error = args && args.get_error ? args.get_error() : null;
+                window.__rtcPostback = {started: true, done: true, error: error ? String(error.message || error) : null};
+            });
+        }
+        window.__rtcPostbackHooked = true;
+    }
+}"""
+
+# Whether the action since the page was armed started a postback
+POSTBACK_STARTED_JS = """() => {
+    const postback = window.__rtcPostback;
+    if (!postback || postback.started) return true;
+    const prm = window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager
+        ? Sys.WebForms.PageRequestManager.getInstance() : null;
+    return !!(prm && prm.get_isInAsyncPostBack());
+}"""
+
+# {error} once the postback armed above has finished, else false
+POSTBACK_DONE_JS = """selector => {
+    const prm = window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager
+        ? Sys.WebForms.PageRequestManager.getInstance() : null;
+    if (prm && prm.get_isInAsyncPostBack()) return false;
+    if (document.readyState !== 'complete') return false;
+    const postback = window.__rtcPostback;
+    if (postback && !postback.done) return false;
+    if (selector && !document.querySelector(selector)) return false;
+    return {error: postback ? postback.error : null};
+}"""
+
+SKETCH_SELECTOR = "#ImgSketchPage"
+
+SKETCH_LOADED_JS = """selector => {
+    const img = document.querySelector(selector);
+    return !!img && img.complete && img.naturalWidth > 0;
+}"""
+
+
+class PostbackError(Exception):
+    """A postback the scrape depends on did not complete, so the page can't be read."""
+
+
+class StepTimer:
+    """Histogram of how long each named scrape step takes."""
+
+    BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+    def __init__(self):
+        self._steps = {}
+
+    def observe(self, step, seconds):
+        stats = self._steps.setdefault(step, {
+            'count': 0,
+            'sum': 0.0,
+            'max': 0.0,
+            'buckets': [0] * (len(self.BUCKETS) + 1),
+        })
+        stats['count'] += 1
+        stats['sum'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][i] += 1
+                break
+        else:
+            stats['buckets'][-1] += 1
+
+    @contextmanager
+    def step(self, name):
+        started = time.monotonic()
+        try:
+            # Also a span, so each portal step shows up in /metrics and exported traces
+            with span(f"scrape.step.{name}"):
+                yield
+        finally:
+            self.observe(name, time.monotonic() - started)
+
+    def merge(self, other):
+        for name, stats in other._steps.items():
+            target = self._steps.setdefault(name, {
+                'count': 0,
+                'sum': 0.0,
+                'max': 0.0,
+                'buckets': [0] * (len(self.BUCKETS) + 1),
+            })
+            target['count'] += stats['count']
+            target['sum'] += stats['sum']
+            target['max'] = max(target['max'], stats['max'])
+            target['buckets'] = [a + b for a, b in zip(target['buckets'], stats['buckets'])]
+
+    def summary(self):
+        """Return {step: {count, total, avg, max, buckets}} with bucket upper bounds as keys."""
+        labels = [str(bound) for bound in self.BUCKETS] + ['+Inf']
+        return {
+            name: {
+                'count': stats['count'],
+                'total': round(stats['sum'], 3),
+                'avg': round(stats['sum'] / stats['count'], 3) if stats['count'] else 0.0,
+                'max': round(stats['max'], 3),
+                'buckets': dict(zip(labels, stats['buckets'])),
+            }
+            for name, stats in self._steps.items()
+        }
+
+
+_step_timer = StepTimer()
+
+
+def get_step_timer():
+    """Return the process-wide step histogram that every scrape is merged into."""
+    return _step_timer
+
+
+class PortalWaits:
+    """
+    Event-driven waits for the ASP.NET WebForms portal.
+
+    Each action waits for the postback it triggers to finish, as reported by
+    the page's PageRequestManager or by the page being replaced. An optional
+    pacing floor keeps a minimum gap between actions for politeness, and every
+    postback takes a slot from the shared portal governor. A wait that runs out
+    only tells the governor the portal is slow; a postback the portal answers
+    with an error counts against its circuit.
+    """
+
+    def __init__(self, page, timer=None, pacing_floor=None, timeout=None, governor=None, start_timeout=None):
+        self.page = page
+        self.timer = timer or StepTimer()
+        self.governor = governor or get_portal_governor()
+        self.pacing_floor = (
+            pacing_floor if pacing_floor is not None
+            else float(os.getenv('SCRAPER_PACING_MS', '0')) / 1000
+        )
+        self.timeout = timeout or int(os.getenv('SCRAPER_WAIT_TIMEOUT_MS', '30000'))
+        # How long an action gets to start its postback before it is taken to have none
+        self.start_timeout = start_timeout or int(os.getenv('SCRAPER_POSTBACK_START_MS', '1000'))
+        self._last_action = None
+
+    async def pace(self):
+        """Sleep only as long as needed to honour the pacing floor."""
+        if self.pacing_floor and self._last_action is not None:
+            remaining = self.pacing_floor - (time.monotonic() - self._last_action)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        self._last_action = time.monotonic()
+
+    async def arm(self):
+        """Mark the page so the next postback's completion can be told apart from an idle page."""
+        await self.page.evaluate(ARM_POSTBACK_JS)
+
+    async def postback_started(self):
+        """
+        Whether the action since `arm()` started a postback. AutoPostBack
+        controls start theirs right away (at most a zero-delay timer later),
+        so one that hasn't started within `start_timeout` never will.
+        """
+        try:
+            await self.page.wait_for_function(POSTBACK_STARTED_JS, timeout=self.start_timeout)
+            return True
+        except PlaywrightTimeoutError:
+            return False
+        except PlaywrightError:
+            # The document was torn down mid-check by a full-page postback
+            return True
+
+    async def wait_for_postback(self, dependent=None, slot=None):
+        """
+        Wait until the armed postback has finished and, if given, the dependent
+        element is on the page. An action that started no postback has nothing
+        to wait for, so this only checks for the dependent element. Returns
+        False on timeout or a postback error, reporting either on `slot`.
+        """
+        try:
+            if not await self.postback_started():
+                return dependent is None or await self.page.locator(dependent).count() > 0
+            await self.page.wait_for_load_state('domcontentloaded', timeout=self.timeout)
+            result = await self.page.wait_for_function(POSTBACK_DONE_JS, arg=dependent, timeout=self.timeout)
+            error = (await result.json_value()).get('error')
+            if error:
+                logger.warning(f"Postback failed (dependent={dependent}): {error}")
+                if slot:
+                    slot.fail()
+                return False
+            if not dependent:
+                await self.page.wait_for_load_state('networkidle', timeout=self.timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"Timed out waiting for postback (dependent={dependent}): {str(e)}")
+            if slot:
+                slot.timeout()
+            return False
+
+    async def select(self, selector, value, dependent=None, step=None):
+        """Select an option and wait for the resulting postback."""
+        with self.timer.step(step or selector):
+            select = self.page.locator(selector)
+            if await select.input_value() == value:
+                # Re-selecting fires no change event, so there is no postback to wait for
+                return True
+            await self.pace()
+            async with self.governor.request(self.page.url) as slot:
+                await self.arm()
+                await select.select_option(value)
+                return await self.wait_for_postback(dependent, slot)
+
+    async def click(self, locator, dependent=None, step=None):
+        """Click a button and wait for the resulting postback."""
+        with self.timer.step(step or 'click'):
+            await locator.wait_for(state="visible", timeout=self.timeout)
+            await self.pace()
+            async with self.governor.request(self.page.url) as slot:
+                await self.arm()
+                await locator.click()
+                return await self.wait_for_postback(dependent, slot)
+
+    async def wait_for_sketch(self, popup_page, selector=SKETCH_SELECTOR, timeout=120000):
+        """Wait for the sketch image in the View popup to be fully decoded."""
+        with self.timer.step('popup_sketch'):
+            await popup_page.wait_for_selector(selector, timeout=timeout)
+            await popup_page.wait_for_function(SKETCH_LOADED_JS, arg=selector, timeout=timeout)